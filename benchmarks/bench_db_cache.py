@@ -0,0 +1,200 @@
+"""
+Micro-benchmarks for metric/db_cache.py.
+
+Run from the repository root:
+
+    python benchmarks/bench_db_cache.py [--lookups N]
+
+Each benchmark works on a throwaway database in a temp directory, so it never
+touches the real cache.db.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ralys_analytic"))
+
+from metric import db_cache  # noqa: E402
+
+TOKENS = ["Rayls (RLS)", "Ondo Finance", "Ondo Yield Assets", "Polygon", "Avalanche", "Chainlink"]
+
+SAMPLE_PAYLOAD = {
+    "totalHolders": 48211,
+    "holderChange": {k: {"change": 12, "changePercent": 0.03} for k in ("5min", "1h", "6h", "24h", "3d", "7d", "30d")},
+    "holderSupply": {k: {"supply": "123456789.12", "supplyPercent": 41.2} for k in ("top10", "top25", "top50", "top100", "top250", "top500")},
+    "holderDistribution": {k: 1000 for k in ("whales", "sharks", "dolphins", "fish", "octopus", "crabs", "shrimps")},
+    "holdersByAcquisition": {"swap": 20000, "transfer": 25000, "airdrop": 3211},
+}
+
+
+ANALYTICS_PAYLOAD = {
+    "tokenAddress": "0xb5f7b021a78f470d31d762c1dda05ea549904fbd",
+    **{
+        field: {window: round(1000 + i * 137.25, 4) for i, window in enumerate(("5m", "1h", "6h", "24h"))}
+        for field in (
+            "totalBuyVolume", "totalSellVolume", "totalBuyers", "totalSellers",
+            "totalBuys", "totalSells", "uniqueWallets", "pricePercentChange",
+        )
+    },
+    "usdPrice": "0.0123456789",
+    "totalLiquidityUsd": "1834221.1934",
+    "totalFullyDilutedValuation": "123456789.12",
+}
+
+
+def _etherscan_payload(n_transfers=2000, seed=42):
+    """A tokentx-style page: random hashes/addresses, realistic field layout."""
+    rng = random.Random(seed)
+    addresses = ["0x" + "".join(rng.choices("0123456789abcdef", k=40)) for _ in range(400)]
+    block = 21_000_000
+    result = []
+    for i in range(n_transfers):
+        block += rng.randint(0, 3)
+        result.append({
+            "blockNumber": str(block),
+            "timeStamp": str(1_760_000_000 + block * 12 % 10_000_000),
+            "hash": "0x" + "".join(rng.choices("0123456789abcdef", k=64)),
+            "nonce": str(rng.randint(0, 5000)),
+            "blockHash": "0x" + "".join(rng.choices("0123456789abcdef", k=64)),
+            "from": rng.choice(addresses),
+            "contractAddress": "0xb5f7b021a78f470d31d762c1dda05ea549904fbd",
+            "to": rng.choice(addresses),
+            "value": str(rng.randint(10 ** 15, 10 ** 24)),
+            "tokenName": "Rayls",
+            "tokenSymbol": "RLS",
+            "tokenDecimal": "18",
+            "transactionIndex": str(rng.randint(0, 300)),
+            "gas": str(rng.randint(50_000, 300_000)),
+            "gasPrice": str(rng.randint(10 ** 9, 10 ** 11)),
+            "gasUsed": str(rng.randint(30_000, 200_000)),
+            "cumulativeGasUsed": str(rng.randint(10 ** 6, 3 * 10 ** 7)),
+            "input": "deprecated",
+            "confirmations": str(rng.randint(1, 100_000)),
+        })
+    return {"status": "1", "message": "OK", "result": result}
+
+
+def _legacy_get_cached_data(db_path, data_type, token_name):
+    """The pre-pooling lookup: connect, set WAL, query, close."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=db_cache.CACHE_TTL_HOURS)).isoformat()
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    row = conn.execute(
+        "SELECT response_data, fetched_at FROM api_cache "
+        "WHERE data_type = ? AND token_name = ? AND fetched_at > ? LIMIT 1;",
+        (data_type, token_name, cutoff),
+    ).fetchone()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def _time_lookups(lookup, n):
+    start = time.perf_counter()
+    for i in range(n):
+        lookup("holders", TOKENS[i % len(TOKENS)])
+    return (time.perf_counter() - start) / n
+
+
+def _l2_only_lookup(data_type, token_name):
+    db_cache.clear_l1()
+    return db_cache.get_cached_data(data_type, token_name)
+
+
+def bench_lookup_latency(n):
+    # The legacy lookup only understands plain JSON rows
+    db_cache.CACHE_CODEC = db_cache.CODEC_JSON
+    with tempfile.TemporaryDirectory() as tmp:
+        db_cache._DB_PATH = os.path.join(tmp, "bench_cache.db")
+        db_cache.initialize_tables()
+        for token in TOKENS:
+            db_cache.update_cache("holders", token, "0x0", "eth", SAMPLE_PAYLOAD)
+
+        legacy = _time_lookups(lambda dt, tn: _legacy_get_cached_data(db_cache._DB_PATH, dt, tn), n)
+        pooled = _time_lookups(_l2_only_lookup, n)
+        in_memory = _time_lookups(db_cache.get_cached_data, n)
+        db_cache.close_connection()
+    db_cache.CACHE_CODEC = db_cache.CODEC_ZLIB_JSON
+
+    print(f"get_cached_data latency over {n} lookups")
+    print(f"  connect-per-call    : {legacy * 1e6:8.1f} us/lookup")
+    print(f"  pooled connection L2: {pooled * 1e6:8.1f} us/lookup ({legacy / pooled:.1f}x)")
+    print(f"  in-memory L1        : {in_memory * 1e6:8.1f} us/lookup ({legacy / in_memory:.1f}x)")
+
+
+def bench_bulk_lookup(token_counts=(6, 100, 500)):
+    print("Resolving every token of a data_type: per-key queries vs one get_many()")
+    for count in token_counts:
+        names = [f"token-{i}" for i in range(count)]
+        with tempfile.TemporaryDirectory() as tmp:
+            db_cache._DB_PATH = os.path.join(tmp, "bench_cache.db")
+            db_cache.initialize_tables()
+            db_cache.put_many("holders", [(name, "0x0", "eth", SAMPLE_PAYLOAD) for name in names])
+
+            db_cache.clear_l1()
+            start = time.perf_counter()
+            for name in names:
+                db_cache.get_cached_data("holders", name)
+            per_key = time.perf_counter() - start
+
+            db_cache.clear_l1()
+            start = time.perf_counter()
+            db_cache.get_many("holders", names)
+            bulk = time.perf_counter() - start
+            db_cache.close_connection()
+
+            print(f"  {count:4d} tokens: per-key {per_key * 1e3:7.2f} ms, get_many {bulk * 1e3:7.2f} ms")
+
+
+def bench_codecs(reads=200):
+    payloads = {
+        "holders": SAMPLE_PAYLOAD,
+        "analytics": ANALYTICS_PAYLOAD,
+        "etherscan": _etherscan_payload(),
+    }
+    print(f"Payload codecs: stored size and L2 read latency ({reads} reads each)")
+    print(f"  {'payload':<10} {'codec':<10} {'stored bytes':>13} {'db file bytes':>14} {'read us':>9}")
+    for data_type, payload in payloads.items():
+        for codec in (db_cache.CODEC_JSON, db_cache.CODEC_ZLIB_JSON):
+            db_cache.CACHE_CODEC = codec
+            with tempfile.TemporaryDirectory() as tmp:
+                db_cache._DB_PATH = os.path.join(tmp, "bench_cache.db")
+                db_cache.initialize_tables()
+                db_cache.put_many(data_type, [(token, "0x0", "eth", payload) for token in TOKENS])
+                conn = db_cache._get_connection()
+                stored = conn.execute("SELECT SUM(length(response_data)) FROM api_cache;").fetchone()[0]
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+                file_size = os.path.getsize(db_cache._DB_PATH)
+
+                start = time.perf_counter()
+                for i in range(reads):
+                    db_cache.clear_l1()
+                    db_cache.get_cached_data(data_type, TOKENS[i % len(TOKENS)])
+                per_read = (time.perf_counter() - start) / reads
+                db_cache.close_connection()
+            print(f"  {data_type:<10} {codec:<10} {stored:>13,} {file_size:>14,} {per_read * 1e6:>9.1f}")
+    db_cache.CACHE_CODEC = db_cache.CODEC_ZLIB_JSON
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    bench_lookup_latency(args.lookups)
+    print()
+    bench_bulk_lookup()
+    print()
+    bench_codecs()
+
+
+if __name__ == "__main__":
+    main()
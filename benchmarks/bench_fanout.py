@@ -0,0 +1,143 @@
+"""
+Wall-time scaling of the per-token aggregate fetches with metric/fanout.py.
+
+Run from the repository root:
+
+    python benchmarks/bench_fanout.py [--latency-ms 50] [--tokens 6,25,50,100]
+
+Each provider is replaced by a local stub HTTP server that answers after a
+fixed delay, so the numbers show scheduling only, not the real APIs. Every
+aggregate runs twice per token count: once with its provider limited to one
+request in flight (the old sequential loop) and once with the default
+PROVIDER_CONCURRENCY. The Kraken run goes through the cached fetchers, on a
+throwaway database with fresh pair names each time so every call misses.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ralys_analytic"))
+
+from metric import db_cache  # noqa: E402
+from metric import fanout  # noqa: E402
+from metric import holders  # noqa: E402
+from metric import kraken_market  # noqa: E402
+from metric import rate_limit  # noqa: E402
+
+HOLDERS_RESPONSE = json.dumps({
+    "totalHolders": 48211,
+    "holderChange": {"24h": {"change": 12, "changePercent": 0.03}},
+    "holderSupply": {"top10": {"supply": "123456789.12", "supplyPercent": 41.2}},
+    "holderDistribution": {"whales": 10, "shrimps": 40000},
+    "holdersByAcquisition": {"swap": 20000, "transfer": 25000, "airdrop": 3211},
+}).encode()
+
+TICKER_RESPONSE = json.dumps({
+    "error": [],
+    "result": {"PAIR": {
+        "a": ["0.0521", "1", "1.000"], "b": ["0.0519", "1", "1.000"], "c": ["0.0520", "10"],
+        "v": ["1000", "250000"], "p": ["0.0518", "0.0517"], "t": [10, 812],
+        "l": ["0.0501", "0.0498"], "h": ["0.0533", "0.0541"], "o": "0.0510",
+    }},
+}).encode()
+
+
+def _start_stub(latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Without this, Nagle + delayed ACK adds ~40 ms to every keep-alive response
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = TICKER_RESPONSE if "/Ticker" in self.path else HOLDERS_RESPONSE
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_holders(base_url: str, token_counts):
+    print("holders.get_all_token_holders_data (Moralis stub)")
+    holders.MORALIS_API_URL = base_url
+    os.environ.setdefault("MORALIS_API_KEY", "bench")
+    default_limit = fanout.PROVIDER_CONCURRENCY["moralis"]
+    for count in token_counts:
+        holders.TOKEN_CONTRACTS = {
+            f"Token {i}": {"address": f"0x{i:040x}", "chain": "eth"} for i in range(count)
+        }
+        fanout.set_concurrency("moralis", 1)
+        serial = _timed(holders.get_all_token_holders_data)
+        fanout.set_concurrency("moralis", default_limit)
+        concurrent = _timed(holders.get_all_token_holders_data)
+        print(f"  {count:4d} tokens: sequential {serial:6.2f} s, "
+              f"fan-out x{default_limit} {concurrent:6.2f} s ({serial / concurrent:.1f}x)")
+
+
+def bench_kraken(base_url: str, token_counts):
+    print("kraken_market.get_all_tickers (Kraken stub, cold cache)")
+    kraken_market.BASE_URL = base_url
+    default_limit = fanout.PROVIDER_CONCURRENCY["kraken"]
+    run = 0
+    for count in token_counts:
+        timings = []
+        for limit in (1, default_limit):
+            run += 1
+            kraken_market.KRAKEN_PAIRS = {f"Token {i}": f"R{run}P{i}USD" for i in range(count)}
+            fanout.set_concurrency("kraken", limit)
+            timings.append(_timed(kraken_market.get_all_tickers))
+        serial, concurrent = timings
+        print(f"  {count:4d} tokens: sequential {serial:6.2f} s, "
+              f"fan-out x{default_limit} {concurrent:6.2f} s ({serial / concurrent:.1f}x)")
+    fanout.set_concurrency("kraken", default_limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub response delay")
+    parser.add_argument("--tokens", default="6,25,50,100", help="comma-separated token counts")
+    args = parser.parse_args()
+    token_counts = [int(n) for n in args.tokens.split(",")]
+
+    logging.disable(logging.INFO)
+    # The stub has no quota; keep the providers' rate limits out of the timings
+    for provider in ("moralis", "kraken"):
+        rate_limit.RATE_LIMITS.pop(provider, None)
+    server = _start_stub(args.latency_ms / 1000)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_cache._DB_PATH = os.path.join(tmp, "cache.db")
+        db_cache.initialize_tables()
+        print(f"Stub latency {args.latency_ms:.0f} ms per request")
+        bench_holders(base_url, token_counts)
+        print()
+        bench_kraken(base_url, token_counts)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
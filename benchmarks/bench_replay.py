@@ -0,0 +1,132 @@
+"""
+Dashboard startup fetches replayed from a recorded cassette (metric/cassette.py).
+
+Record once, with network access and the usual API keys:
+
+    python benchmarks/bench_replay.py --record [--cassette-dir cassettes]
+
+Then benchmark anywhere, offline and without keys:
+
+    python benchmarks/bench_replay.py [--latency-ms 80] [--repeat 3]
+
+Every workload the dashboard loads at startup (prices, holders, analytics,
+Kraken peer comparison, Etherscan whale tracker) is timed twice per repeat on a
+throwaway cache database, so every call goes to the (replayed) provider:
+once as the synchronous fetchers called one after another, and once through
+async_fetch.gather_all() as the dashboard does. Replayed responses are
+identical on every run, so the only variable is the injected latency. The
+Etherscan window is built from the clock saved with the recording
+(cassette.now()), and every run starts from an empty transfer store, so the
+whale tracker sends the recorded requests however long ago they were made.
+DefiLlama revenue goes through its SDK's own HTTP client and is not included.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ralys_analytic"))
+
+from metric import analytics  # noqa: E402
+from metric import async_fetch  # noqa: E402
+from metric import cassette  # noqa: E402
+from metric import db_cache  # noqa: E402
+from metric import etherscan  # noqa: E402
+from metric import holders  # noqa: E402
+from metric import kraken_market  # noqa: E402
+from metric import price  # noqa: E402
+from metric import projects  # noqa: E402
+
+RAYLS = holders.TOKEN_CONTRACTS["Rayls (RLS)"]
+
+
+def _sync_workloads():
+    return {
+        "prices": lambda: price.getCoinMarketCapPricesBatch(projects.BATCH_PRICE_IDS),
+        "rayls_price": price.getRaylsPrice,
+        "holders": holders.get_all_token_holders_data_cached,
+        "analytics": analytics.get_all_token_analytics_cached,
+        "peer_comparison": kraken_market.get_peer_comparison,
+        "whale_tracker": lambda: etherscan.get_whale_tracker_data(
+            RAYLS["address"], RAYLS["chain"], min_tokens=100000, limit=50, days=7
+        ),
+    }
+
+
+def _async_calls():
+    return {
+        "prices": price.getCoinMarketCapPricesBatchAsync(projects.BATCH_PRICE_IDS),
+        "rayls_price": price.getRaylsPriceAsync(),
+        "holders": holders.get_all_token_holders_data_cached_async(),
+        "analytics": analytics.get_all_token_analytics_cached_async(),
+        "peer_comparison": kraken_market.get_peer_comparison_async(),
+        "whale_tracker": etherscan.get_whale_tracker_data_async(
+            RAYLS["address"], RAYLS["chain"], min_tokens=100000, limit=50, days=7
+        ),
+    }
+
+
+def _cold_cache(tmp: str, run: int):
+    db_cache._DB_PATH = os.path.join(tmp, f"cache-{run}.db")
+    db_cache.clear_l1()
+    db_cache.initialize_tables()
+
+
+def _run_sequential() -> float:
+    start = time.perf_counter()
+    for name, fetch in _sync_workloads().items():
+        try:
+            fetch()
+        except cassette.CassetteMiss as e:
+            print(f"  {name}: {e}")
+        except Exception as e:
+            print(f"  {name} failed: {e}")
+    return time.perf_counter() - start
+
+
+def _run_gathered() -> float:
+    start = time.perf_counter()
+    for name, result in async_fetch.gather_all(_async_calls()).items():
+        if isinstance(result, dict) and list(result) == ["error"]:
+            print(f"  {name} failed: {result['error']}")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="fetch from the live APIs and save the cassette")
+    parser.add_argument("--cassette-dir", default=cassette.DEFAULT_DIR)
+    parser.add_argument("--latency-ms", type=float, default=80, help="injected delay per replayed response")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.record:
+            cassette.configure(mode=cassette.RECORD, directory=args.cassette_dir)
+            _cold_cache(tmp, 0)
+            print(f"Recorded startup fetches to {args.cassette_dir} in {_run_sequential():.2f} s")
+            # The async twins send the same requests; run them too in case one differs
+            _cold_cache(tmp, 1)
+            _run_gathered()
+            return
+
+        cassette.configure(mode=cassette.REPLAY, directory=args.cassette_dir, latency_ms=args.latency_ms)
+        print(f"Replaying {args.cassette_dir} with {args.latency_ms:.0f} ms per response")
+        sequential, gathered = [], []
+        for run in range(args.repeat):
+            _cold_cache(tmp, 2 * run)
+            sequential.append(_run_sequential())
+            _cold_cache(tmp, 2 * run + 1)
+            gathered.append(_run_gathered())
+        seq, gat = statistics.median(sequential), statistics.median(gathered)
+        print(f"  sequential sync fetchers: median {seq:6.2f} s over {args.repeat} runs")
+        print(f"  gather_all async:         median {gat:6.2f} s ({seq / gat:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
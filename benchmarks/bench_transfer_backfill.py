@@ -0,0 +1,189 @@
+"""
+Wall time of a first-time transfer backfill, one page at a time vs sharded.
+
+Run from the repository root:
+
+    python benchmarks/bench_transfer_backfill.py [--latency-ms 1000] [--per-day 2500] [--days 30,90] [--tokens 3]
+
+A local stub stands in for Etherscan's tokentx and getblocknobytime, serving
+a synthetic liquid token (--per-day transfers, 12 s blocks, an occasional
+burst of hundreds of transfers in one block) after a fixed delay. Each window
+is backfilled on a throwaway database twice: with SHARDS_PER_BATCH = 1 (one
+request in flight, like the old page-by-page walk) and with the default
+batches fetched concurrently (up to PROVIDER_CONCURRENCY["etherscan"] in
+flight). Then --tokens contracts are synced together, as
+get_all_token_transfer_activity does, with one of them new (a first-time
+backfill) and the rest already synced: once as before nested fan-outs could
+borrow slots (each token held an Etherscan slot, so the new token's sharded
+fetch ran inline, one request at a time; reproduced with SHARDS_PER_BATCH =
+1), and once with the per-token loop holding no slot, so the backfill's page
+requests take the slots the synced tokens leave free. The stub runs in this process, so its JSON encoding competes with
+the parsing being timed; lower latencies understate the gain. The etherscan
+rate limit is left out unless --rate-limit is given.
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ralys_analytic"))
+
+from metric import db_cache  # noqa: E402
+from metric import etherscan  # noqa: E402
+from metric import fanout  # noqa: E402
+from metric import rate_limit  # noqa: E402
+from metric import transfer_store  # noqa: E402
+
+BLOCK_SECONDS = 12
+CONTRACT = "0x00000000000000000000000000000000000000b1"
+
+
+class Chain:
+    """Synthetic transfers ending at the current block, oldest first."""
+
+    def __init__(self, days, per_day, seed=0):
+        rnd = random.Random(seed)
+        self.now = int(time.time())
+        self.head = 21_000_000
+        span = days * 86400 // BLOCK_SECONDS
+        blocks = sorted(rnd.randrange(self.head - span, self.head + 1) for _ in range(days * per_day))
+        for _ in range(days // 3):
+            burst = rnd.randrange(self.head - span, self.head + 1)
+            blocks[bisect.bisect(blocks, burst):bisect.bisect(blocks, burst)] = [burst] * rnd.randint(200, 800)
+        addresses = [f"0x{rnd.getrandbits(160):040x}" for _ in range(2000)]
+        self.blocks = blocks
+        self.transfers = [
+            {
+                "blockNumber": str(block), "timeStamp": str(self.timestamp(block)),
+                "hash": f"0x{rnd.getrandbits(256):064x}", "logIndex": str(i % 500),
+                "from": rnd.choice(addresses), "to": rnd.choice(addresses),
+                "value": str(rnd.getrandbits(80)), "tokenDecimal": "18",
+            }
+            for i, block in enumerate(blocks)
+        ]
+
+    def timestamp(self, block):
+        return self.now - (self.head - block) * BLOCK_SECONDS
+
+    def block_at(self, timestamp):
+        return self.head - (self.now - timestamp) // BLOCK_SECONDS
+
+    def tokentx(self, start, end, sort, offset):
+        rows = self.transfers[bisect.bisect_left(self.blocks, start):bisect.bisect_right(self.blocks, end)]
+        return (rows[::-1] if sort == "desc" else rows)[:offset]
+
+
+def _start_stub(chain, latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        requests = 0
+
+        def do_GET(self):
+            time.sleep(latency)
+            q = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+            Handler.requests += 1
+            if q["action"] == "getblocknobytime":
+                result = str(chain.block_at(int(q["timestamp"])))
+            else:
+                result = chain.tokentx(int(q["startblock"]), int(q["endblock"]), q["sort"], int(q["offset"]))
+            body = json.dumps({"status": "1", "message": "OK", "result": result}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, Handler
+
+
+def _fresh_cache(path):
+    db_cache._DB_PATH = path
+    db_cache.clear_l1()
+    db_cache.initialize_tables()
+
+
+def _sync_tokens(chain, contracts, days, **fan_out_args):
+    """Wall time of loading every contract's window concurrently; checks each window's transfers."""
+    start = time.perf_counter()
+    windows = fanout.fan_out(
+        lambda contract: etherscan.TransferWindow.load(contract, "eth", days, max_pages=1000), contracts, **fan_out_args
+    )
+    elapsed = time.perf_counter() - start
+    for window in windows:
+        expected = sum(window.start_timestamp <= int(tx["timeStamp"]) <= window.end_timestamp for tx in chain.transfers)
+        assert sum(len(chunk) for chunk in window.chunks()) == expected, "multi-token sync returned different transfers"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=1000, help="stub response delay per request")
+    parser.add_argument("--per-day", type=int, default=2500, help="transfers per day")
+    parser.add_argument("--days", default="30,90", help="comma-separated window lengths")
+    parser.add_argument("--tokens", type=int, default=3, help="contracts in the multi-token run")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the etherscan rate limit")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    if not args.rate_limit:
+        rate_limit.RATE_LIMITS.pop("etherscan", None)
+    os.environ.setdefault("ETHERSCAN_API_KEY", "bench")
+    default_batch = transfer_store.SHARDS_PER_BATCH
+    print(f"Stub latency {args.latency_ms:.0f} ms, {args.per_day} transfers/day, "
+          f"{transfer_store.PAGE_SIZE} per page")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for days in [int(d) for d in args.days.split(",")]:
+            chain = Chain(days + 1, args.per_day)
+            server, handler = _start_stub(chain, args.latency_ms / 1000)
+            etherscan.ETHERSCAN_API_URL = f"http://127.0.0.1:{server.server_address[1]}/api"
+            results = []
+            for batch in (1, default_batch):
+                transfer_store.SHARDS_PER_BATCH = batch
+                _fresh_cache(os.path.join(tmp, f"cache-{days}-{batch}.db"))
+                handler.requests = 0
+                start = time.perf_counter()
+                window = etherscan.TransferWindow.load(CONTRACT, "eth", days, max_pages=1000)
+                elapsed = time.perf_counter() - start
+                results.append((elapsed, handler.requests, sum(len(chunk) for chunk in window.chunks())))
+            transfer_store.SHARDS_PER_BATCH = default_batch
+
+            (serial, serial_requests, rows), (sharded, sharded_requests, sharded_rows) = results
+            assert rows == sharded_rows, "sharded backfill returned different transfers"
+            print(f"  {days:3d} days, {rows:,} transfers: one at a time {serial:6.2f} s ({serial_requests} requests), "
+                  f"sharded x{default_batch} {sharded:6.2f} s ({sharded_requests} requests, {serial / sharded:.1f}x)")
+
+            # The stub serves the same chain for every contract; all but the first are synced beforehand
+            contracts = [f"0x{0xb1 + i:040x}" for i in range(args.tokens)]
+            timings = []
+            for batch, fan_out_args in [(1, {"provider": "etherscan"}),
+                                        (default_batch, {"max_workers": fanout.PROVIDER_CONCURRENCY["etherscan"]})]:
+                _fresh_cache(os.path.join(tmp, f"tokens-{days}-{batch}.db"))
+                _sync_tokens(chain, contracts[1:], days, **fan_out_args)
+                transfer_store.SHARDS_PER_BATCH = batch
+                timings.append(_sync_tokens(chain, contracts, days, **fan_out_args))
+                transfer_store.SHARDS_PER_BATCH = default_batch
+            server.shutdown()
+            inline, shared = timings
+            print(f"       {len(contracts)} tokens, one new: backfill inline {inline:6.2f} s, "
+                  f"on free slots {shared:6.2f} s ({inline / shared:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Row loops vs columnar group-bys for the Etherscan transfer analyses.
+
+Run from the repository root:
+
+    python benchmarks/bench_transfer_columns.py [--sizes 50000,1000000] [--repeat 3] [--chunk-rows 10000]
+
+Synthetic tokentx rows (newest first, 18 decimals, a few thousand addresses
+including the known exchange wallets) are analysed twice: by the per-row
+loops etherscan.py used before transfer_columns.py (kept below as the
+reference) and by the etherscan aggregators fed TransferColumns in chunks
+of --chunk-rows, as TransferWindow reads them from the store. Parsing is
+timed separately from each analysis, and both sides must return the same
+results before any timing is printed. The peak memory (tracemalloc) of
+parsing and analysing the stored rows in one chunk and in --chunk-rows
+chunks is printed next, for every analysis together and for
+transfer_activity alone, exact and in sketch mode (which keeps no address
+table). Last, transfer_activity in sketch mode (HyperLogLog and KLL,
+metric/sketches.py) is timed and its estimates compared with the exact
+unique address counts and 95th-percentile cut.
+"""
+
+import os
+import sys
+import time
+import random
+import tracemalloc
+import argparse
+import statistics
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ralys_analytic"))
+
+from metric import etherscan  # noqa: E402
+from metric import sketches  # noqa: E402
+from metric import transfer_columns  # noqa: E402
+from metric import transfer_store  # noqa: E402
+
+END_TIMESTAMP = 1_760_000_000
+DAYS = 30
+
+
+def synthetic_transfers(n, seed=0):
+    """n tokentx-shaped dicts over the last DAYS days, newest first."""
+    rnd = random.Random(seed)
+    addresses = [f"0x{rnd.getrandbits(160):040x}" for _ in range(max(n // 50, 100))]
+    addresses += list(etherscan._EXCHANGE_LOOKUP) * 20  # exchanges show up often
+    step = DAYS * 86400 / n
+    return [
+        {
+            "hash": f"0x{rnd.getrandbits(256):064x}",
+            "blockNumber": str(21_000_000 - i // 4),
+            "timeStamp": str(int(END_TIMESTAMP - i * step)),
+            "from": rnd.choice(addresses),
+            "to": rnd.choice(addresses),
+            # Mostly small amounts, some round whale-sized ones
+            "value": str(rnd.choice((rnd.getrandbits(70), 10**18 * rnd.randint(1, 2_000_000)))),
+            "tokenDecimal": "18",
+        }
+        for i in range(n)
+    ]
+
+
+# Reference: the per-row implementation the columnar one replaced
+
+def rows_parse(transfers):
+    parsed = []
+    for tx in transfers:
+        ts = int(tx["timeStamp"])
+        parsed.append((
+            tx["hash"], tx["from"].lower(), tx["to"].lower(), int(tx["value"]) / 10 ** int(tx["tokenDecimal"]),
+            ts, datetime.utcfromtimestamp(ts).strftime("%Y-%m-%d"),
+        ))
+    return parsed
+
+
+def _row(tx):
+    tx_hash, from_address, to_address, value, ts, _ = tx
+    return {
+        "hash": tx_hash, "from": from_address, "to": to_address, "value": round(value, 2),
+        "timestamp": datetime.utcfromtimestamp(ts).strftime("%Y-%m-%d %H:%M"),
+    }
+
+
+def _largest(rows, limit):
+    rows.sort(key=lambda x: x["value"], reverse=True)
+    return rows[:limit]
+
+
+def rows_activity(parsed):
+    buckets = defaultdict(lambda: {"count": 0, "addresses": set(), "volume": 0.0})
+    for _, from_address, to_address, value, _, date in parsed:
+        bucket = buckets[date]
+        bucket["count"] += 1
+        bucket["addresses"].add(from_address)
+        bucket["addresses"].add(to_address)
+        bucket["volume"] += value
+    daily_stats = [
+        {
+            "date": date, "transfer_count": b["count"], "unique_addresses": len(b["addresses"]),
+            "total_volume": round(b["volume"], 2), "avg_transfer_size": round(b["volume"] / b["count"], 2),
+        }
+        for date, b in sorted(buckets.items())
+    ]
+    threshold = np.percentile([tx[3] for tx in parsed], 95)
+    large = _largest([_row(tx) for tx in parsed if tx[3] >= threshold], 50)
+    all_addresses = set().union(*(b["addresses"] for b in buckets.values()))
+    summary = {
+        "total_transfers": len(parsed),
+        "total_unique_addresses": len(all_addresses),
+        "total_volume": round(sum(b["volume"] for b in buckets.values()), 2),
+        "avg_daily_transfers": round(len(parsed) / max(len(buckets), 1), 1),
+    }
+    return {"daily_stats": daily_stats, "large_transfers": large, "summary": summary}
+
+
+def rows_whales(parsed, min_tokens=100000, limit=50):
+    return _largest([_row(tx) for tx in parsed if tx[3] >= min_tokens], limit)
+
+
+def rows_accumulation(parsed):
+    flows = defaultdict(lambda: [0.0, 0.0])
+    for _, from_address, to_address, value, _, _ in parsed:
+        if to_address:
+            flows[to_address][0] += value
+        if from_address:
+            flows[from_address][1] += value
+    ranked = sorted(
+        ((address, round(f[0], 2), round(f[1], 2), round(f[0] - f[1], 2), round(f[0] + f[1], 2))
+         for address, f in flows.items()),
+        key=lambda x: x[4], reverse=True,
+    )
+    return ranked[:20]
+
+
+def rows_exchange_flow(parsed):
+    exchanges = defaultdict(lambda: [0.0, 0.0])
+    daily = defaultdict(lambda: [0.0, 0.0])
+    for _, from_address, to_address, value, _, date in parsed:
+        to_exchange = etherscan._EXCHANGE_LOOKUP.get(to_address)
+        if to_exchange:
+            exchanges[to_exchange][0] += value
+            daily[date][0] += value
+        from_exchange = etherscan._EXCHANGE_LOOKUP.get(from_address)
+        if from_exchange:
+            exchanges[from_exchange][1] += value
+            daily[date][1] += value
+    return (
+        {name: (round(f[0], 2), round(f[1], 2)) for name, f in exchanges.items()},
+        [(date, round(f[0], 2), round(f[1], 2)) for date, f in sorted(daily.items())],
+    )
+
+
+def _same(rows_result, columns_result, name):
+    if rows_result != columns_result:
+        raise SystemExit(f"{name}: columnar result differs from the row loop")
+
+
+def analyse(aggregator, columns, chunk_rows):
+    """Feed columns to an etherscan aggregator chunk by chunk."""
+    for start in range(0, len(columns), chunk_rows):
+        aggregator.add(columns.take(slice(start, start + chunk_rows)))
+    return aggregator.result()
+
+
+def _analyses(columns, chunk_rows):
+    return {
+        "transfer_activity": lambda: analyse(etherscan.TransferActivity(), columns, chunk_rows),
+        "whale_transfers": lambda: analyse(etherscan.WhaleTransfers(100000), columns, chunk_rows),
+        "accumulation": lambda: analyse(etherscan.WhaleAccumulation(), columns, chunk_rows),
+        "exchange_flow": lambda: analyse(etherscan.ExchangeFlow(), columns, chunk_rows),
+    }
+
+
+def check(parsed, analyses):
+    _same(rows_activity(parsed), analyses["transfer_activity"](), "transfer_activity")
+    _same(rows_whales(parsed), analyses["whale_transfers"](), "whale_transfers")
+    accumulation = analyses["accumulation"]()["top_addresses"]
+    _same(rows_accumulation(parsed), [
+        (a["address"], a["total_in"], a["total_out"], a["net_flow"], a["total_volume"]) for a in accumulation
+    ], "accumulation")
+    flow = analyses["exchange_flow"]()
+    _same(rows_exchange_flow(parsed), (
+        {name: (f["inflow"], f["outflow"]) for name, f in flow["exchange_flows"].items()},
+        [(d["date"], d["inflow"], d["outflow"]) for d in flow["daily_flows"]],
+    ), "exchange_flow")
+
+
+def _time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def stream_peak(rows, chunk_rows, aggregators):
+    """Peak bytes allocated while parsing and analysing rows in chunks, as TransferWindow.scan does."""
+    chunks = (rows[start:start + chunk_rows] for start in range(0, len(rows), chunk_rows))
+    shared = any(aggregator.shared_addresses for aggregator in aggregators)
+    tracemalloc.start()
+    for chunk in transfer_columns.iter_columns(chunks, shared):
+        for aggregator in aggregators:
+            aggregator.add(chunk)
+    for aggregator in aggregators:
+        aggregator.result()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def sketch_errors(exact, sketched, columns):
+    """(max relative error of the daily unique counts, of the window's, rank error of the cut)."""
+    daily = max(
+        abs(s["unique_addresses"] - e["unique_addresses"]) / e["unique_addresses"]
+        for e, s in zip(exact["daily_stats"], sketched["daily_stats"])
+    )
+    total = exact["summary"]["total_unique_addresses"]
+    window = abs(sketched["summary"]["total_unique_addresses"] - total) / total
+    # The cut is not returned; rebuild it from per-day KLL sketches merged, as TransferActivity does
+    _, day_index = columns.days()
+    merged = sketches.KLLSketch()
+    for day in range(day_index.max() + 1):
+        day_values = sketches.KLLSketch()
+        day_values.add(columns.value[day_index == day])
+        merged.merge(day_values)
+    rank = abs(np.mean(columns.value <= merged.quantile(0.95)) - 0.95)
+    return daily, window, rank
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50000,1000000", help="comma-separated transfer counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-rows", type=int, default=transfer_store.CHUNK_ROWS)
+    args = parser.parse_args()
+
+    for n in [int(size) for size in args.sizes.split(",")]:
+        transfers = synthetic_transfers(n)
+        rows_time, parsed = _time(lambda: rows_parse(transfers), args.repeat)
+        columns_time, columns = _time(lambda: transfer_columns.from_tokentx(transfers), args.repeat)
+        analyses = _analyses(columns, args.chunk_rows)
+        check(parsed, analyses)
+
+        print(f"{n:,} transfers (median of {args.repeat})")
+        print(f"  {'':20} {'row loop':>10} {'columnar':>10}")
+        print(f"  {'parse':20} {rows_time:9.3f}s {columns_time:9.3f}s  {rows_time / columns_time:5.1f}x")
+        for name, rows_fn in [
+            ("transfer_activity", rows_activity),
+            ("whale_transfers", rows_whales),
+            ("accumulation", rows_accumulation),
+            ("exchange_flow", rows_exchange_flow),
+        ]:
+            rows_time, _ = _time(lambda: rows_fn(parsed), args.repeat)
+            columns_time, _ = _time(analyses[name], args.repeat)
+            print(f"  {name:20} {rows_time:9.3f}s {columns_time:9.3f}s  {rows_time / columns_time:5.1f}x")
+
+        rows = [
+            (tx["hash"], tx["blockNumber"], tx["timeStamp"], tx["from"], tx["to"], tx["value"], tx["tokenDecimal"])
+            for tx in transfers
+        ]
+        def every_analysis():
+            return [etherscan.TransferActivity(), etherscan.WhaleTransfers(100000),
+                    etherscan.WhaleAccumulation(), etherscan.ExchangeFlow()]
+
+        whole = stream_peak(rows, len(rows), every_analysis())
+        chunked = stream_peak(rows, args.chunk_rows, every_analysis())
+        exact = stream_peak(rows, args.chunk_rows, [etherscan.TransferActivity()])
+        sketched = stream_peak(rows, args.chunk_rows, [etherscan.TransferActivity(sketch=True)])
+        print(f"  peak memory: one chunk {whole / 2**20:7.1f} MiB, {args.chunk_rows:,}-row chunks {chunked / 2**20:7.1f} MiB; "
+              f"activity alone {exact / 2**20:7.1f} MiB exact, {sketched / 2**20:7.1f} MiB sketch mode")
+
+        sketch_time, sketch_result = _time(
+            lambda: analyse(etherscan.TransferActivity(sketch=True), columns, args.chunk_rows), args.repeat
+        )
+        daily, window, rank = sketch_errors(analyses["transfer_activity"](), sketch_result, columns)
+        print(f"  {'activity (sketch)':20} {'':10} {sketch_time:9.3f}s  unique addresses off by {daily:.2%} "
+              f"(worst day), {window:.2%} (window); 95th percentile cut off by {rank:.2%} in rank")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
+import time
 import logging
+import functools
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
+from typing import NamedTuple
 from defillama_sdk import DefiLlama
 
 logging.basicConfig(level=logging.INFO)
@@ -14,9 +17,14 @@ from metric import analytics
 from metric import etherscan
 from metric import kraken_market
 from metric import db_cache
+from metric import projects
+from metric import telemetry
+from metric import async_fetch
 
 try:
     db_cache.initialize_tables()
+    db_cache.start_janitor()
+    telemetry.start_exporter()
 except Exception as e:
     logging.warning(f"DB cache initialization failed, will use API directly: {e}")
 
@@ -263,21 +271,11 @@ st.markdown("""
 tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["📊 Project Comparison", "💹 Market Condition", "📈 Valuation Analysis", "👥 Token Holders", "💱 Token Analytics", "🏪 Market Analytics", "🐋 Whale Tracker"])
 
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
 def load_data():
+    """Project comparison table; prices and every project's revenue are fetched at once."""
     client = DefiLlama()
 
-    # Metadata: (name, display_name, token_supply, circulating_token, coingecko_id, type, revenue_override)
-    metadata = [
-        ("zksync_era", "zkSync Era", 21_000_000_000, 8_620_000_000,"zksync", "protocol", None),
-        ("plume_mainnet", "Plume Mainnet", 10_000_000_000, 4_800_000_000,"plume", "protocol", None),
-        ("avalanche", "Avalanche", 715_740_000, 431_720_000,"avalanche-2", "protocol", None),
-        ("ondo_finance", "Ondo Finance", 10_000_000_000,4_860_000_000, "ondo-finance", "protocol", None),
-        ("ondo_yield_assets", "Ondo Yield Assets", 1_250_000_000, 628_940_000,"ondo-us-dollar-yield", "protocol", None),
-        ("polygon", "Polygon", 10_000_000_000, 1_910_000_000, "polygon-ecosystem-token", "chain", None),
-        ("chainlink", "Chainlink", 1_000_000_000, 626_000_000, "chainlink", "protocol", None),
-        ("rayls", "Rayls (RLS)", 10_000_000_000, 1_500_000_000,"rls", "protocol", 2_000_000),
-    ]
+    metadata = projects.PROJECT_METADATA
 
     def get_2025_revenue(revenue_data):
         annual_data = revenue.annualRevenue(revenue_data)
@@ -286,13 +284,27 @@ def load_data():
                 return total
         return None
 
-    # Fetch CoinMarketCap prices for non-Rayls tokens
-    coingecko_ids = [item[4] for item in metadata if item[4] != "rls"]
-    price_data_batch = price.getCoingeckoPricesBatch(coingecko_ids)
-
-    # Fetch Rayls price from CoinMarketCap
+    calls = {
+        # CoinMarketCap prices for non-Rayls tokens, and the Rayls price
+        "prices": price.getCoinMarketCapPricesBatchAsync(projects.BATCH_PRICE_IDS),
+        "rayls_price": price.getRaylsPriceAsync(),
+    }
+    # The DefiLlama SDK is synchronous; gather_all runs these on worker threads
+    for _, display_name, _, _, _, item_type, revenue_override in metadata:
+        if revenue_override is None:
+            fetch = revenue.getRevenueByProtocol if item_type == "protocol" else revenue.getRevenueByChain
+            calls[display_name] = functools.partial(fetch, client, display_name)
+    fetched = async_fetch.gather_all(calls)
+
+    price_data_batch = fetched["prices"]
+    if "error" in price_data_batch:
+        raise Exception(price_data_batch["error"])
+
+    # Rayls price from CoinMarketCap
     try:
-        rayls_price_data = price.getRaylsPrice()
+        rayls_price_data = fetched["rayls_price"]
+        if "error" in rayls_price_data:
+            raise Exception(rayls_price_data["error"])
         price_data_batch["rls"] = {
             "price": rayls_price_data.get("price_usd"),
             "market_cap": rayls_price_data.get("market_cap"),
@@ -327,11 +339,10 @@ def load_data():
 
             if revenue_override is not None:
                 revenue_2025 = revenue_override
-            elif item_type == "protocol":
-                revenue_data = revenue.getRevenueByProtocol(client, display_name)
-                revenue_2025 = get_2025_revenue(revenue_data)
             else:
-                revenue_data = revenue.getRevenueByChain(client, display_name)
+                revenue_data = fetched[display_name]
+                if isinstance(revenue_data, dict) and "error" in revenue_data:
+                    raise Exception(revenue_data["error"])
                 revenue_2025 = get_2025_revenue(revenue_data)
 
             # Calculate revenue growth if we have revenue data (not for Rayls)
@@ -378,9 +389,155 @@ def load_data():
 if "last_refresh" not in st.session_state:
     st.session_state.last_refresh = datetime.now()
 
+RAYLS_TOKEN = holders.TOKEN_CONTRACTS["Rayls (RLS)"]
+
+
+def is_error(result):
+    """True for a loader's bare {"error": ...} result."""
+    return isinstance(result, dict) and list(result) == ["error"]
+
+
+class _ErrorResult(Exception):
+    def __init__(self, result):
+        super().__init__(result)
+        self.result = result
+
+
+def cache_unless_error(ttl, failed=is_error):
+    """
+    st.cache_data that doesn't keep failed results, so a transient provider
+    error is fetched again on the next rerun instead of being shown for the
+    whole TTL.
+    """
+    def decorator(fn):
+        # functools.wraps keeps fn's name and source, which key Streamlit's cache
+        @st.cache_data(ttl=ttl)
+        @functools.wraps(fn)
+        def cached(*args, **kwargs):
+            result = fn(*args, **kwargs)
+            if failed(result):
+                raise _ErrorResult(result)  # Streamlit doesn't cache calls that raise
+            return result
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return cached(*args, **kwargs)
+            except _ErrorResult as e:
+                return e.result
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorator
+
+
+class _NotCached(Exception):
+    """Raised by a probe so _startup_result() stores nothing and reports a miss."""
+
+
+_MISS = object()
+
+
+class _Raised(NamedTuple):
+    """A startup loader that raised, as opposed to one that returned {"error": ...}."""
+    error: str
+
+
+# Short TTL so rows refreshed in the background by db_cache show up quickly.
+# Keyed on name only: Streamlit does not hash arguments starting with "_".
+@cache_unless_error(ttl=300)
+def _startup_result(name, _load):
+    return _load()
+
+
+def _cached_startup_result(name):
+    """The cached startup result for name, or _MISS if there is none."""
+    def probe():
+        raise _NotCached(name)
+
+    try:
+        return _startup_result(name, probe)
+    except _NotCached:
+        return _MISS
+
+
+def _raising_as_result(fn):
+    """fn(), or _Raised if it raised (gather_all would map both failures to {"error": ...})."""
+    try:
+        return fn()
+    except Exception as e:
+        return _Raised(str(e))
+
+
+async def _raising_as_result_async(coro):
+    """_raising_as_result() for a coroutine."""
+    try:
+        return await coro
+    except Exception as e:
+        return _Raised(str(e))
+
+
+def _startup_loaders():
+    """Each tab's startup loader: a zero-argument function returning a gather_all call."""
+    return {
+        "projects": lambda: functools.partial(_raising_as_result, load_data),
+        "holders": lambda: _raising_as_result_async(holders.get_all_token_holders_data_cached_async()),
+        "analytics": lambda: _raising_as_result_async(analytics.get_all_token_analytics_cached_async()),
+        "peer_comparison": lambda: _raising_as_result_async(kraken_market.get_peer_comparison_async()),
+        "whale_tracker": lambda: _raising_as_result_async(etherscan.get_whale_tracker_data_async(
+            RAYLS_TOKEN["address"], RAYLS_TOKEN["chain"], min_tokens=100000, limit=50, days=7
+        )),
+    }
+
+
+def load_startup_data():
+    """
+    Every tab's startup data, each loader's result cached on its own.
+
+    Loaders without a cached result run concurrently on the shared async
+    loop, so a cold start waits on the slowest provider rather than on all
+    of them in turn. A failed result is not cached, so only that loader runs
+    again on the next rerun.
+
+    Returns:
+        ({name: result}, names of the loaders that raised)
+    """
+    loaders = _startup_loaders()
+    results = {name: _cached_startup_result(name) for name in loaders}
+    misses = [name for name, result in results.items() if result is _MISS]
+    raised = set()
+    if misses:
+        fetched = async_fetch.gather_all({name: loaders[name]() for name in misses})
+        for name in misses:
+            result = fetched[name]
+            if isinstance(result, _Raised):
+                raised.add(name)
+                result = {"error": result.error}
+            results[name] = _startup_result(name, lambda value=result: value)
+    return results, raised
+
+
+def from_startup(name, fallback):
+    """
+    One load_startup_data() result.
+
+    A loader that raised on the async path is run once more through its
+    synchronous twin, whose successful result is cached like the others. A
+    loader that returned {"error": ...} is not re-run until the next rerun.
+    """
+    result = startup_data[name]
+    if name in startup_raised:
+        logging.warning(f"Startup load of {name} failed ({result['error']}), retrying synchronously")
+        result = fallback()
+        if not is_error(result):
+            _startup_result(name, lambda: result)
+    return result
+
+
 # Load data
 with st.spinner("Loading data from APIs..."):
-    df = load_data()
+    startup_data, startup_raised = load_startup_data()
+    df = from_startup("projects", load_data)
 
 
 # Helper functions
@@ -444,10 +601,22 @@ def get_change_badge(val):
     return f'<span class="change-badge {css_class}">{sign}{val:.2f}%</span>'
 
 
+def _format_ttl(seconds: float) -> str:
+    if seconds >= 3600:
+        hours = seconds / 3600
+        return f"{hours:g} hour" + ("" if hours == 1 else "s")
+    if seconds >= 60:
+        minutes = seconds / 60
+        return f"{minutes:g} minute" + ("" if minutes == 1 else "s")
+    return f"{seconds:g} seconds"
+
+
 def render_cache_notice(data_type: str, token_name: str = "Rayls (RLS)"):
-    """Display a cache-age notice for Moralis-backed data (6-hour TTL)."""
+    """Display a cache-age notice for Moralis-backed data, using the data type's TTL policy."""
+    ttl_label = _format_ttl(db_cache.get_ttl_policy(data_type).soft_seconds)
     try:
-        fetched_at_str = db_cache.get_cache_fetched_at(data_type, token_name)
+        status = db_cache.get_cache_status(data_type, token_name)
+        fetched_at_str = status["fetched_at"]
         if fetched_at_str:
             fetched_dt = datetime.fromisoformat(fetched_at_str)
             # Normalise to naive UTC for arithmetic
@@ -462,14 +631,34 @@ def render_cache_notice(data_type: str, token_name: str = "Rayls (RLS)"):
             else:
                 age_str = f"{minutes}m ago"
             fetched_label = fetched_dt.strftime("%Y-%m-%d %H:%M UTC")
-            st.caption(
-                f"ℹ️ This data is cached for up to **6 hours** and refreshed automatically. "
-                f"Last fetched: **{age_str}** ({fetched_label})"
-            )
+            if status["state"] == db_cache.CACHE_STATE_PROVIDER_DOWN:
+                retry_in = max(int(status["retry_at"] - time.time()), 0)
+                st.warning(
+                    f"⚠️ Data provider is unavailable — showing the last good data fetched **{age_str}** "
+                    f"({fetched_label}). Retrying in {retry_in // 60}m {retry_in % 60:02d}s."
+                )
+            elif status["state"] == db_cache.CACHE_STATE_REFRESHING:
+                st.caption(
+                    f"🔄 Refreshing in the background — showing data fetched **{age_str}** ({fetched_label}). "
+                    f"Reload shortly for the latest figures."
+                )
+            elif status["state"] == db_cache.CACHE_STATE_STALE:
+                st.caption(
+                    f"⏳ Cached data is older than **{ttl_label}** and will be refreshed on the next load. "
+                    f"Last fetched: **{age_str}** ({fetched_label})"
+                )
+            else:
+                st.caption(
+                    f"ℹ️ This data is cached for up to **{ttl_label}** and refreshed automatically. "
+                    f"Last fetched: **{age_str}** ({fetched_label})"
+                )
+        elif status["state"] == db_cache.CACHE_STATE_PROVIDER_DOWN:
+            retry_in = max(int(status["retry_at"] - time.time()), 0)
+            st.warning(f"⚠️ Data provider is unavailable and no cached data exists yet. Retrying in {retry_in // 60}m {retry_in % 60:02d}s.")
         else:
-            st.caption("ℹ️ This data is cached for up to **6 hours** and refreshed automatically. Fetch time unavailable.")
+            st.caption(f"ℹ️ This data is cached for up to **{ttl_label}** and refreshed automatically. Fetch time unavailable.")
     except Exception:
-        st.caption("ℹ️ This data is cached for up to **6 hours** and refreshed automatically.")
+        st.caption(f"ℹ️ This data is cached for up to **{ttl_label}** and refreshed automatically.")
 
 
 # Tab 1: Project Comparison
@@ -1707,10 +1896,9 @@ with tab4:
     Track token holder metrics across Ethereum mainnet. Data powered by **Moralis API**.
     """)
 
-    @st.cache_data(ttl=21600)  # Match 6-hour DB cache TTL — re-executing sooner returns stale data anyway
     def load_holders_data():
         """Load token holder data (DB cache -> Moralis API fallback)."""
-        return holders.get_all_token_holders_data_cached()
+        return from_startup("holders", holders.get_all_token_holders_data_cached)
 
     with st.spinner("Loading token holder data from Moralis..."):
         holders_data = load_holders_data()
@@ -1763,6 +1951,35 @@ with tab4:
 
         st.markdown("<br>", unsafe_allow_html=True)
 
+        # Holder count history, built from local snapshots of every Moralis fetch
+        holder_history = pd.DataFrame(db_cache.get_metric_history("holders", "Rayls (RLS)", ["total_holders"]))
+        if len(holder_history) >= 2:
+            st.markdown('<div class="section-header">Holder Count History</div>', unsafe_allow_html=True)
+
+            fig_history = px.line(
+                holder_history,
+                x="fetched_at",
+                y="value",
+                markers=True,
+                color_discrete_sequence=["#8b5cf6"],
+            )
+
+            fig_history.update_layout(
+                title=dict(text="Total Holders Over Time", font=dict(size=16)),
+                xaxis_title="",
+                yaxis_title="Number of Holders",
+                height=350,
+                plot_bgcolor="rgba(0,0,0,0)",
+                paper_bgcolor="rgba(0,0,0,0)",
+            )
+
+            fig_history.update_yaxes(showgrid=True, gridwidth=1, gridcolor="rgba(128,128,128,0.2)")
+
+            st.plotly_chart(fig_history, width="stretch")
+            st.caption(f"Recorded from {len(holder_history)} cached fetches since {holder_history['fetched_at'].min():%Y-%m-%d}.")
+
+            st.markdown("<br>", unsafe_allow_html=True)
+
         # Holder Distribution Section (Whales, Sharks, etc.)
         holder_distribution = rayls_holders.get("holder_distribution", {})
 
@@ -2198,10 +2415,9 @@ with tab5:
     Track token trading metrics including buy/sell volume, unique wallets, and price changes. Data powered by **Moralis API**.
     """)
 
-    @st.cache_data(ttl=21600)  # Match 6-hour DB cache TTL — re-executing sooner returns stale data anyway
     def load_analytics_data():
         """Load token analytics data (DB cache -> Moralis API fallback)."""
-        return analytics.get_all_token_analytics_cached()
+        return from_startup("analytics", analytics.get_all_token_analytics_cached)
 
     with st.spinner("Loading token analytics data from Moralis..."):
         analytics_data = load_analytics_data()
@@ -2600,17 +2816,16 @@ with tab6:
     Tokens not listed on Kraken are automatically skipped.
     """)
 
-    @st.cache_data(ttl=600)
     def load_peer_comparison():
         """Load comparison data for all tokens on Kraken."""
-        return kraken_market.get_peer_comparison()
+        return from_startup("peer_comparison", kraken_market.get_peer_comparison)
 
-    @st.cache_data(ttl=600)
+    @cache_unless_error(ttl=600)
     def load_kraken_ohlc(pair, interval, limit=100):
         """Load OHLC data for a specific pair and interval."""
         return kraken_market.get_ohlc(pair=pair, interval=interval, limit=limit)
 
-    @st.cache_data(ttl=600)
+    @cache_unless_error(ttl=600)
     def load_kraken_full(pair):
         """Load full market data for a single token."""
         return kraken_market.get_all_market_data(pair)
@@ -3150,13 +3365,15 @@ with tab7:
     rayls_contract = "0xB5F7b021a78f470d31D762C1DDA05ea549904fbd"
     rayls_chain = "eth"
 
-    @st.cache_data(ttl=600)
     def load_whale_data():
-        """Load whale tracker data for Rayls."""
-        whale_transfers = etherscan.get_whale_transfers(rayls_contract, rayls_chain, min_tokens=100000, limit=50)
-        accumulation = etherscan.get_whale_accumulation_indicator(rayls_contract, rayls_chain, days=7)
-        exchange_flow = etherscan.get_exchange_flow_analysis(rayls_contract, rayls_chain, days=7)
-        return whale_transfers, accumulation, exchange_flow
+        """Load whale tracker data for Rayls (one transfer scan answers all three sections)."""
+        data = from_startup(
+            "whale_tracker",
+            lambda: etherscan.get_whale_tracker_data(rayls_contract, rayls_chain, min_tokens=100000, limit=50, days=7),
+        )
+        if "error" in data:
+            return data, data, data
+        return data["whale_transfers"], data["whale_accumulation"], data["exchange_flow"]
 
     with st.spinner("Loading whale tracker data from Etherscan..."):
         whale_transfers_data, accumulation_data, exchange_flow_data = load_whale_data()
@@ -3403,6 +3620,88 @@ with tab7:
         error_msg = exchange_flow_data.get("error", "Unknown error") if isinstance(exchange_flow_data, dict) else "Unknown error"
         st.warning(f"Unable to load exchange flow data: {error_msg}")
 
+# Hidden cache diagnostics, shown with ?diagnostics=1
+if st.query_params.get("diagnostics") == "1":
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.markdown('<div class="section-header">Cache Diagnostics</div>', unsafe_allow_html=True)
+
+    cache_stats = db_cache.get_cache_stats()
+    telemetry_snapshot = telemetry.snapshot()
+
+    def _ms(seconds):
+        return round(seconds * 1000, 2) if seconds is not None else None
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Overall Hit Rate", f"{cache_stats['total']['overall_hit_rate'] * 100:.1f}%")
+    with col2:
+        st.metric("Lookups", f"{cache_stats['total']['lookups']:,}")
+    with col3:
+        st.metric("L1 Entries", f"{cache_stats['l1_entries']:,}")
+    with col4:
+        st.metric("L1 Size", f"{cache_stats['l1_bytes'] / 1024:,.0f} KiB")
+
+    hit_rows = [
+        {
+            "Data Type": data_type,
+            "Lookups": counts["lookups"],
+            "L1 Hits": counts["l1_hits"],
+            "L2 Hits": counts["l2_hits"],
+            "Misses": counts["misses"],
+            "Hit Rate (%)": round(counts["overall_hit_rate"] * 100, 1),
+        }
+        for data_type, counts in sorted(cache_stats["by_data_type"].items())
+    ]
+    if hit_rows:
+        st.markdown("**Lookups by data type**")
+        st.dataframe(pd.DataFrame(hit_rows), width="stretch", hide_index=True)
+
+    lookup_rows = [
+        {
+            "Data Type": h["labels"]["data_type"],
+            "Tier": h["labels"]["tier"],
+            "Count": h["count"],
+            "Mean (ms)": _ms(h["sum"] / h["count"]) if h["count"] else None,
+            "p50 (ms)": _ms(h["p50"]),
+            "p95 (ms)": _ms(h["p95"]),
+            "p99 (ms)": _ms(h["p99"]),
+        }
+        for h in telemetry_snapshot["histograms"].get("cache_lookup_seconds", [])
+    ]
+    if lookup_rows:
+        st.markdown("**Lookup latency** (p-values are histogram bucket upper bounds)")
+        st.dataframe(
+            pd.DataFrame(lookup_rows).sort_values(["Data Type", "Tier"]), width="stretch", hide_index=True
+        )
+
+    fetch_outcomes = {}
+    for counter in telemetry_snapshot["counters"].get("upstream_fetches_total", []):
+        outcomes = fetch_outcomes.setdefault(counter["labels"]["data_type"], {})
+        outcomes[counter["labels"]["outcome"]] = int(counter["value"])
+    fetch_rows = []
+    for h in telemetry_snapshot["histograms"].get("upstream_fetch_seconds", []):
+        outcomes = fetch_outcomes.get(h["labels"]["data_type"], {})
+        fetch_rows.append({
+            "Data Type": h["labels"]["data_type"],
+            "Fetches": h["count"],
+            "OK": outcomes.get("ok", 0),
+            "Errors": outcomes.get("error", 0) + outcomes.get("exception", 0),
+            "Mean (ms)": _ms(h["sum"] / h["count"]) if h["count"] else None,
+            "p95 (ms)": _ms(h["p95"]),
+        })
+    if fetch_rows:
+        st.markdown("**Upstream fetches triggered by the cache**")
+        st.dataframe(pd.DataFrame(fetch_rows).sort_values("Data Type"), width="stretch", hide_index=True)
+
+    with st.expander("Raw telemetry"):
+        st.download_button(
+            "Download Prometheus metrics",
+            telemetry.render_prometheus(),
+            file_name="cache_metrics.prom",
+            mime="text/plain",
+        )
+        st.json(telemetry_snapshot, expanded=False)
+
 # Footer with refresh button
 st.markdown("<br>", unsafe_allow_html=True)
 st.divider()
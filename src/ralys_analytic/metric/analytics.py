@@ -1,7 +1,10 @@
 import os
-import requests
+import asyncio
 import streamlit as st
 from dotenv import load_dotenv
+from . import async_fetch
+from . import http_client
+from .fanout import fan_out_dict
 from .holders import TOKEN_CONTRACTS
 
 load_dotenv()
@@ -58,7 +61,7 @@ def get_token_analytics(contract_address: str, chain: str = "eth"):
     url = f"{MORALIS_API_URL}/tokens/{contract_address}/analytics?chain={chain}"
 
     try:
-        response = requests.request("GET", url, headers=get_moralis_headers(), timeout=15)
+        response = http_client.request("GET", url, headers=get_moralis_headers(), timeout=15, provider="moralis")
         data = response.json()
 
         if response.status_code == 200:
@@ -69,147 +72,113 @@ def get_token_analytics(contract_address: str, chain: str = "eth"):
         return {"error": str(e)}
 
 
+def _format_analytics_data(contract_address: str, chain: str, data: dict):
+    """Shape a raw Moralis analytics response (or {"error": ...}) for the dashboard."""
+    if "error" in data:
+        return {
+            "contract_address": contract_address,
+            "chain": chain,
+            "total_buy_volume": None,
+            "total_sell_volume": None,
+            "total_buyers": None,
+            "total_sellers": None,
+            "total_buys": None,
+            "total_sells": None,
+            "unique_wallets": None,
+            "price_percent_change": None,
+            "usd_price": None,
+            "total_liquidity_usd": None,
+            "total_fdv": None,
+            "error": data.get("error"),
+        }
+    return {
+        "contract_address": contract_address,
+        "chain": chain,
+        "total_buy_volume": data.get("totalBuyVolume", {}),
+        "total_sell_volume": data.get("totalSellVolume", {}),
+        "total_buyers": data.get("totalBuyers", {}),
+        "total_sellers": data.get("totalSellers", {}),
+        "total_buys": data.get("totalBuys", {}),
+        "total_sells": data.get("totalSells", {}),
+        "unique_wallets": data.get("uniqueWallets", {}),
+        "price_percent_change": data.get("pricePercentChange", {}),
+        "usd_price": data.get("usdPrice"),
+        "total_liquidity_usd": data.get("totalLiquidityUsd"),
+        "total_fdv": data.get("totalFullyDilutedValuation"),
+    }
+
+
 def get_all_token_analytics():
     """
     Get analytics data for all configured tokens using Moralis API.
+    Tokens are fetched concurrently, within the Moralis concurrency limit.
 
     Returns:
         Dictionary mapping token name to analytics data
     """
-    results = {}
-
-    for token_name, token_info in TOKEN_CONTRACTS.items():
+    def fetch_one(token_name, token_info):
         contract_address = token_info["address"]
         chain = token_info.get("chain", "eth")
         try:
             data = get_token_analytics(contract_address, chain)
-
-            if "error" in data:
-                results[token_name] = {
-                    "contract_address": contract_address,
-                    "chain": chain,
-                    "total_buy_volume": None,
-                    "total_sell_volume": None,
-                    "total_buyers": None,
-                    "total_sellers": None,
-                    "total_buys": None,
-                    "total_sells": None,
-                    "unique_wallets": None,
-                    "price_percent_change": None,
-                    "usd_price": None,
-                    "total_liquidity_usd": None,
-                    "total_fdv": None,
-                    "error": data.get("error"),
-                }
-            else:
-                results[token_name] = {
-                    "contract_address": contract_address,
-                    "chain": chain,
-                    "total_buy_volume": data.get("totalBuyVolume", {}),
-                    "total_sell_volume": data.get("totalSellVolume", {}),
-                    "total_buyers": data.get("totalBuyers", {}),
-                    "total_sellers": data.get("totalSellers", {}),
-                    "total_buys": data.get("totalBuys", {}),
-                    "total_sells": data.get("totalSells", {}),
-                    "unique_wallets": data.get("uniqueWallets", {}),
-                    "price_percent_change": data.get("pricePercentChange", {}),
-                    "usd_price": data.get("usdPrice"),
-                    "total_liquidity_usd": data.get("totalLiquidityUsd"),
-                    "total_fdv": data.get("totalFullyDilutedValuation"),
-                }
-
         except Exception as e:
-            results[token_name] = {
-                "contract_address": contract_address,
-                "chain": chain,
-                "total_buy_volume": None,
-                "total_sell_volume": None,
-                "total_buyers": None,
-                "total_sellers": None,
-                "total_buys": None,
-                "total_sells": None,
-                "unique_wallets": None,
-                "price_percent_change": None,
-                "usd_price": None,
-                "total_liquidity_usd": None,
-                "total_fdv": None,
-                "error": str(e),
-            }
+            data = {"error": str(e)}
+        return _format_analytics_data(contract_address, chain, data)
 
-    return results
+    return fan_out_dict(fetch_one, TOKEN_CONTRACTS, provider="moralis")
 
 
 def get_all_token_analytics_cached():
     """
     Cache-aware version of get_all_token_analytics().
-    Returns data from PostgreSQL cache if < 6 hours old,
-    otherwise fetches from Moralis and updates cache.
+    Resolves every token in one bulk cache lookup; only tokens without a
+    fresh (< 6 hours old) row are fetched from Moralis, and all fresh
+    results are stored in a single transaction.
     """
     from . import db_cache
 
+    raw_by_token = db_cache.get_or_fetch_many(
+        data_type="analytics",
+        tokens=TOKEN_CONTRACTS,
+        fetch_fn=get_token_analytics,
+        provider="moralis",
+    )
+
     results = {}
-    for token_name, token_info in TOKEN_CONTRACTS.items():
-        contract_address = token_info["address"]
-        chain = token_info.get("chain", "eth")
+    for token_name, raw in raw_by_token.items():
+        token_info = TOKEN_CONTRACTS[token_name]
+        results[token_name] = _format_analytics_data(token_info["address"], token_info.get("chain", "eth"), raw)
+    return results
 
-        try:
-            raw = db_cache.get_or_fetch(
-                data_type="analytics",
-                token_name=token_name,
-                contract_address=contract_address,
-                chain=chain,
-                fetch_fn=lambda ca=contract_address, ch=chain: get_token_analytics(ca, ch),
-            )
-
-            if "error" in raw:
-                results[token_name] = {
-                    "contract_address": contract_address,
-                    "chain": chain,
-                    "total_buy_volume": None,
-                    "total_sell_volume": None,
-                    "total_buyers": None,
-                    "total_sellers": None,
-                    "total_buys": None,
-                    "total_sells": None,
-                    "unique_wallets": None,
-                    "price_percent_change": None,
-                    "usd_price": None,
-                    "total_liquidity_usd": None,
-                    "total_fdv": None,
-                    "error": raw.get("error"),
-                }
-            else:
-                results[token_name] = {
-                    "contract_address": contract_address,
-                    "chain": chain,
-                    "total_buy_volume": raw.get("totalBuyVolume", {}),
-                    "total_sell_volume": raw.get("totalSellVolume", {}),
-                    "total_buyers": raw.get("totalBuyers", {}),
-                    "total_sellers": raw.get("totalSellers", {}),
-                    "total_buys": raw.get("totalBuys", {}),
-                    "total_sells": raw.get("totalSells", {}),
-                    "unique_wallets": raw.get("uniqueWallets", {}),
-                    "price_percent_change": raw.get("pricePercentChange", {}),
-                    "usd_price": raw.get("usdPrice"),
-                    "total_liquidity_usd": raw.get("totalLiquidityUsd"),
-                    "total_fdv": raw.get("totalFullyDilutedValuation"),
-                }
-        except Exception as e:
-            results[token_name] = {
-                "contract_address": contract_address,
-                "chain": chain,
-                "total_buy_volume": None,
-                "total_sell_volume": None,
-                "total_buyers": None,
-                "total_sellers": None,
-                "total_buys": None,
-                "total_sells": None,
-                "unique_wallets": None,
-                "price_percent_change": None,
-                "usd_price": None,
-                "total_liquidity_usd": None,
-                "total_fdv": None,
-                "error": str(e),
-            }
 
-    return results
+# Async variants: same arguments and results as the functions above
+
+async def get_token_analytics_async(contract_address: str, chain: str = "eth"):
+    url = f"{MORALIS_API_URL}/tokens/{contract_address}/analytics?chain={chain}"
+
+    try:
+        response = await async_fetch.get_json(url, provider="moralis", headers=get_moralis_headers(), timeout=15)
+        data = response.data
+
+        if response.status == 200:
+            return data
+        else:
+            return {"error": data.get("message", "Unknown error")}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def get_all_token_analytics_cached_async():
+    from . import db_cache
+
+    async def fetch_one(token_name, token_info):
+        contract_address = token_info["address"]
+        chain = token_info.get("chain", "eth")
+        raw = await db_cache.get_or_fetch_async(
+            "analytics", token_name, contract_address, chain,
+            lambda: get_token_analytics_async(contract_address, chain),
+        )
+        return _format_analytics_data(contract_address, chain, raw)
+
+    results = await asyncio.gather(*(fetch_one(name, info) for name, info in TOKEN_CONTRACTS.items()))
+    return dict(zip(TOKEN_CONTRACTS, results))
@@ -0,0 +1,245 @@
+"""
+async_fetch.py - Shared asyncio engine for the provider fetchers.
+
+    results = async_fetch.gather_all({
+        "peers": kraken_market.get_peer_comparison_async(),
+        "holders": holders.get_all_token_holders_data_cached_async(),
+        "revenue": lambda: revenue.getRevenueByChain(client, "Polygon"),
+    })
+
+The *_async fetchers run on one event loop in a background thread and share
+one aiohttp connection pool, so a page load sends every provider's requests at
+once and waits only as long as the slowest provider. Synchronous callers
+(Streamlit, scripts) drive the loop through gather_all() and run(). Plain
+callables passed to gather_all() run on the loop's thread pool next to the
+coroutines, for SDKs without an async client (DefiLlama).
+
+Requests are recorded in telemetry and passed to the http_client request
+hooks like synchronous ones. Each provider's in-flight requests are capped by
+the same fanout.PROVIDER_CONCURRENCY limits, and its request rate by the
+rate_limit buckets shared with the synchronous path. Retries and circuit
+breakers (resilience.py) and cassette record/replay (cassette.py) are shared
+with it too.
+"""
+
+import json
+import atexit
+import time
+import asyncio
+import logging
+import threading
+from typing import Optional, Dict, Any, NamedTuple, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from . import cassette
+from . import http_client
+from . import rate_limit
+from . import resilience
+from .fanout import PROVIDER_CONCURRENCY, DEFAULT_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Connections across all hosts; per host the limit matches http_client's pool
+MAX_CONNECTIONS = 64
+
+# Failures worth retrying, as http_client.TRANSIENT_ERRORS
+TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+# Only touched from the loop thread
+_session: Optional[aiohttp.ClientSession] = None
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class Response(NamedTuple):
+    status: int
+    data: Any  # decoded JSON body, None when empty
+    headers: Dict[str, str]
+
+
+def _ensure_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="async-fetch", daemon=True)
+            _loop_thread.start()
+            atexit.register(close_session)
+        return _loop
+
+
+def _session_for_loop() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS, limit_per_host=http_client.POOL_MAXSIZE, ttl_dns_cache=300
+        )
+        _session = aiohttp.ClientSession(connector=connector, headers=http_client.DEFAULT_HEADERS)
+    return _session
+
+
+def _semaphore(provider: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(provider)
+    if semaphore is None:
+        semaphore = _semaphores[provider] = asyncio.Semaphore(
+            PROVIDER_CONCURRENCY.get(provider, DEFAULT_CONCURRENCY)
+        )
+    return semaphore
+
+
+def _client_timeout(timeout: Any) -> aiohttp.ClientTimeout:
+    timeout = timeout if timeout is not None else http_client.DEFAULT_TIMEOUT
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+    return aiohttp.ClientTimeout(total=timeout)
+
+
+async def _send(
+    method: str,
+    url: str,
+    provider: Optional[str],
+    params: Optional[Dict[str, Any]],
+    headers: Optional[Dict[str, str]],
+    timeout: Any,
+    cost: float,
+) -> Tuple[Optional[int], bytes, Dict[str, str]]:
+    parts = urlsplit(url)
+    query = {k: str(v) for k, v in params.items()} if params else None
+    api_key = rate_limit.api_key_from(params, headers)
+    replaying = cassette.replaying()
+    wait = rate_limit.reserve(provider, api_key, cost) if not replaying else 0.0
+    if wait > 0:
+        await asyncio.sleep(wait)
+    semaphore = _semaphore(provider) if provider else None
+    if semaphore is not None:
+        await semaphore.acquire()
+    status = None
+    body = b""
+    start = time.perf_counter()
+    try:
+        if replaying:
+            status, response_headers, body = await cassette.replay_async(method, url, query)
+        else:
+            async with _session_for_loop().request(
+                method, url, params=query, headers=headers, timeout=_client_timeout(timeout)
+            ) as resp:
+                body = await resp.read()
+                status = resp.status
+                response_headers = dict(resp.headers)
+            if cassette.mode() == cassette.RECORD:
+                cassette.save(method, url, query, None, status, response_headers, body)
+        rate_limit.observe(provider, api_key, status, response_headers)
+    finally:
+        if semaphore is not None:
+            semaphore.release()
+        http_client.record_request(http_client.RequestTiming(
+            method=method,
+            host=parts.netloc,
+            path=parts.path,
+            status=status,
+            elapsed=time.perf_counter() - start,
+            response_bytes=len(body),
+        ))
+    return status, body, response_headers
+
+
+async def request_json(
+    method: str,
+    url: str,
+    provider: Optional[str] = None,
+    params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: Any = None,
+    cost: float = 1,
+) -> Response:
+    """
+    Send a request through the shared session and decode its JSON body.
+
+    Args:
+        method: HTTP method
+        url: Absolute URL
+        provider: Key into PROVIDER_CONCURRENCY, RATE_LIMITS and the circuit
+            breakers; None means no provider limit
+        params: Query parameters (values are sent as strings)
+        headers: Extra request headers
+        timeout: Seconds or (connect, read); http_client.DEFAULT_TIMEOUT if None
+        cost: Tokens the request takes from the provider's bucket (see
+            http_client.request())
+
+    Returns:
+        Response(status, data, headers) of the last attempt; network errors
+        raise aiohttp exceptions, resilience.CircuitOpenError is raised while
+        the provider's circuit is open, and a non-JSON body raises ValueError,
+        as resp.json() does in requests
+    """
+    # Like requests, a None header value means "don't send it" (e.g. a missing API key)
+    headers = {k: v for k, v in headers.items() if v is not None} if headers else None
+    status, body, response_headers = await resilience.call_async(
+        lambda: _send(method, url, provider, params, headers, timeout, cost),
+        provider,
+        method,
+        TRANSIENT_ERRORS,
+        lambda response: response[0],
+    )
+    return Response(status, json.loads(body) if body else None, response_headers)
+
+
+async def get_json(url: str, params: Optional[Dict[str, Any]] = None, provider: Optional[str] = None, **kwargs) -> Response:
+    """GET through the shared session; see request_json()."""
+    return await request_json("GET", url, provider=provider, params=params, **kwargs)
+
+
+def run(coro, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared loop and block until it finishes."""
+    loop = _ensure_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("async_fetch.run() called on the event loop thread; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+async def _settle(name: str, call: Any) -> Any:
+    try:
+        if asyncio.iscoroutine(call) or asyncio.isfuture(call):
+            return await call
+        return await asyncio.to_thread(call)
+    except Exception as e:
+        logger.warning(f"gather_all: {name} failed: {e}")
+        return {"error": str(e)}
+
+
+def gather_all(calls: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run every call concurrently on the shared loop and wait for all of them.
+
+    Args:
+        calls: Mapping of name to a coroutine (e.g. get_ticker_async("RLSUSD"))
+            or a zero-argument callable, which runs on a worker thread
+        timeout: Overall seconds to wait (no limit by default)
+
+    Returns:
+        {name: result} in the order of calls; a call that raised maps to
+        {"error": str}
+    """
+    async def _gather():
+        results = await asyncio.gather(*(_settle(name, call) for name, call in calls.items()))
+        return dict(zip(calls.keys(), results))
+
+    return run(_gather(), timeout)
+
+
+def close_session():
+    """Close the shared connection pool (a new one is created on demand)."""
+    global _session
+    if _loop is None or _session is None:
+        return
+    session, _session = _session, None
+    try:
+        asyncio.run_coroutine_threadsafe(session.close(), _loop).result(5)
+    except Exception as e:
+        logger.warning(f"Closing the async HTTP session failed: {e}")
@@ -1,211 +1,283 @@
-import requests
+import asyncio
 import pandas as pd
 from datetime import datetime
 
+from . import async_fetch
+from . import http_client
+from .provider_cache import cached
+
 SYMBOL = "RLSUSDT"
 BASE_URL_V1 = "https://fapi.binance.com/fapi/v1"
 BASE_URL_DATA = "https://fapi.binance.com/futures/data"
 TIMEOUT = 15
 
+# Request weight of each endpoint against the 2400/min IP budget
+# (rate_limit.RATE_LIMITS["binance"]), from Binance's USDⓈ-M futures API docs.
+# The /futures/data endpoints have their own per-request limit and are
+# charged 1 to stay on the safe side.
+WEIGHTS = {
+    "ticker/24hr": 1,  # with a symbol; 40 without
+    "fundingRate": 1,
+    "openInterest": 1,
+    "openInterestHist": 1,
+    "topLongShortPositionRatio": 1,
+    "takerlongshortRatio": 1,
+}
+
+
+def _klines_weight(limit: int) -> int:
+    """Kline weight grows with the number of candles requested."""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+# Response parsers, shared by the sync fetchers and their *_async variants
+
+def _parse_ticker_24hr(data):
+    if "code" in data:
+        return {"error": data.get("msg", str(data))}
+    return {
+        "last_price": float(data.get("lastPrice", 0)),
+        "price_change_pct": float(data.get("priceChangePercent", 0)),
+        "high": float(data.get("highPrice", 0)),
+        "low": float(data.get("lowPrice", 0)),
+        "volume": float(data.get("volume", 0)),
+        "quote_volume": float(data.get("quoteVolume", 0)),
+        "trade_count": int(data.get("count", 0)),
+        "weighted_avg_price": float(data.get("weightedAvgPrice", 0)),
+    }
+
+
+def _parse_klines(data):
+    if isinstance(data, dict) and "code" in data:
+        return {"error": data.get("msg", str(data))}
+
+    rows = []
+    for k in data:
+        rows.append({
+            "timestamp": datetime.utcfromtimestamp(k[0] / 1000),
+            "open": float(k[1]),
+            "high": float(k[2]),
+            "low": float(k[3]),
+            "close": float(k[4]),
+            "volume": float(k[5]),
+            "quote_volume": float(k[7]),
+            "trades": int(k[8]),
+            "taker_buy_vol": float(k[9]),
+        })
+    return pd.DataFrame(rows)
+
+
+def _parse_funding_rate_history(data):
+    if isinstance(data, dict) and "code" in data:
+        return {"error": data.get("msg", str(data))}
+
+    rows = []
+    for entry in data:
+        rows.append({
+            "timestamp": datetime.utcfromtimestamp(int(entry["fundingTime"]) / 1000),
+            "funding_rate": float(entry.get("fundingRate", 0)),
+            "mark_price": float(entry.get("markPrice", 0)),
+        })
+
+    if not rows:
+        return {"error": "No funding rate data available"}
+
+    df = pd.DataFrame(rows)
+    return {
+        "df": df,
+        "current_rate": df.iloc[-1]["funding_rate"] if len(df) > 0 else 0,
+        "avg_rate": df["funding_rate"].mean(),
+    }
+
 
+def _parse_open_interest(data):
+    if "code" in data:
+        return {"error": data.get("msg", str(data))}
+    return {
+        "open_interest": float(data.get("openInterest", 0)),
+    }
+
+
+def _parse_open_interest_history(data):
+    if isinstance(data, dict) and "code" in data:
+        return {"error": data.get("msg", str(data))}
+
+    rows = []
+    for entry in data:
+        rows.append({
+            "timestamp": datetime.utcfromtimestamp(int(entry["timestamp"]) / 1000),
+            "open_interest": float(entry.get("sumOpenInterest", 0)),
+            "open_interest_value": float(entry.get("sumOpenInterestValue", 0)),
+        })
+    return pd.DataFrame(rows)
+
+
+def _parse_long_short_ratio(data):
+    if isinstance(data, dict) and "code" in data:
+        return {"error": data.get("msg", str(data))}
+
+    rows = []
+    for entry in data:
+        rows.append({
+            "timestamp": datetime.utcfromtimestamp(int(entry["timestamp"]) / 1000),
+            "long_account": float(entry.get("longAccount", 0)),
+            "short_account": float(entry.get("shortAccount", 0)),
+            "long_short_ratio": float(entry.get("longShortRatio", 1)),
+        })
+
+    if not rows:
+        return {"error": "No long/short ratio data available"}
+
+    df = pd.DataFrame(rows)
+    latest_ratio = df.iloc[-1]["long_short_ratio"] if len(df) > 0 else 1.0
+    signal = "Bullish" if latest_ratio > 1.0 else ("Bearish" if latest_ratio < 1.0 else "Neutral")
+    return {
+        "df": df,
+        "latest_ratio": latest_ratio,
+        "signal": signal,
+    }
+
+
+def _parse_taker_buy_sell_ratio(data):
+    if isinstance(data, dict) and "code" in data:
+        return {"error": data.get("msg", str(data))}
+
+    rows = []
+    for entry in data:
+        rows.append({
+            "timestamp": datetime.utcfromtimestamp(int(entry["timestamp"]) / 1000),
+            "buy_sell_ratio": float(entry.get("buySellRatio", 1)),
+            "buy_vol": float(entry.get("buyVol", 0)),
+            "sell_vol": float(entry.get("sellVol", 0)),
+        })
+
+    if not rows:
+        return {"error": "No taker buy/sell data available"}
+
+    df = pd.DataFrame(rows)
+    latest_ratio = df.iloc[-1]["buy_sell_ratio"] if len(df) > 0 else 1.0
+    signal = "Bullish" if latest_ratio > 1.0 else ("Bearish" if latest_ratio < 1.0 else "Neutral")
+    return {
+        "df": df,
+        "latest_ratio": latest_ratio,
+        "signal": signal,
+    }
+
+
+@cached("binance.ticker_24hr", soft_seconds=60, hard_seconds=15 * 60)
 def get_ticker_24hr():
     """Get 24hr ticker statistics for RLSUSDT futures."""
     try:
-        resp = requests.get(
+        resp = http_client.get(
             f"{BASE_URL_V1}/ticker/24hr",
             params={"symbol": SYMBOL},
             timeout=TIMEOUT,
+            provider="binance",
+            cost=WEIGHTS["ticker/24hr"],
         )
-        data = resp.json()
-        if "code" in data:
-            return {"error": data.get("msg", str(data))}
-        return {
-            "last_price": float(data.get("lastPrice", 0)),
-            "price_change_pct": float(data.get("priceChangePercent", 0)),
-            "high": float(data.get("highPrice", 0)),
-            "low": float(data.get("lowPrice", 0)),
-            "volume": float(data.get("volume", 0)),
-            "quote_volume": float(data.get("quoteVolume", 0)),
-            "trade_count": int(data.get("count", 0)),
-            "weighted_avg_price": float(data.get("weightedAvgPrice", 0)),
-        }
+        return _parse_ticker_24hr(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("binance.klines", soft_seconds=5 * 60, hard_seconds=60 * 60)
 def get_klines(interval="1d", limit=30):
     """Get candlestick/kline data for RLSUSDT futures."""
     try:
-        resp = requests.get(
+        resp = http_client.get(
             f"{BASE_URL_V1}/klines",
             params={"symbol": SYMBOL, "interval": interval, "limit": limit},
             timeout=TIMEOUT,
+            provider="binance",
+            cost=_klines_weight(limit),
         )
-        data = resp.json()
-        if isinstance(data, dict) and "code" in data:
-            return {"error": data.get("msg", str(data))}
-
-        rows = []
-        for k in data:
-            rows.append({
-                "timestamp": datetime.utcfromtimestamp(k[0] / 1000),
-                "open": float(k[1]),
-                "high": float(k[2]),
-                "low": float(k[3]),
-                "close": float(k[4]),
-                "volume": float(k[5]),
-                "quote_volume": float(k[7]),
-                "trades": int(k[8]),
-                "taker_buy_vol": float(k[9]),
-            })
-        return pd.DataFrame(rows)
+        return _parse_klines(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("binance.funding_rate", soft_seconds=15 * 60, hard_seconds=6 * 3600)
 def get_funding_rate_history(limit=100):
     """Get funding rate history for RLSUSDT."""
     try:
-        resp = requests.get(
+        resp = http_client.get(
             f"{BASE_URL_V1}/fundingRate",
             params={"symbol": SYMBOL, "limit": limit},
             timeout=TIMEOUT,
+            provider="binance",
+            cost=WEIGHTS["fundingRate"],
         )
-        data = resp.json()
-        if isinstance(data, dict) and "code" in data:
-            return {"error": data.get("msg", str(data))}
-
-        rows = []
-        for entry in data:
-            rows.append({
-                "timestamp": datetime.utcfromtimestamp(int(entry["fundingTime"]) / 1000),
-                "funding_rate": float(entry.get("fundingRate", 0)),
-                "mark_price": float(entry.get("markPrice", 0)),
-            })
-
-        if not rows:
-            return {"error": "No funding rate data available"}
-
-        df = pd.DataFrame(rows)
-        return {
-            "df": df,
-            "current_rate": df.iloc[-1]["funding_rate"] if len(df) > 0 else 0,
-            "avg_rate": df["funding_rate"].mean(),
-        }
+        return _parse_funding_rate_history(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("binance.open_interest", soft_seconds=60, hard_seconds=15 * 60)
 def get_open_interest():
     """Get current open interest snapshot for RLSUSDT."""
     try:
-        resp = requests.get(
+        resp = http_client.get(
             f"{BASE_URL_V1}/openInterest",
             params={"symbol": SYMBOL},
             timeout=TIMEOUT,
+            provider="binance",
+            cost=WEIGHTS["openInterest"],
         )
-        data = resp.json()
-        if "code" in data:
-            return {"error": data.get("msg", str(data))}
-        return {
-            "open_interest": float(data.get("openInterest", 0)),
-        }
+        return _parse_open_interest(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("binance.open_interest_history", soft_seconds=15 * 60, hard_seconds=6 * 3600)
 def get_open_interest_history(period="1d", limit=30):
     """Get historical open interest for RLSUSDT."""
     try:
-        resp = requests.get(
+        resp = http_client.get(
             f"{BASE_URL_DATA}/openInterestHist",
             params={"symbol": SYMBOL, "period": period, "limit": limit},
             timeout=TIMEOUT,
+            provider="binance",
+            cost=WEIGHTS["openInterestHist"],
         )
-        data = resp.json()
-        if isinstance(data, dict) and "code" in data:
-            return {"error": data.get("msg", str(data))}
-
-        rows = []
-        for entry in data:
-            rows.append({
-                "timestamp": datetime.utcfromtimestamp(int(entry["timestamp"]) / 1000),
-                "open_interest": float(entry.get("sumOpenInterest", 0)),
-                "open_interest_value": float(entry.get("sumOpenInterestValue", 0)),
-            })
-        return pd.DataFrame(rows)
+        return _parse_open_interest_history(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("binance.long_short_ratio", soft_seconds=15 * 60, hard_seconds=6 * 3600)
 def get_long_short_ratio(period="1d", limit=30):
     """Get top trader long/short position ratio for RLSUSDT."""
     try:
-        resp = requests.get(
+        resp = http_client.get(
             f"{BASE_URL_DATA}/topLongShortPositionRatio",
             params={"symbol": SYMBOL, "period": period, "limit": limit},
             timeout=TIMEOUT,
+            provider="binance",
+            cost=WEIGHTS["topLongShortPositionRatio"],
         )
-        data = resp.json()
-        if isinstance(data, dict) and "code" in data:
-            return {"error": data.get("msg", str(data))}
-
-        rows = []
-        for entry in data:
-            rows.append({
-                "timestamp": datetime.utcfromtimestamp(int(entry["timestamp"]) / 1000),
-                "long_account": float(entry.get("longAccount", 0)),
-                "short_account": float(entry.get("shortAccount", 0)),
-                "long_short_ratio": float(entry.get("longShortRatio", 1)),
-            })
-
-        if not rows:
-            return {"error": "No long/short ratio data available"}
-
-        df = pd.DataFrame(rows)
-        latest_ratio = df.iloc[-1]["long_short_ratio"] if len(df) > 0 else 1.0
-        signal = "Bullish" if latest_ratio > 1.0 else ("Bearish" if latest_ratio < 1.0 else "Neutral")
-        return {
-            "df": df,
-            "latest_ratio": latest_ratio,
-            "signal": signal,
-        }
+        return _parse_long_short_ratio(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("binance.taker_buy_sell", soft_seconds=15 * 60, hard_seconds=6 * 3600)
 def get_taker_buy_sell_ratio(period="1d", limit=30):
     """Get taker buy/sell volume ratio for RLSUSDT."""
     try:
-        resp = requests.get(
+        resp = http_client.get(
             f"{BASE_URL_DATA}/takerlongshortRatio",
             params={"symbol": SYMBOL, "period": period, "limit": limit},
             timeout=TIMEOUT,
+            provider="binance",
+            cost=WEIGHTS["takerlongshortRatio"],
         )
-        data = resp.json()
-        if isinstance(data, dict) and "code" in data:
-            return {"error": data.get("msg", str(data))}
-
-        rows = []
-        for entry in data:
-            rows.append({
-                "timestamp": datetime.utcfromtimestamp(int(entry["timestamp"]) / 1000),
-                "buy_sell_ratio": float(entry.get("buySellRatio", 1)),
-                "buy_vol": float(entry.get("buyVol", 0)),
-                "sell_vol": float(entry.get("sellVol", 0)),
-            })
-
-        if not rows:
-            return {"error": "No taker buy/sell data available"}
-
-        df = pd.DataFrame(rows)
-        latest_ratio = df.iloc[-1]["buy_sell_ratio"] if len(df) > 0 else 1.0
-        signal = "Bullish" if latest_ratio > 1.0 else ("Bearish" if latest_ratio < 1.0 else "Neutral")
-        return {
-            "df": df,
-            "latest_ratio": latest_ratio,
-            "signal": signal,
-        }
+        return _parse_taker_buy_sell_ratio(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
@@ -222,6 +294,132 @@ def get_all_futures_data():
     }
 
 
+# Async variants: same arguments, cache rows and results as the functions above
+
+@cached("binance.ticker_24hr")
+async def get_ticker_24hr_async():
+    try:
+        resp = await async_fetch.get_json(
+            f"{BASE_URL_V1}/ticker/24hr",
+            params={"symbol": SYMBOL},
+            provider="binance",
+            cost=WEIGHTS["ticker/24hr"],
+            timeout=TIMEOUT,
+        )
+        return _parse_ticker_24hr(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("binance.klines")
+async def get_klines_async(interval="1d", limit=30):
+    try:
+        resp = await async_fetch.get_json(
+            f"{BASE_URL_V1}/klines",
+            params={"symbol": SYMBOL, "interval": interval, "limit": limit},
+            provider="binance",
+            cost=_klines_weight(limit),
+            timeout=TIMEOUT,
+        )
+        return _parse_klines(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("binance.funding_rate")
+async def get_funding_rate_history_async(limit=100):
+    try:
+        resp = await async_fetch.get_json(
+            f"{BASE_URL_V1}/fundingRate",
+            params={"symbol": SYMBOL, "limit": limit},
+            provider="binance",
+            cost=WEIGHTS["fundingRate"],
+            timeout=TIMEOUT,
+        )
+        return _parse_funding_rate_history(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("binance.open_interest")
+async def get_open_interest_async():
+    try:
+        resp = await async_fetch.get_json(
+            f"{BASE_URL_V1}/openInterest",
+            params={"symbol": SYMBOL},
+            provider="binance",
+            cost=WEIGHTS["openInterest"],
+            timeout=TIMEOUT,
+        )
+        return _parse_open_interest(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("binance.open_interest_history")
+async def get_open_interest_history_async(period="1d", limit=30):
+    try:
+        resp = await async_fetch.get_json(
+            f"{BASE_URL_DATA}/openInterestHist",
+            params={"symbol": SYMBOL, "period": period, "limit": limit},
+            provider="binance",
+            cost=WEIGHTS["openInterestHist"],
+            timeout=TIMEOUT,
+        )
+        return _parse_open_interest_history(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("binance.long_short_ratio")
+async def get_long_short_ratio_async(period="1d", limit=30):
+    try:
+        resp = await async_fetch.get_json(
+            f"{BASE_URL_DATA}/topLongShortPositionRatio",
+            params={"symbol": SYMBOL, "period": period, "limit": limit},
+            provider="binance",
+            cost=WEIGHTS["topLongShortPositionRatio"],
+            timeout=TIMEOUT,
+        )
+        return _parse_long_short_ratio(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("binance.taker_buy_sell")
+async def get_taker_buy_sell_ratio_async(period="1d", limit=30):
+    try:
+        resp = await async_fetch.get_json(
+            f"{BASE_URL_DATA}/takerlongshortRatio",
+            params={"symbol": SYMBOL, "period": period, "limit": limit},
+            provider="binance",
+            cost=WEIGHTS["takerlongshortRatio"],
+            timeout=TIMEOUT,
+        )
+        return _parse_taker_buy_sell_ratio(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def get_all_futures_data_async():
+    ticker, open_interest, open_interest_history, funding_rate, long_short_ratio, taker_buy_sell = await asyncio.gather(
+        get_ticker_24hr_async(),
+        get_open_interest_async(),
+        get_open_interest_history_async(),
+        get_funding_rate_history_async(),
+        get_long_short_ratio_async(),
+        get_taker_buy_sell_ratio_async(),
+    )
+    return {
+        "ticker": ticker,
+        "open_interest": open_interest,
+        "open_interest_history": open_interest_history,
+        "funding_rate": funding_rate,
+        "long_short_ratio": long_short_ratio,
+        "taker_buy_sell": taker_buy_sell,
+    }
+
+
 def compute_market_signal(data):
     """
     Compute an overall market signal from futures data.
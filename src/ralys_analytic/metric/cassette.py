@@ -0,0 +1,251 @@
+"""
+cassette.py - Record and replay provider HTTP traffic.
+
+    HTTP_CASSETTE_MODE=record streamlit run dashboard.py   # live APIs, responses saved
+    HTTP_CASSETTE_MODE=replay streamlit run dashboard.py   # offline, no API keys needed
+
+Every request sent through http_client or async_fetch passes through here.
+In record mode the live response is saved as one JSON file per request under
+HTTP_CASSETTE_DIR/<host>/. In replay mode nothing touches the network: the
+saved response is served after HTTP_CASSETTE_LATENCY_MS (default 0), and a
+request that was never recorded raises CassetteMiss. Rate limits are not
+applied while replaying, since there is no provider quota to protect.
+
+Requests are matched on method, URL, query parameters and body. API keys
+(rate_limit.API_KEY_FIELDS) are left out of the match and never written to
+disk, and request headers are not stored at all, so cassettes recorded with
+one key replay with any key or none. Calls made by SDKs with their own HTTP
+client (DefiLlama) are not captured.
+
+Requests built from the current time (the Etherscan window start, and the
+block looked up for it) would never match a recording made earlier, so
+modules read the time through now(). While recording it is frozen at the
+session's start and saved to HTTP_CASSETTE_DIR/cassette.json; replay reads
+it back, so a recording keeps replaying the same requests days later.
+"""
+
+import io
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict, Any, Iterable, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+from . import rate_limit
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+MODES = (OFF, RECORD, REPLAY)
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..", "cassettes")
+
+# Holds the clock a recording was made at, next to the per-host directories
+_MANIFEST = "cassette.json"
+
+# Left out of the match key and of the saved request
+SECRET_FIELDS = {field.lower() for field in rate_limit.API_KEY_FIELDS}
+
+# Describe the recorded transfer rather than the response; the body is stored decoded
+_DROPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode for a request that has no recording."""
+
+
+def _env_mode() -> str:
+    mode = os.getenv("HTTP_CASSETTE_MODE", OFF).strip().lower() or OFF
+    if mode not in MODES:
+        logger.error(f"Ignoring unknown HTTP_CASSETTE_MODE {mode!r} (expected one of {', '.join(MODES)})")
+        return OFF
+    return mode
+
+
+_mode = _env_mode()
+_directory = os.getenv("HTTP_CASSETTE_DIR", DEFAULT_DIR)
+_latency = float(os.getenv("HTTP_CASSETTE_LATENCY_MS", "0")) / 1000
+
+# Frozen clock of the current recording or replay, set on first use
+_clock: Optional[float] = None
+_clock_lock = threading.Lock()
+
+
+def configure(mode: Optional[str] = None, directory: Optional[str] = None, latency_ms: Optional[float] = None):
+    """Change the cassette settings at runtime (benchmarks, tests); None keeps the current value."""
+    global _mode, _directory, _latency, _clock
+    if mode is not None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}")
+        _mode = mode
+    if directory is not None:
+        _directory = directory
+    if latency_ms is not None:
+        _latency = latency_ms / 1000
+    with _clock_lock:
+        _clock = None
+
+
+def mode() -> str:
+    return _mode
+
+
+def replaying() -> bool:
+    return _mode == REPLAY
+
+
+def _manifest_path() -> str:
+    return os.path.join(_directory, _MANIFEST)
+
+
+def _start_clock() -> float:
+    """The clock for this session: now when recording (saved to the manifest), the saved one when replaying."""
+    if _mode == RECORD:
+        clock = time.time()
+        try:
+            os.makedirs(_directory, exist_ok=True)
+            with open(_manifest_path(), "w") as f:
+                json.dump({"recorded_at": clock}, f)
+        except OSError as e:
+            logger.warning(f"Could not save the recording clock to {_manifest_path()}: {e}")
+        return clock
+    try:
+        with open(_manifest_path()) as f:
+            return float(json.load(f)["recorded_at"])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"No recording clock in {_manifest_path()} ({e}); time-windowed requests may miss")
+        return time.time()
+
+
+def now() -> float:
+    """
+    Epoch seconds for building time-dependent requests.
+
+    The real time when cassettes are off; while recording or replaying, the
+    time the recording started, so the same requests are sent on every replay.
+    """
+    global _clock
+    if _mode == OFF:
+        return time.time()
+    with _clock_lock:
+        if _clock is None:
+            _clock = _start_clock()
+        return _clock
+
+
+def _public_query(pairs: Iterable[Tuple[str, Any]]) -> list:
+    return sorted((str(k), str(v)) for k, v in pairs if v is not None and str(k).lower() not in SECRET_FIELDS)
+
+
+def _request_parts(method: str, url: str, params: Optional[Dict[str, Any]], body: Optional[bytes]):
+    parts = urlsplit(url)
+    query = _public_query(parse_qsl(parts.query, keep_blank_values=True) + list((params or {}).items()))
+    base_url = f"{parts.scheme}://{parts.netloc}{parts.path}"
+    body_digest = hashlib.sha256(body).hexdigest() if body else None
+    key = hashlib.sha256(json.dumps([method.upper(), base_url, query, body_digest]).encode()).hexdigest()[:24]
+    return parts.netloc, key, base_url, query
+
+
+def _path(host: str, key: str) -> str:
+    return os.path.join(_directory, host.replace(":", "_"), f"{key}.json")
+
+
+def _body_bytes(body: Any) -> Optional[bytes]:
+    if body is None or isinstance(body, bytes):
+        return body
+    return str(body).encode()
+
+
+def save(
+    method: str,
+    url: str,
+    params: Optional[Dict[str, Any]],
+    body: Optional[bytes],
+    status: int,
+    headers: Dict[str, str],
+    content: bytes,
+):
+    """Write one interaction to the cassette directory (replacing an older recording)."""
+    host, key, base_url, query = _request_parts(method, url, params, body)
+    entry = {
+        "request": {"method": method.upper(), "url": f"{base_url}?{urlencode(query)}" if query else base_url},
+        "status": status,
+        "headers": {k: v for k, v in headers.items() if k.lower() not in _DROPPED_RESPONSE_HEADERS},
+        "recorded_at": int(time.time()),
+    }
+    try:
+        entry["body"] = content.decode("utf-8")
+    except UnicodeDecodeError:
+        entry["body_base64"] = base64.b64encode(content).decode("ascii")
+    path = _path(host, key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f, indent=1)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not record {entry['request']['url']}: {e}")
+
+
+def load(method: str, url: str, params: Optional[Dict[str, Any]], body: Optional[bytes]) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    The recorded (status, headers, content) for a request.
+
+    Raises:
+        CassetteMiss: nothing was recorded for it
+    """
+    host, key, base_url, query = _request_parts(method, url, params, body)
+    try:
+        with open(_path(host, key)) as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        shown = f"{base_url}?{urlencode(query)}" if query else base_url
+        raise CassetteMiss(f"No recording for {method.upper()} {shown} in {_directory} (record with HTTP_CASSETTE_MODE=record)")
+    if "body_base64" in entry:
+        content = base64.b64decode(entry["body_base64"])
+    else:
+        content = entry["body"].encode("utf-8")
+    return entry["status"], entry["headers"], content
+
+
+def replay(method: str, url: str, params: Optional[Dict[str, Any]] = None, body: Optional[bytes] = None):
+    """load() after the configured latency."""
+    if _latency > 0:
+        time.sleep(_latency)
+    return load(method, url, params, body)
+
+
+async def replay_async(method: str, url: str, params: Optional[Dict[str, Any]] = None, body: Optional[bytes] = None):
+    """load() after the configured latency, without blocking the event loop."""
+    if _latency > 0:
+        await asyncio.sleep(_latency)
+    return load(method, url, params, body)
+
+
+class CassetteAdapter(HTTPAdapter):
+    """requests transport adapter that records or replays per the cassette mode (a plain HTTPAdapter when off)."""
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = _body_bytes(request.body)
+        if _mode == REPLAY:
+            status, headers, content = replay(request.method, request.url, body=body)
+            raw = HTTPResponse(
+                body=io.BytesIO(content), headers=headers, status=status, preload_content=False, decode_content=False
+            )
+            return self.build_response(request, raw)
+
+        response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        if _mode == RECORD:
+            save(request.method, request.url, None, body, response.status_code, dict(response.headers), response.content)
+        return response
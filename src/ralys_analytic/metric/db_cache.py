@@ -1,54 +1,623 @@
 """
 db_cache.py - SQLite cache layer for Moralis API responses.
 
-If cached data exists and is less than 6 hours old, returns it from DB.
-Otherwise calls the Moralis API, stores the result, and returns fresh data.
+If cached data exists and is younger than its soft TTL (6 hours by default),
+returns it from DB. Between the soft and hard TTL (24 hours by default) it is
+still returned immediately, and a background worker re-fetches it
+(stale-while-revalidate). Older or missing rows block on
+the Moralis API, store the result, and return fresh data.
 Falls back gracefully to direct API calls if the database is unreachable.
+
+Concurrent misses for the same key are coalesced: one caller fetches while
+the others wait for its result, including callers in other processes that
+share cache.db (they elect a fetcher through the cache_leases table).
+
+Reads go through two tiers: an in-process L1 (cachetools TTLCache of decoded
+payloads, bounded by serialized size) and the shared SQLite L2. L2 stores
+payloads zlib-compressed, with a codec column so older plain-JSON rows still read.
+
+Each thread keeps one persistent, tuned connection (see _get_connection), so
+a cache lookup costs a single prepared-statement execution rather than a
+connect + PRAGMA round trip.
+
+TTLs are set per data_type (TTL_POLICIES, overridable from cache_config.json
+or the file named by CACHE_CONFIG_PATH), and a background janitor expires old
+rows, caps the size of the cached responses by evicting least recently used
+rows, prunes old snapshot history, and runs incremental vacuum.
+
+Every write is also appended to the snapshot history (see snapshots.py) in the
+same transaction; get_metric_history() range-queries it.
+
+Lookups, writes, upstream fetches and janitor passes are counted and timed in
+telemetry.py; get_cache_stats() summarises the lookup counters.
 """
 
 import os
 import json
+import asyncio
+import time
+import zlib
+import uuid
+import socket
 import sqlite3
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any, Callable
+from typing import Optional, Dict, Any, Awaitable, Callable, Iterable, List, NamedTuple, Tuple
+
+from cachetools import TLRUCache
+
+from . import snapshots
+from . import telemetry
+from . import transfer_store
+from .fanout import fan_out
 
 logger = logging.getLogger(__name__)
 
+# Default soft TTL: rows younger than this are fresh.
 CACHE_TTL_HOURS = 6
+# Default hard TTL: in stale-while-revalidate mode, rows between the soft and
+# hard TTL are served immediately while a background worker refreshes them.
+# Past the hard TTL the caller blocks on the upstream fetch.
+CACHE_HARD_TTL_HOURS = 24
+STALE_WHILE_REVALIDATE = True
+
+
+class TTLPolicy(NamedTuple):
+    soft_seconds: float
+    hard_seconds: float
+
+
+DEFAULT_TTL_POLICY = TTLPolicy(CACHE_TTL_HOURS * 3600, CACHE_HARD_TTL_HOURS * 3600)
+
+# Per-data_type TTLs registered by the modules that own each data type.
+# Entries from the cache config file (see _load_config) take precedence.
+TTL_POLICIES: Dict[str, TTLPolicy] = {
+    "holders": TTLPolicy(6 * 3600, 24 * 3600),
+    "analytics": TTLPolicy(6 * 3600, 24 * 3600),
+}
+_configured_policies: Dict[str, TTLPolicy] = {}
+
+# Janitor defaults, overridable from the cache config file.
+# MAX_DB_BYTES caps the api_cache rows only; the snapshot history and the
+# transfer store live in the same file but have retention limits of their own.
+MAX_DB_BYTES = 512 * 1024 * 1024
+JANITOR_INTERVAL_SECONDS = 15 * 60
+# Rows are kept this long past their hard TTL so the last good payload is
+# still around to serve while a provider is failing.
+EXPIRED_GRACE_SECONDS = 48 * 3600
+_EVICTION_BATCH = 25
+# Rough per-row cost of api_cache's fixed columns and index entries, on top
+# of the variable-length values _used_bytes() sums
+_ROW_OVERHEAD_BYTES = 128
+# Snapshot history retention (0 keeps it forever). Payloads are large and
+# only needed to back-fill new metrics; metric rows are small and back charts.
+SNAPSHOT_RETENTION_DAYS = 90
+METRIC_RETENTION_DAYS = 2 * 365
+# Stored token transfers are kept for each token's longest requested window,
+# and at least this long; past TRANSFER_MAX_ROWS rows the least recently
+# synced tokens are dropped (see transfer_store.py)
+TRANSFER_RETENTION_DAYS = 90
+TRANSFER_MAX_ROWS = 2_000_000
+# Janitor work that only one process should do at a time is leased under this data_type
+_JANITOR_LEASE = "janitor"
+_AUTO_VACUUM_INCREMENTAL = 2
+
+CACHE_STATE_FRESH = "fresh"
+CACHE_STATE_STALE = "stale"
+CACHE_STATE_REFRESHING = "refreshing"
+CACHE_STATE_EXPIRED = "expired"
+CACHE_STATE_MISSING = "missing"
+CACHE_STATE_PROVIDER_DOWN = "provider_down"
+
+# Negative caching: a failed fetch puts its key into a cool-down that doubles
+# with each consecutive failure. Until it ends, reads get the last good payload
+# (of any age) or, if there is none, the cached error - without calling the API.
+ERROR_COOLDOWN_BASE_SECONDS = 30
+ERROR_COOLDOWN_MAX_SECONDS = 30 * 60
+
+# Payload codecs for api_cache.response_data. New rows are written with
+# CACHE_CODEC; rows written before the codec column existed read as "json".
+CODEC_JSON = "json"
+CODEC_ZLIB_JSON = "zlib+json"
+CACHE_CODEC = CODEC_ZLIB_JSON
+_ZLIB_LEVEL = 6
+
+# In-process L1 tier in front of the shared SQLite L2. It holds decoded
+# payloads so a hit costs neither a query nor a json.loads. Entries are
+# weighed by their serialized size and evicted LRU once L1_MAX_BYTES is
+# reached. Cached payloads are shared between callers - treat them as read-only.
+L1_MAX_BYTES = 32 * 1024 * 1024
 
 _DB_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "..", "cache.db")
 
+# Optional JSON config read at import. Example:
+#   {"ttl": {"kraken_ticker": {"soft_seconds": 30, "hard_seconds": 300}},
+#    "max_db_mb": 256, "janitor_interval_seconds": 600,
+#    "expired_grace_seconds": 86400, "l1_max_mb": 16,
+#    "error_cooldown_base_seconds": 30, "error_cooldown_max_seconds": 1800,
+#    "snapshot_retention_days": 90, "metric_retention_days": 730,
+#    "transfer_retention_days": 90, "transfer_max_rows": 2000000}
+_CONFIG_PATH = os.getenv(
+    "CACHE_CONFIG_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "..", "cache_config.json"),
+)
+
+
+def _load_config(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Ignoring unreadable cache config {path}: {e}")
+        return {}
+
+
+def _apply_config(config: Dict[str, Any]):
+    global MAX_DB_BYTES, JANITOR_INTERVAL_SECONDS, EXPIRED_GRACE_SECONDS, L1_MAX_BYTES
+    global ERROR_COOLDOWN_BASE_SECONDS, ERROR_COOLDOWN_MAX_SECONDS
+    global SNAPSHOT_RETENTION_DAYS, METRIC_RETENTION_DAYS, TRANSFER_RETENTION_DAYS, TRANSFER_MAX_ROWS
+    for data_type, ttl in config.get("ttl", {}).items():
+        try:
+            _configured_policies[data_type] = TTLPolicy(float(ttl["soft_seconds"]), float(ttl["hard_seconds"]))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Ignoring invalid TTL config for {data_type}: {e}")
+    if "max_db_mb" in config:
+        MAX_DB_BYTES = int(float(config["max_db_mb"]) * 1024 * 1024)
+    if "janitor_interval_seconds" in config:
+        JANITOR_INTERVAL_SECONDS = float(config["janitor_interval_seconds"])
+    if "expired_grace_seconds" in config:
+        EXPIRED_GRACE_SECONDS = float(config["expired_grace_seconds"])
+    if "l1_max_mb" in config:
+        L1_MAX_BYTES = int(float(config["l1_max_mb"]) * 1024 * 1024)
+    if "error_cooldown_base_seconds" in config:
+        ERROR_COOLDOWN_BASE_SECONDS = float(config["error_cooldown_base_seconds"])
+    if "error_cooldown_max_seconds" in config:
+        ERROR_COOLDOWN_MAX_SECONDS = float(config["error_cooldown_max_seconds"])
+    if "snapshot_retention_days" in config:
+        SNAPSHOT_RETENTION_DAYS = float(config["snapshot_retention_days"])
+    if "metric_retention_days" in config:
+        METRIC_RETENTION_DAYS = float(config["metric_retention_days"])
+    if "transfer_retention_days" in config:
+        TRANSFER_RETENTION_DAYS = float(config["transfer_retention_days"])
+    if "transfer_max_rows" in config:
+        TRANSFER_MAX_ROWS = int(config["transfer_max_rows"])
+
+
+_apply_config(_load_config(_CONFIG_PATH))
+
+
+def register_ttl_policy(data_type: str, soft_seconds: float, hard_seconds: float):
+    """Set the default TTLs for a data_type (the config file still wins)."""
+    TTL_POLICIES[data_type] = TTLPolicy(float(soft_seconds), float(hard_seconds))
+
+
+def get_ttl_policy(data_type: str) -> TTLPolicy:
+    return _configured_policies.get(data_type) or TTL_POLICIES.get(data_type) or DEFAULT_TTL_POLICY
+
+# Connection tuning. With WAL, readers never block the writer and
+# synchronous=NORMAL is still crash-safe (at most the last commit rolls back).
+_PRAGMAS = (
+    # Only takes effect on a new file (it must precede journal_mode, which
+    # writes the header); existing files are switched by the janitor
+    "PRAGMA auto_vacuum=INCREMENTAL;",
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",  # 256 MiB memory-mapped reads
+    "PRAGMA cache_size=-16000;",    # ~16 MiB page cache per connection
+)
+
+# Size of sqlite3's per-connection prepared statement cache. All SQL below is
+# kept in module constants so each statement is compiled once per connection.
+_STATEMENT_CACHE_SIZE = 64
+
+_local = threading.local()
+
+# Background refreshes for stale rows. Each worker thread gets its own pooled
+# connection through _get_connection().
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="db-cache-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# Single-flight coordination for misses. Within a process the first caller for
+# a key becomes the leader and concurrent callers wait on its Future; across
+# processes sharing cache.db the leader must also hold the key's lease row.
+LEASE_SECONDS = 60
+LEASE_WAIT_SECONDS = 45
+_LEASE_POLL_SECONDS = 0.25
+_LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_inflight: Dict[Tuple[str, str], Future] = {}
+_inflight_lock = threading.Lock()
+# Leases held with acquire_lease(): the lease row only tells processes apart,
+# so threads of this process also take the key's lock
+_lease_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_lease_locks_lock = threading.Lock()
+
+# Keys read since the janitor last ran -> last access time (epoch seconds).
+# Flushed to api_cache.last_accessed_at in batches rather than writing on every read.
+_accessed: Dict[Tuple[str, str], float] = {}
+_accessed_lock = threading.Lock()
+
+_janitor_thread: Optional[threading.Thread] = None
+_janitor_lock = threading.Lock()
+
+
+class _L1Entry(NamedTuple):
+    data: Dict[str, Any]
+    fetched_at: str
+    size: int
+
+
+def _l1_ttu(key: Tuple[str, str], entry: _L1Entry, now: float) -> float:
+    # Keep an entry in L1 until its data_type's hard TTL would expire it in L2
+    return now + get_ttl_policy(key[0]).hard_seconds
+
+
+_l1 = TLRUCache(maxsize=L1_MAX_BYTES, ttu=_l1_ttu, getsizeof=lambda entry: entry.size)
+_l1_lock = threading.Lock()
+
+telemetry.register_gauge("cache_l1_entries", lambda: {(): len(_l1)})
+telemetry.register_gauge("cache_l1_bytes", lambda: {(): _l1.currsize})
+
+_CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS api_cache (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    data_type        TEXT NOT NULL,
+    token_name       TEXT NOT NULL,
+    contract_address TEXT NOT NULL,
+    chain            TEXT NOT NULL,
+    response_data    TEXT NOT NULL,  -- str for "json", BLOB for compressed codecs
+    fetched_at       TEXT NOT NULL,
+    codec            TEXT NOT NULL DEFAULT 'json',
+    last_accessed_at REAL,
+    UNIQUE (data_type, token_name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_cache_lookup
+    ON api_cache (data_type, token_name);
+
+CREATE INDEX IF NOT EXISTS idx_cache_freshness
+    ON api_cache (data_type, fetched_at);
+
+CREATE TABLE IF NOT EXISTS cache_leases (
+    data_type  TEXT NOT NULL,
+    token_name TEXT NOT NULL,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (data_type, token_name)
+);
+
+CREATE TABLE IF NOT EXISTS fetch_failures (
+    data_type     TEXT NOT NULL,
+    token_name    TEXT NOT NULL,
+    error         TEXT NOT NULL,
+    failure_count INTEGER NOT NULL,
+    failed_at     REAL NOT NULL,
+    retry_after   REAL NOT NULL,
+    PRIMARY KEY (data_type, token_name)
+);
+"""
+
+_SELECT_FRESH_SQL = """
+SELECT response_data, codec, fetched_at
+FROM api_cache
+WHERE data_type = ? AND token_name = ? AND fetched_at > ?
+LIMIT 1;
+"""
+
+_UPSERT_SQL = """
+INSERT INTO api_cache (data_type, token_name, contract_address, chain, response_data, codec, fetched_at, last_accessed_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (data_type, token_name)
+DO UPDATE SET
+    response_data = excluded.response_data,
+    codec = excluded.codec,
+    last_accessed_at = excluded.last_accessed_at,
+    contract_address = excluded.contract_address,
+    chain = excluded.chain,
+    fetched_at = excluded.fetched_at;
+"""
+
+# Takes the lease when it is free, expired, or already ours; rowcount is 0 otherwise
+_ACQUIRE_LEASE_SQL = """
+INSERT INTO cache_leases (data_type, token_name, owner, expires_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (data_type, token_name)
+DO UPDATE SET
+    owner = excluded.owner,
+    expires_at = excluded.expires_at
+WHERE cache_leases.expires_at < ? OR cache_leases.owner = excluded.owner;
+"""
+
+_RELEASE_LEASE_SQL = """
+DELETE FROM cache_leases
+WHERE data_type = ? AND token_name = ? AND owner = ?;
+"""
+
+# Cool-down doubles per consecutive failure: base * 2^(n-1), capped
+_RECORD_FAILURE_SQL = """
+INSERT INTO fetch_failures (data_type, token_name, error, failure_count, failed_at, retry_after)
+VALUES (?, ?, ?, 1, ?, ?)
+ON CONFLICT (data_type, token_name)
+DO UPDATE SET
+    error = excluded.error,
+    failure_count = fetch_failures.failure_count + 1,
+    failed_at = excluded.failed_at,
+    retry_after = excluded.failed_at + MIN(? * (1 << MIN(fetch_failures.failure_count, 20)), ?);
+"""
+
+_CLEAR_FAILURE_SQL = """
+DELETE FROM fetch_failures
+WHERE data_type = ? AND token_name = ?;
+"""
+
+# Upper bound on "?" placeholders per IN (...) list, well under SQLite's limit
+_MAX_IN_PARAMS = 500
+
+# Size of an api_cache row as the size cap counts it: its variable-length
+# values plus a fixed overhead (bound to the ?) for the rest of the row
+_ROW_BYTES = (
+    "LENGTH(response_data) + LENGTH(data_type) + LENGTH(token_name)"
+    " + LENGTH(contract_address) + LENGTH(chain) + LENGTH(fetched_at) + ?"
+)
+
+_SELECT_USED_BYTES_SQL = f"SELECT COALESCE(SUM({_ROW_BYTES}), 0) FROM api_cache;"
+
+_SELECT_LRU_SQL = f"""
+SELECT id, {_ROW_BYTES} FROM api_cache
+ORDER BY last_accessed_at ASC
+LIMIT ?;
+"""
+
+_SELECT_FETCHED_AT_SQL = """
+SELECT fetched_at FROM api_cache
+WHERE data_type = ? AND token_name = ?
+LIMIT 1;
+"""
+
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=10, cached_statements=_STATEMENT_CACHE_SIZE)
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 
 def _get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(_DB_PATH, timeout=10)
-    conn.execute("PRAGMA journal_mode=WAL;")
+    """
+    Return the calling thread's persistent connection to the cache database.
+
+    Streamlit runs each session on its own script thread, so one connection
+    per thread never shares a handle across threads while paying the
+    connect + PRAGMA setup only once. Callers must not close it.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.db_path == _DB_PATH:
+        return conn
+    if conn is not None:
+        # _DB_PATH was repointed (e.g. by a benchmark) - reopen against the new file
+        close_connection()
+
+    conn = _open_connection(_DB_PATH)
+    _local.conn = conn
+    _local.db_path = _DB_PATH
     return conn
 
 
-def initialize_tables():
-    create_sql = """
-    CREATE TABLE IF NOT EXISTS api_cache (
-        id               INTEGER PRIMARY KEY AUTOINCREMENT,
-        data_type        TEXT NOT NULL,
-        token_name       TEXT NOT NULL,
-        contract_address TEXT NOT NULL,
-        chain            TEXT NOT NULL,
-        response_data    TEXT NOT NULL,
-        fetched_at       TEXT NOT NULL,
-        UNIQUE (data_type, token_name)
-    );
+def close_connection():
+    """Close the calling thread's cache connection, if it has one."""
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Failed to close cache connection: {e}")
+
+
+def _cutoff(seconds: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+
+
+def _soft_cutoff(data_type: str) -> str:
+    return _cutoff(get_ttl_policy(data_type).soft_seconds)
+
+
+def _hard_cutoff(data_type: str) -> str:
+    return _cutoff(get_ttl_policy(data_type).hard_seconds)
+
+
+def _read_cutoff(data_type: str, swr: bool) -> str:
+    """Oldest fetched_at a read may serve: the hard TTL in SWR mode, else the soft TTL."""
+    return _hard_cutoff(data_type) if swr else _soft_cutoff(data_type)
 
-    CREATE INDEX IF NOT EXISTS idx_cache_lookup
-        ON api_cache (data_type, token_name);
 
-    CREATE INDEX IF NOT EXISTS idx_cache_freshness
-        ON api_cache (data_type, fetched_at);
+def _encode(data: Dict[str, Any]) -> Tuple[Any, str, int]:
+    """Serialize data with CACHE_CODEC. Returns (payload, codec, json_size)."""
+    text = json.dumps(data, separators=(",", ":"))
+    if CACHE_CODEC == CODEC_ZLIB_JSON:
+        compressed = zlib.compress(text.encode("utf-8"), _ZLIB_LEVEL)
+        # Tiny payloads (e.g. {"error": ...}) can grow under zlib
+        if len(compressed) < len(text):
+            return compressed, CODEC_ZLIB_JSON, len(text)
+    return text, CODEC_JSON, len(text)
+
+
+def _decode(payload: Any, codec: str) -> Tuple[Dict[str, Any], int]:
+    """Inverse of _encode(). Returns (data, json_size)."""
+    if codec == CODEC_ZLIB_JSON:
+        text = zlib.decompress(payload)
+    elif codec == CODEC_JSON:
+        text = payload
+    else:
+        raise ValueError(f"Unknown cache codec: {codec}")
+    return json.loads(text), len(text)
+
+
+def _l1_get(data_type: str, token_name: str) -> Optional[_L1Entry]:
+    with _l1_lock:
+        return _l1.get((data_type, token_name))
+
+
+def _l1_put(data_type: str, token_name: str, data: Dict[str, Any], fetched_at: str, size: int):
+    with _l1_lock:
+        try:
+            _l1[(data_type, token_name)] = _L1Entry(data, fetched_at, size)
+        except ValueError:
+            # Larger than the whole L1 budget - serve it from L2 only
+            _l1.pop((data_type, token_name), None)
+
+
+def clear_l1():
+    """Drop every in-process (L1) entry; SQLite (L2) is untouched."""
+    with _l1_lock:
+        _l1.clear()
+
+
+def _touch(data_type: str, token_names: Iterable[str]):
+    now = time.time()
+    with _accessed_lock:
+        for token_name in token_names:
+            _accessed[(data_type, token_name)] = now
+
+
+_TIER_KEYS = {"l1": "l1_hits", "l2": "l2_hits", "miss": "misses"}
+
+
+def _record(data_type: str, l1_hits: int = 0, l2_hits: int = 0, misses: int = 0):
+    for tier, n in (("l1", l1_hits), ("l2", l2_hits), ("miss", misses)):
+        if n:
+            telemetry.inc("cache_lookups_total", n, data_type=data_type, tier=tier)
+
+
+def _record_served(data_type: str, tier: str, size: int, start: float):
+    telemetry.observe("cache_lookup_seconds", time.perf_counter() - start, data_type=data_type, tier=tier)
+    telemetry.inc("cache_bytes_served_total", size, data_type=data_type, tier=tier)
+
+
+def _with_rates(counts: Dict[str, int]) -> Dict[str, Any]:
+    lookups = counts["l1_hits"] + counts["l2_hits"] + counts["misses"]
+    l2_lookups = lookups - counts["l1_hits"]
+    return {
+        **counts,
+        "lookups": lookups,
+        # Share of all lookups answered from memory
+        "l1_hit_rate": round(counts["l1_hits"] / lookups, 4) if lookups else 0.0,
+        # Share of lookups that reached SQLite and were answered there
+        "l2_hit_rate": round(counts["l2_hits"] / l2_lookups, 4) if l2_lookups else 0.0,
+        "overall_hit_rate": round((counts["l1_hits"] + counts["l2_hits"]) / lookups, 4) if lookups else 0.0,
+    }
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Return L1/L2 hit counters and rates since process start.
+
+    Returns:
+        {"total": {...}, "by_data_type": {data_type: {...}}, "l1_entries": int, "l1_bytes": int}
     """
+    by_type: Dict[str, Dict[str, int]] = {}
+    for labels, value in telemetry.counter_values("cache_lookups_total"):
+        counts = by_type.setdefault(labels["data_type"], {"l1_hits": 0, "l2_hits": 0, "misses": 0})
+        counts[_TIER_KEYS[labels["tier"]]] += int(value)
+    total = {"l1_hits": 0, "l2_hits": 0, "misses": 0}
+    for counts in by_type.values():
+        for k in total:
+            total[k] += counts[k]
+    with _l1_lock:
+        l1_entries = len(_l1)
+        l1_bytes = _l1.currsize
+    return {
+        "total": _with_rates(total),
+        "by_data_type": {data_type: _with_rates(counts) for data_type, counts in by_type.items()},
+        "l1_entries": l1_entries,
+        "l1_bytes": l1_bytes,
+    }
+
+
+def _lookup(
+    data_type: str, token_name: str, cutoff: str, record: bool = True
+) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    Return (data, fetched_at) for a row fetched after cutoff, checking L1 then L2.
+
+    L1 only answers for fresh entries; a stale L1 entry falls through to L2 in
+    case another process has refreshed the row since.
+    """
+    start = time.perf_counter()
+    entry = _l1_get(data_type, token_name)
+    if entry is not None and entry.fetched_at > _soft_cutoff(data_type):
+        if record:
+            _record(data_type, l1_hits=1)
+            _record_served(data_type, "l1", entry.size, start)
+            _touch(data_type, [token_name])
+        return entry.data, entry.fetched_at
+
+    row = _get_connection().execute(_SELECT_FRESH_SQL, (data_type, token_name, cutoff)).fetchone()
+    if row is None:
+        if record:
+            _record(data_type, misses=1)
+            telemetry.observe("cache_lookup_seconds", time.perf_counter() - start, data_type=data_type, tier="miss")
+        return None
+
+    response_data, codec, fetched_at = row
+    data, size = _decode(response_data, codec)
+    _l1_put(data_type, token_name, data, fetched_at, size)
+    if record:
+        _record(data_type, l2_hits=1)
+        _record_served(data_type, "l2", size, start)
+        _touch(data_type, [token_name])
+    return data, fetched_at
+
+
+def _migrate_schema(conn: sqlite3.Connection):
+    """Add columns introduced after a cache.db was first created."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(api_cache);")}
+    if "codec" not in columns:
+        with conn:
+            conn.execute(f"ALTER TABLE api_cache ADD COLUMN codec TEXT NOT NULL DEFAULT '{CODEC_JSON}';")
+        logger.info("Added codec column to api_cache (existing rows read as plain JSON)")
+    if "last_accessed_at" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE api_cache ADD COLUMN last_accessed_at REAL;")
+        logger.info("Added last_accessed_at column to api_cache")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON api_cache (last_accessed_at);")
+
+
+def _enable_incremental_vacuum(conn: sqlite3.Connection):
+    """
+    Switch a cache.db created before auto_vacuum was set over to incremental vacuum.
+
+    That takes one full VACUUM, which rewrites the file and needs it to
+    itself, so it runs from the janitor rather than initialize_tables(): one
+    process does it under a lease, and if the database is busy it is left for
+    a later pass.
+    """
+    if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] == _AUTO_VACUUM_INCREMENTAL:
+        return
+    if not _try_acquire_lease(_JANITOR_LEASE, "auto_vacuum"):
+        return
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("VACUUM;")
+        logger.info("Enabled incremental auto_vacuum on cache database")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Could not VACUUM cache database to enable incremental auto_vacuum, retrying next pass: {e}")
+    finally:
+        _release_leases(_JANITOR_LEASE, ["auto_vacuum"])
+
+
+def initialize_tables():
     try:
         conn = _get_connection()
-        conn.executescript(create_sql)
-        conn.close()
+        conn.executescript(_CREATE_SQL)
+        snapshots.create_tables(conn)
+        transfer_store.create_tables(conn)
+        _migrate_schema(conn)
         logger.info("Cache tables initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize cache tables: {e}")
@@ -56,21 +625,11 @@ def initialize_tables():
 
 
 def get_cached_data(data_type: str, token_name: str) -> Optional[Dict[str, Any]]:
-    cutoff = (datetime.now(timezone.utc) - timedelta(hours=CACHE_TTL_HOURS)).isoformat()
-    query = """
-    SELECT response_data, fetched_at
-    FROM api_cache
-    WHERE data_type = ? AND token_name = ? AND fetched_at > ?
-    LIMIT 1;
-    """
     try:
-        conn = _get_connection()
-        cur = conn.execute(query, (data_type, token_name, cutoff))
-        row = cur.fetchone()
-        conn.close()
-        if row:
-            logger.info(f"Cache HIT for {data_type}/{token_name} (fetched at {row[1]})")
-            return json.loads(row[0])
+        hit = _lookup(data_type, token_name, _soft_cutoff(data_type))
+        if hit:
+            logger.info(f"Cache HIT for {data_type}/{token_name} (fetched at {hit[1]})")
+            return hit[0]
         else:
             logger.info(f"Cache MISS for {data_type}/{token_name}")
             return None
@@ -86,73 +645,907 @@ def update_cache(
     chain: str,
     data: Dict[str, Any],
 ) -> bool:
-    now = datetime.now(timezone.utc).isoformat()
-    upsert_sql = """
-    INSERT INTO api_cache (data_type, token_name, contract_address, chain, response_data, fetched_at)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ON CONFLICT (data_type, token_name)
-    DO UPDATE SET
-        response_data = excluded.response_data,
-        contract_address = excluded.contract_address,
-        chain = excluded.chain,
-        fetched_at = excluded.fetched_at;
-    """
+    now_ts = round(time.time(), 6)  # microseconds, so datetime round trips match exactly
+    now = datetime.fromtimestamp(now_ts, timezone.utc).isoformat()
+    start = time.perf_counter()
     try:
+        payload, codec, size = _encode(data)
         conn = _get_connection()
-        conn.execute(
-            upsert_sql,
-            (data_type, token_name, contract_address, chain, json.dumps(data), now),
-        )
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute(
+                _UPSERT_SQL,
+                (data_type, token_name, contract_address, chain, payload, codec, now, now_ts),
+            )
+            conn.execute(_CLEAR_FAILURE_SQL, (data_type, token_name))
+            snapshots.append(conn, data_type, [(token_name, now_ts, payload, codec, data)])
+        _l1_put(data_type, token_name, data, now, size)
+        _record_write(data_type, 1, len(payload), start)
         logger.info(f"Cache UPDATED for {data_type}/{token_name}")
         return True
     except Exception as e:
+        telemetry.inc("cache_write_errors_total", data_type=data_type)
         logger.error(f"Cache write failed for {data_type}/{token_name}: {e}")
         return False
 
 
+def _record_write(data_type: str, rows: int, stored_bytes: int, start: float):
+    telemetry.observe("cache_write_seconds", time.perf_counter() - start, data_type=data_type)
+    telemetry.inc("cache_writes_total", rows, data_type=data_type)
+    telemetry.inc("cache_bytes_written_total", stored_bytes, data_type=data_type)
+
+
 def get_cache_fetched_at(data_type: str, token_name: str) -> Optional[str]:
     """Return the fetched_at ISO timestamp for a cached entry, or None if not found."""
-    query = """
-    SELECT fetched_at FROM api_cache
-    WHERE data_type = ? AND token_name = ?
-    LIMIT 1;
-    """
     try:
         conn = _get_connection()
-        cur = conn.execute(query, (data_type, token_name))
-        row = cur.fetchone()
-        conn.close()
+        row = conn.execute(_SELECT_FETCHED_AT_SQL, (data_type, token_name)).fetchone()
         return row[0] if row else None
     except Exception as e:
         logger.error(f"Cache fetched_at lookup failed for {data_type}/{token_name}: {e}")
         return None
 
 
-def get_or_fetch(
+def _chunks(items: List[str], size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _select_many(
+    data_type: str, names: List[str], cutoff: str, record: bool = True
+) -> Dict[str, Tuple[Dict[str, Any], str]]:
+    """
+    Bulk _lookup(): return {token_name: (data, fetched_at)} for rows fetched
+    after cutoff. Fresh L1 entries are served from memory and only the
+    remaining names are queried from SQLite.
+    """
+    start = time.perf_counter()
+    soft_cutoff = _soft_cutoff(data_type)
+    rows = {}
+    l1_bytes = l2_bytes = 0
+    for name in names:
+        entry = _l1_get(data_type, name)
+        if entry is not None and entry.fetched_at > soft_cutoff:
+            rows[name] = (entry.data, entry.fetched_at)
+            l1_bytes += entry.size
+    l1_hits = len(rows)
+
+    remaining = [name for name in names if name not in rows]
+    conn = _get_connection()
+    for chunk in _chunks(remaining, _MAX_IN_PARAMS):
+        placeholders = ", ".join("?" * len(chunk))
+        query = (
+            "SELECT token_name, response_data, codec, fetched_at FROM api_cache "
+            f"WHERE data_type = ? AND fetched_at > ? AND token_name IN ({placeholders});"
+        )
+        for token_name, response_data, codec, fetched_at in conn.execute(query, (data_type, cutoff, *chunk)):
+            data, size = _decode(response_data, codec)
+            _l1_put(data_type, token_name, data, fetched_at, size)
+            rows[token_name] = (data, fetched_at)
+            l2_bytes += size
+
+    if record:
+        l2_hits = len(rows) - l1_hits
+        _record(data_type, l1_hits=l1_hits, l2_hits=l2_hits, misses=len(names) - len(rows))
+        telemetry.observe("cache_bulk_lookup_seconds", time.perf_counter() - start, data_type=data_type)
+        if l1_bytes:
+            telemetry.inc("cache_bytes_served_total", l1_bytes, data_type=data_type, tier="l1")
+        if l2_bytes:
+            telemetry.inc("cache_bytes_served_total", l2_bytes, data_type=data_type, tier="l2")
+        _touch(data_type, rows.keys())
+    return rows
+
+
+def get_many(data_type: str, token_names: Iterable[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """
+    Look up every token of a data_type in one query.
+
+    Returns:
+        (hits, misses) - hits maps token name to cached data for fresh rows,
+        misses lists the token names the caller still has to fetch, in input order.
+    """
+    names = list(dict.fromkeys(token_names))
+    if not names:
+        return {}, []
+
+    try:
+        rows = _select_many(data_type, names, _soft_cutoff(data_type))
+    except Exception as e:
+        logger.error(f"Bulk cache read failed for {data_type}: {e}")
+        return {}, names
+
+    hits = {name: data for name, (data, _) in rows.items()}
+    misses = [name for name in names if name not in hits]
+    logger.info(f"Cache bulk lookup for {data_type}: {len(hits)} HIT, {len(misses)} MISS")
+    return hits, misses
+
+
+def put_many(data_type: str, entries: Iterable[Tuple[str, str, str, Dict[str, Any]]]) -> bool:
+    """
+    Store several fresh results for a data_type in a single transaction.
+
+    Args:
+        data_type: Cache data type (e.g. "holders")
+        entries: (token_name, contract_address, chain, data) tuples
+
+    Returns:
+        True if the transaction committed
+    """
+    now_ts = round(time.time(), 6)  # microseconds, so datetime round trips match exactly
+    now = datetime.fromtimestamp(now_ts, timezone.utc).isoformat()
+    start = time.perf_counter()
+    rows = []
+    snapshot_entries = []
+    l1_entries = []
+    for token_name, contract_address, chain, data in entries:
+        payload, codec, size = _encode(data)
+        rows.append((data_type, token_name, contract_address, chain, payload, codec, now, now_ts))
+        snapshot_entries.append((token_name, now_ts, payload, codec, data))
+        l1_entries.append((token_name, data, size))
+    if not rows:
+        return True
+    try:
+        conn = _get_connection()
+        with conn:
+            conn.executemany(_UPSERT_SQL, rows)
+            conn.executemany(_CLEAR_FAILURE_SQL, [(data_type, row[1]) for row in rows])
+            snapshots.append(conn, data_type, snapshot_entries)
+        for token_name, data, size in l1_entries:
+            _l1_put(data_type, token_name, data, now, size)
+        _record_write(data_type, len(rows), sum(len(row[4]) for row in rows), start)
+        logger.info(f"Cache UPDATED {len(rows)} rows for {data_type}")
+        return True
+    except Exception as e:
+        telemetry.inc("cache_write_errors_total", data_type=data_type)
+        logger.error(f"Bulk cache write failed for {data_type}: {e}")
+        return False
+
+
+def _to_epoch(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def get_metric_history(
+    data_type: str,
+    token_name: str,
+    metrics: Optional[List[str]] = None,
+    since: Any = None,
+    until: Any = None,
+) -> List[Dict[str, Any]]:
+    """
+    Time series of snapshot metrics recorded on every cache write.
+
+    Args:
+        data_type: Cache data type (e.g. "holders")
+        token_name: Token key (e.g. "Rayls (RLS)")
+        metrics: Metric names such as "total_holders" (all metrics if None)
+        since: Lower bound - datetime, ISO string or epoch seconds (naive = UTC)
+        until: Upper bound, same formats
+
+    Returns:
+        List of {"metric", "fetched_at" (aware UTC datetime), "value"} dicts,
+        ordered by metric then time. Empty on error.
+    """
+    try:
+        rows = snapshots.query_metrics(
+            _get_connection(), data_type, token_name, metrics, _to_epoch(since), _to_epoch(until)
+        )
+    except Exception as e:
+        logger.error(f"Metric history query failed for {data_type}/{token_name}: {e}")
+        return []
+    return [
+        {"metric": metric, "fetched_at": datetime.fromtimestamp(fetched_at, timezone.utc), "value": value}
+        for metric, fetched_at, value in rows
+    ]
+
+
+def _is_error(data: Any) -> bool:
+    return not data or (isinstance(data, dict) and "error" in data)
+
+
+def _record_failure(data_type: str, token_name: str, error: Any):
+    now = time.time()
+    try:
+        conn = _get_connection()
+        with conn:
+            conn.execute(
+                _RECORD_FAILURE_SQL,
+                (
+                    data_type, token_name, str(error), now, now + ERROR_COOLDOWN_BASE_SECONDS,
+                    ERROR_COOLDOWN_BASE_SECONDS, ERROR_COOLDOWN_MAX_SECONDS,
+                ),
+            )
+        logger.warning(f"Fetch FAILED for {data_type}/{token_name}, cooling down: {error}")
+    except Exception as e:
+        logger.error(f"Failed to record fetch failure for {data_type}/{token_name}: {e}")
+
+
+def _cooldowns(data_type: str, token_names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Return {token_name: {"error", "retry_at", "failure_count"}} for keys still cooling down."""
+    cooling = {}
+    try:
+        conn = _get_connection()
+        for chunk in _chunks(token_names, _MAX_IN_PARAMS):
+            placeholders = ", ".join("?" * len(chunk))
+            query = (
+                "SELECT token_name, error, retry_after, failure_count FROM fetch_failures "
+                f"WHERE data_type = ? AND retry_after > ? AND token_name IN ({placeholders});"
+            )
+            for token_name, error, retry_after, failure_count in conn.execute(query, (data_type, time.time(), *chunk)):
+                cooling[token_name] = {"error": error, "retry_at": retry_after, "failure_count": failure_count}
+    except Exception as e:
+        logger.error(f"Cool-down lookup failed for {data_type}: {e}")
+    return cooling
+
+
+def _serve_degraded(data_type: str, token_name: str, error: Any) -> Dict[str, Any]:
+    """Last good payload of any age for a failing key, else the error itself."""
+    try:
+        hit = _lookup(data_type, token_name, "", record=False)
+    except Exception:
+        hit = None
+    if hit:
+        telemetry.inc("cache_degraded_served_total", data_type=data_type, served="last_good")
+        logger.info(f"Provider down for {data_type}/{token_name}, serving last good payload from {hit[1]}")
+        return hit[0]
+    telemetry.inc("cache_degraded_served_total", data_type=data_type, served="error")
+    return {"error": str(error)}
+
+
+def _call_upstream(data_type: str, fetch_fn: Callable[..., Any], *args) -> Any:
+    """Run fetch_fn(*args), counting and timing the upstream call by outcome."""
+    start = time.perf_counter()
+    outcome = "exception"
+    try:
+        result = fetch_fn(*args)
+        outcome = "error" if _is_error(result) else "ok"
+        return result
+    finally:
+        telemetry.observe("upstream_fetch_seconds", time.perf_counter() - start, data_type=data_type)
+        telemetry.inc("upstream_fetches_total", data_type=data_type, outcome=outcome)
+
+
+async def _call_upstream_async(data_type: str, fetch_fn: Callable[[], Awaitable[Any]]) -> Any:
+    """_call_upstream() for a coroutine fetcher."""
+    start = time.perf_counter()
+    outcome = "exception"
+    try:
+        result = await fetch_fn()
+        outcome = "error" if _is_error(result) else "ok"
+        return result
+    finally:
+        telemetry.observe("upstream_fetch_seconds", time.perf_counter() - start, data_type=data_type)
+        telemetry.inc("upstream_fetches_total", data_type=data_type, outcome=outcome)
+
+
+def _use_swr(stale_while_revalidate: Optional[bool]) -> bool:
+    return STALE_WHILE_REVALIDATE if stale_while_revalidate is None else stale_while_revalidate
+
+
+def refresh(
     data_type: str,
     token_name: str,
     contract_address: str,
     chain: str,
     fetch_fn: Callable[[], Dict[str, Any]],
-) -> Dict[str, Any]:
-    # Try cache first
+) -> bool:
+    """
+    Re-fetch one row now and store it, whatever its age.
+
+    Skipped while the key's provider is cooling down or another process holds
+    its lease. Used for background refreshes and by warm_cache.py.
+
+    Returns:
+        True if fresh data was fetched and stored
+    """
+    if _cooldowns(data_type, [token_name]):
+        telemetry.inc("cache_refreshes_total", data_type=data_type, outcome="cooling_down")
+        logger.info(f"Provider cooling down for {data_type}/{token_name}, skipping refresh")
+        return False
+    if not _try_acquire_lease(data_type, token_name):
+        telemetry.inc("cache_refreshes_total", data_type=data_type, outcome="leased_elsewhere")
+        logger.info(f"Another process is refreshing {data_type}/{token_name}, skipping")
+        return False
+    telemetry.inc("cache_refreshes_total", data_type=data_type, outcome="fetched")
+    try:
+        fresh_data = _call_upstream(data_type, fetch_fn)
+        if not _is_error(fresh_data):
+            return update_cache(data_type, token_name, contract_address, chain, fresh_data)
+        _record_failure(data_type, token_name, (fresh_data or {}).get("error", "Empty response"))
+    except Exception as e:
+        _record_failure(data_type, token_name, e)
+    finally:
+        _release_leases(data_type, [token_name])
+    return False
+
+
+def _refresh_in_background(
+    data_type: str,
+    token_name: str,
+    contract_address: str,
+    chain: str,
+    fetch_fn: Callable[[], Dict[str, Any]],
+):
+    """Queue a background re-fetch of one row unless one is already running."""
+    telemetry.inc("cache_stale_served_total", data_type=data_type)
+    key = (data_type, token_name)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def _refresh():
+        try:
+            refresh(data_type, token_name, contract_address, chain, fetch_fn)
+        except Exception as e:
+            logger.warning(f"Background refresh failed for {data_type}/{token_name}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    try:
+        _refresh_executor.submit(_refresh)
+        logger.info(f"Cache STALE for {data_type}/{token_name}, refreshing in background")
+    except RuntimeError as e:
+        # Executor already shut down (interpreter exit) - the next call will block and fetch
+        with _refreshing_lock:
+            _refreshing.discard(key)
+        logger.warning(f"Could not schedule background refresh for {data_type}/{token_name}: {e}")
+
+
+def _try_acquire_lease(data_type: str, token_name: str) -> bool:
+    now = time.time()
+    try:
+        conn = _get_connection()
+        with conn:
+            cur = conn.execute(
+                _ACQUIRE_LEASE_SQL,
+                (data_type, token_name, _LEASE_OWNER, now + LEASE_SECONDS, now),
+            )
+        return cur.rowcount == 1
+    except Exception as e:
+        logger.warning(f"Lease acquire failed for {data_type}/{token_name}, fetching without it: {e}")
+        return True
+
+
+def _release_leases(data_type: str, token_names: Iterable[str]):
+    rows = [(data_type, token_name, _LEASE_OWNER) for token_name in token_names]
+    if not rows:
+        return
+    try:
+        conn = _get_connection()
+        with conn:
+            conn.executemany(_RELEASE_LEASE_SQL, rows)
+    except Exception as e:
+        logger.warning(f"Lease release failed for {data_type}: {e}")
+
+
+def acquire_lease(data_type: str, token_name: str, timeout: Optional[float] = None) -> bool:
+    """
+    Block until the caller holds the (data_type, token_name) lease, for work
+    other than a cache fetch that must not run twice at once in any thread or
+    process sharing cache.db (e.g. a transfer sync).
+
+    Args:
+        data_type: Lease namespace, e.g. "transfer_sync"
+        token_name: Key within it
+        timeout: Seconds to wait for the current holder (LEASE_WAIT_SECONDS
+            if None); 0 tries once
+
+    Returns:
+        True once held (call release_lease() when done, and renew_lease() at
+        least every LEASE_SECONDS meanwhile), False if it timed out
+    """
+    timeout = LEASE_WAIT_SECONDS if timeout is None else timeout
+    key = (data_type, token_name)
+    with _lease_locks_lock:
+        lock = _lease_locks.setdefault(key, threading.Lock())
+    deadline = time.monotonic() + timeout
+    held = lock.acquire(timeout=timeout) if timeout > 0 else lock.acquire(blocking=False)
+    if not held:
+        return False
+    while not _try_acquire_lease(data_type, token_name):
+        if time.monotonic() >= deadline:
+            lock.release()
+            return False
+        time.sleep(_LEASE_POLL_SECONDS)
+    return True
+
+
+def renew_lease(data_type: str, token_name: str):
+    """Push a lease held with acquire_lease() LEASE_SECONDS further out."""
+    _try_acquire_lease(data_type, token_name)
+
+
+def release_lease(data_type: str, token_name: str):
+    """Release a lease taken with acquire_lease()."""
+    _release_leases(data_type, [token_name])
+    _lease_locks[(data_type, token_name)].release()
+
+
+def _read_fresh(data_type: str, token_name: str) -> Optional[Dict[str, Any]]:
+    try:
+        hit = _lookup(data_type, token_name, _soft_cutoff(data_type), record=False)
+    except Exception:
+        return None
+    return hit[0] if hit else None
+
+
+def _elect_fetcher(data_type: str, token_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Block until this process may fetch the key.
+
+    Returns None once the caller holds the lease (it must fetch, store, then
+    release), or the row another process stored while we waited for its lease.
+    """
+    # A caller that just finished may have filled the row after our cache read
+    data = _read_fresh(data_type, token_name)
+    if data is not None:
+        return data
+
+    deadline = time.monotonic() + LEASE_WAIT_SECONDS
+    while not _try_acquire_lease(data_type, token_name):
+        if time.monotonic() >= deadline:
+            logger.warning(f"Timed out waiting on another process for {data_type}/{token_name}, fetching directly")
+            return None
+        time.sleep(_LEASE_POLL_SECONDS)
+        data = _read_fresh(data_type, token_name)
+        if data is not None:
+            logger.info(f"Cache FILLED by another process for {data_type}/{token_name}")
+            return data
+    return None
+
+
+def _claim(key: Tuple[str, str]) -> Tuple[bool, Future]:
+    """Return (is_leader, future) for an in-process fetch of key."""
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        if flight is not None:
+            return False, flight
+        flight = Future()
+        _inflight[key] = flight
+        return True, flight
+
+
+def _settle(key: Tuple[str, str], flight: Future, result: Any = None, error: Optional[BaseException] = None):
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    if error is not None:
+        flight.set_exception(error)
+    else:
+        flight.set_result(result)
+
+
+def get_cache_status(data_type: str, token_name: str) -> Dict[str, Any]:
+    """
+    Describe how fresh a cached entry is, for UI notices.
+
+    Returns:
+        {"state": one of CACHE_STATE_*, "fetched_at": ISO str or None,
+         "error": str or None, "retry_at": epoch seconds or None}
+        - fresh:         younger than the data_type's soft TTL
+        - provider_down: not fresh, and the last fetch failed - the last good
+                         payload (if any) is served until "retry_at"
+        - refreshing:    stale and a background refresh is in flight
+        - stale:         past the soft TTL but still served (within the hard TTL)
+        - expired:       past the hard TTL; the next read blocks on a fetch
+        - missing:       no row
+    """
+    fetched_at = get_cache_fetched_at(data_type, token_name)
+    cooling = _cooldowns(data_type, [token_name]).get(token_name)
+    if fetched_at is not None and fetched_at > _soft_cutoff(data_type):
+        state = CACHE_STATE_FRESH
+    elif cooling:
+        state = CACHE_STATE_PROVIDER_DOWN
+    elif fetched_at is None:
+        state = CACHE_STATE_MISSING
+    else:
+        with _refreshing_lock:
+            in_flight = (data_type, token_name) in _refreshing
+        if in_flight:
+            state = CACHE_STATE_REFRESHING
+        elif fetched_at > _hard_cutoff(data_type):
+            state = CACHE_STATE_STALE
+        else:
+            state = CACHE_STATE_EXPIRED
+    return {
+        "state": state,
+        "fetched_at": fetched_at,
+        "error": cooling["error"] if cooling else None,
+        "retry_at": cooling["retry_at"] if cooling else None,
+    }
+
+
+def get_or_fetch_many(
+    data_type: str,
+    tokens: Dict[str, Dict[str, str]],
+    fetch_fn: Callable[[str, str], Dict[str, Any]],
+    stale_while_revalidate: Optional[bool] = None,
+    provider: Optional[str] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Bulk version of get_or_fetch() for a token registry like TOKEN_CONTRACTS.
+
+    Args:
+        data_type: Cache data type (e.g. "holders")
+        tokens: Mapping of token name to {"address": ..., "chain": ...}
+        fetch_fn: Called as fetch_fn(contract_address, chain) for each miss
+        stale_while_revalidate: Serve stale rows and refresh them in the
+            background (defaults to STALE_WHILE_REVALIDATE)
+        provider: fanout provider name; misses are fetched concurrently
+            within its limit (one at a time when None)
+
+    Returns:
+        Dictionary mapping token name to raw API data (or {"error": str})
+    """
+    swr = _use_swr(stale_while_revalidate)
+    names = list(tokens.keys())
     try:
-        cached = get_cached_data(data_type, token_name)
-        if cached is not None:
-            return cached
+        rows = _select_many(data_type, names, _read_cutoff(data_type, swr))
+    except Exception as e:
+        logger.warning(f"Bulk cache lookup failed, falling back to API: {e}")
+        rows = {}
+
+    soft_cutoff = _soft_cutoff(data_type)
+    results = {}
+    misses = []
+    for token_name in names:
+        if token_name not in rows:
+            misses.append(token_name)
+            continue
+        data, fetched_at = rows[token_name]
+        results[token_name] = data
+        if fetched_at <= soft_cutoff:
+            token_info = tokens[token_name]
+            contract_address = token_info["address"]
+            chain = token_info.get("chain", "eth")
+            _refresh_in_background(
+                data_type, token_name, contract_address, chain,
+                lambda ca=contract_address, ch=chain: fetch_fn(ca, ch),
+            )
+    logger.info(f"Cache bulk lookup for {data_type}: {len(rows)} HIT, {len(misses)} MISS")
+
+    # Keys whose provider failed recently are not retried until the cool-down ends
+    cooling = _cooldowns(data_type, misses) if misses else {}
+    for token_name, failure in cooling.items():
+        results[token_name] = _serve_degraded(data_type, token_name, failure["error"])
+    misses = [token_name for token_name in misses if token_name not in cooling]
+
+    # Lead the misses nobody in this process is fetching yet; wait on the rest.
+    # Leases are taken in sorted order so two processes can't wait on each other.
+    leaders, followers = [], []
+    for token_name in sorted(misses):
+        is_leader, flight = _claim((data_type, token_name))
+        (leaders if is_leader else followers).append((token_name, flight))
+
+    leased = []
+    fresh_entries = []
+
+    def fetch_one(token_name):
+        token_info = tokens[token_name]
+        try:
+            return _call_upstream(data_type, fetch_fn, token_info["address"], token_info.get("chain", "eth"))
+        except Exception as e:
+            return {"error": str(e)}
+
+    try:
+        for token_name, _ in leaders:
+            data = _elect_fetcher(data_type, token_name)
+            if data is None:
+                leased.append(token_name)
+            else:
+                results[token_name] = data
+
+        # Only the upstream calls run concurrently; cache writes stay on this thread
+        fetched = fan_out(fetch_one, leased, provider=provider, max_workers=None if provider else 1)
+        for token_name, data in zip(leased, fetched):
+            # Skip caching if the API returned an error; fall back to the last good payload
+            if not _is_error(data):
+                token_info = tokens[token_name]
+                fresh_entries.append((token_name, token_info["address"], token_info.get("chain", "eth"), data))
+            else:
+                error = (data or {}).get("error", "Empty response")
+                _record_failure(data_type, token_name, error)
+                data = _serve_degraded(data_type, token_name, error)
+            results[token_name] = data
+
+        put_many(data_type, fresh_entries)
+    finally:
+        _release_leases(data_type, leased)
+        for token_name, flight in leaders:
+            _settle((data_type, token_name), flight, result=results.get(token_name, {"error": "Fetch aborted"}))
+
+    if followers:
+        telemetry.inc("cache_coalesced_total", len(followers), data_type=data_type)
+    for token_name, flight in followers:
+        results[token_name] = flight.result()
+
+    return {token_name: results[token_name] for token_name in names}
+
+
+def _cached_or_cooling(
+    data_type: str,
+    token_name: str,
+    contract_address: str,
+    chain: str,
+    swr: bool,
+    refresh_fn: Callable[[], Dict[str, Any]],
+) -> Optional[Dict[str, Any]]:
+    """
+    What get_or_fetch() can answer without fetching: the cached row, or the
+    degraded result for a key still cooling down. None means fetch.
+    """
+    # Try cache first. In stale-while-revalidate mode a row past the soft TTL
+    # (but inside the hard TTL) is returned immediately and refreshed behind.
+    try:
+        hit = _lookup(data_type, token_name, _read_cutoff(data_type, swr))
+        if hit:
+            data, fetched_at = hit
+            if fetched_at > _soft_cutoff(data_type):
+                logger.info(f"Cache HIT for {data_type}/{token_name} (fetched at {fetched_at})")
+            else:
+                _refresh_in_background(data_type, token_name, contract_address, chain, refresh_fn)
+            return data
+        logger.info(f"Cache MISS for {data_type}/{token_name}")
     except Exception as e:
         logger.warning(f"Cache lookup failed, falling back to API: {e}")
 
-    # Fetch fresh data from Moralis
-    fresh_data = fetch_fn()
+    failure = _cooldowns(data_type, [token_name]).get(token_name)
+    if failure:
+        return _serve_degraded(data_type, token_name, failure["error"])
+    return None
+
 
-    # Store in cache (skip if API returned an error)
-    if fresh_data and "error" not in fresh_data:
+def _store_fetched(
+    data_type: str, token_name: str, contract_address: str, chain: str, fresh_data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Cache a fetched result; an error result starts a cool-down and serves the last good payload."""
+    if not _is_error(fresh_data):
         try:
             update_cache(data_type, token_name, contract_address, chain, fresh_data)
         except Exception as e:
             logger.warning(f"Cache store failed (data still returned): {e}")
+        return fresh_data
+    error = (fresh_data or {}).get("error", "Empty response")
+    _record_failure(data_type, token_name, error)
+    return _serve_degraded(data_type, token_name, error)
+
+
+def _fetch_raised(data_type: str, token_name: str, error: Exception) -> Dict[str, Any]:
+    """Start a cool-down for a fetch that raised; the last good payload, else {"error": str}."""
+    _record_failure(data_type, token_name, error)
+    return _serve_degraded(data_type, token_name, error)
 
+
+def get_or_fetch(
+    data_type: str,
+    token_name: str,
+    contract_address: str,
+    chain: str,
+    fetch_fn: Callable[[], Dict[str, Any]],
+    stale_while_revalidate: Optional[bool] = None,
+) -> Dict[str, Any]:
+    swr = _use_swr(stale_while_revalidate)
+    cached = _cached_or_cooling(data_type, token_name, contract_address, chain, swr, fetch_fn)
+    if cached is not None:
+        return cached
+
+    # Single flight: concurrent callers in this process share one fetch, and
+    # processes sharing cache.db elect one fetcher through the lease table.
+    key = (data_type, token_name)
+    is_leader, flight = _claim(key)
+    if not is_leader:
+        logger.info(f"Waiting on in-flight fetch for {data_type}/{token_name}")
+        telemetry.inc("cache_coalesced_total", data_type=data_type)
+        return flight.result()
+
+    try:
+        fresh_data = _elect_fetcher(data_type, token_name)
+        if fresh_data is None:
+            try:
+                # Fetch fresh data from Moralis
+                try:
+                    fresh_data = _call_upstream(data_type, fetch_fn)
+                except Exception as e:
+                    fresh_data = _fetch_raised(data_type, token_name, e)
+                    if "error" in fresh_data:
+                        raise
+                else:
+                    # Store in cache (skip if API returned an error; fall back to the last good payload)
+                    fresh_data = _store_fetched(data_type, token_name, contract_address, chain, fresh_data)
+            finally:
+                _release_leases(data_type, [token_name])
+    except BaseException as e:
+        _settle(key, flight, error=e)
+        raise
+
+    _settle(key, flight, result=fresh_data)
+    return fresh_data
+
+
+async def get_or_fetch_async(
+    data_type: str,
+    token_name: str,
+    contract_address: str,
+    chain: str,
+    fetch_fn: Callable[[], Awaitable[Dict[str, Any]]],
+    stale_while_revalidate: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    get_or_fetch() for coroutine fetchers, awaited on the async_fetch loop.
+
+    Only fetch_fn runs on the loop. Every SQLite step - the lookup, the
+    cool-down check, the lease wait, the write and the failure record - runs
+    on a worker thread (asyncio.to_thread), so a slow disk or a locked
+    database never stalls the other fetches on the loop. Single flight is
+    shared with synchronous callers of the same key, and stale rows are
+    refreshed on the background executor by running fetch_fn on this loop.
+    """
+    swr = _use_swr(stale_while_revalidate)
+    loop = asyncio.get_running_loop()
+
+    cached = await asyncio.to_thread(
+        _cached_or_cooling, data_type, token_name, contract_address, chain, swr,
+        lambda: asyncio.run_coroutine_threadsafe(fetch_fn(), loop).result(),
+    )
+    if cached is not None:
+        return cached
+
+    key = (data_type, token_name)
+    is_leader, flight = _claim(key)
+    if not is_leader:
+        logger.info(f"Waiting on in-flight fetch for {data_type}/{token_name}")
+        telemetry.inc("cache_coalesced_total", data_type=data_type)
+        return await asyncio.wrap_future(flight)
+
+    try:
+        fresh_data = await asyncio.to_thread(_elect_fetcher, data_type, token_name)
+        if fresh_data is None:
+            try:
+                try:
+                    fresh_data = await _call_upstream_async(data_type, fetch_fn)
+                except Exception as e:
+                    fresh_data = await asyncio.to_thread(_fetch_raised, data_type, token_name, e)
+                    if "error" in fresh_data:
+                        raise
+                else:
+                    fresh_data = await asyncio.to_thread(
+                        _store_fetched, data_type, token_name, contract_address, chain, fresh_data
+                    )
+            finally:
+                await asyncio.to_thread(_release_leases, data_type, [token_name])
+    except BaseException as e:
+        _settle(key, flight, error=e)
+        raise
+
+    _settle(key, flight, result=fresh_data)
     return fresh_data
+
+
+def _flush_access_times(conn: sqlite3.Connection):
+    with _accessed_lock:
+        pending = list(_accessed.items())
+        _accessed.clear()
+    if pending:
+        with conn:
+            conn.executemany(
+                "UPDATE api_cache SET last_accessed_at = MAX(COALESCE(last_accessed_at, 0), ?) "
+                "WHERE data_type = ? AND token_name = ?;",
+                [(accessed_at, data_type, token_name) for (data_type, token_name), accessed_at in pending],
+            )
+
+
+def _expire_rows(conn: sqlite3.Connection) -> int:
+    """Delete rows that are past their hard TTL plus EXPIRED_GRACE_SECONDS."""
+    deleted = 0
+    policies = {**TTL_POLICIES, **_configured_policies}
+    with conn:
+        for data_type, policy in policies.items():
+            cur = conn.execute(
+                "DELETE FROM api_cache WHERE data_type = ? AND fetched_at < ?;",
+                (data_type, _cutoff(policy.hard_seconds + EXPIRED_GRACE_SECONDS)),
+            )
+            deleted += cur.rowcount
+        # Data types without a registered policy fall back to the default one
+        placeholders = ", ".join("?" * len(policies))
+        cur = conn.execute(
+            f"DELETE FROM api_cache WHERE data_type NOT IN ({placeholders}) AND fetched_at < ?;",
+            (*policies.keys(), _cutoff(DEFAULT_TTL_POLICY.hard_seconds + EXPIRED_GRACE_SECONDS)),
+        )
+        deleted += cur.rowcount
+        conn.execute("DELETE FROM cache_leases WHERE expires_at < ?;", (time.time(),))
+        # Forget failures whose cool-down ended long ago so the backoff starts over
+        conn.execute("DELETE FROM fetch_failures WHERE retry_after < ?;", (time.time() - EXPIRED_GRACE_SECONDS,))
+    return deleted
+
+
+def _used_bytes(conn: sqlite3.Connection) -> int:
+    """Approximate bytes held by api_cache rows (not the whole file, which also holds history)."""
+    return conn.execute(_SELECT_USED_BYTES_SQL, (_ROW_OVERHEAD_BYTES,)).fetchone()[0]
+
+
+def _evict_lru(conn: sqlite3.Connection) -> int:
+    """Delete least recently accessed api_cache rows until they fit MAX_DB_BYTES."""
+    evicted = 0
+    used = _used_bytes(conn)
+    while used > MAX_DB_BYTES:
+        with conn:
+            victims = conn.execute(_SELECT_LRU_SQL, (_ROW_OVERHEAD_BYTES, _EVICTION_BATCH)).fetchall()
+            conn.executemany("DELETE FROM api_cache WHERE id = ?;", [(row_id,) for row_id, _ in victims])
+        if not victims:
+            break
+        evicted += len(victims)
+        used -= sum(size for _, size in victims)
+    return evicted
+
+
+def _prune_history(conn: sqlite3.Connection) -> int:
+    """Drop snapshot history past SNAPSHOT_RETENTION_DAYS / METRIC_RETENTION_DAYS."""
+    now = time.time()
+    snapshots_deleted, metrics_deleted = snapshots.prune(
+        conn,
+        now - SNAPSHOT_RETENTION_DAYS * 86400 if SNAPSHOT_RETENTION_DAYS > 0 else None,
+        now - METRIC_RETENTION_DAYS * 86400 if METRIC_RETENTION_DAYS > 0 else None,
+    )
+    return snapshots_deleted + metrics_deleted
+
+
+def run_janitor() -> Dict[str, int]:
+    """
+    One maintenance pass over the cache database:
+    switch an old file to incremental auto_vacuum if needed, flush batched
+    access times, expire old rows, enforce MAX_DB_BYTES by evicting least
+    recently used rows, prune old snapshot history, cap the transfer store,
+    then return free pages to the OS.
+    """
+    conn = _get_connection()
+    with telemetry.timer("cache_janitor_seconds"):
+        _enable_incremental_vacuum(conn)
+        _flush_access_times(conn)
+        expired = _expire_rows(conn)
+        evicted = _evict_lru(conn)
+        pruned = _prune_history(conn)
+        transfers_evicted = transfer_store.evict(conn, TRANSFER_MAX_ROWS)
+        free_pages = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        if free_pages:
+            conn.execute("PRAGMA incremental_vacuum;")
+    telemetry.inc("cache_janitor_rows_total", expired, action="expired")
+    telemetry.inc("cache_janitor_rows_total", evicted, action="evicted")
+    telemetry.inc("cache_janitor_rows_total", pruned, action="pruned")
+    telemetry.inc("cache_janitor_rows_total", transfers_evicted, action="transfers_evicted")
+    if expired or evicted or pruned or transfers_evicted:
+        logger.info(
+            f"Cache janitor: expired {expired} rows, evicted {evicted} rows, pruned {pruned} history rows, "
+            f"evicted {transfers_evicted} transfers, freed {free_pages} pages"
+        )
+    return {
+        "expired": expired,
+        "evicted": evicted,
+        "pruned": pruned,
+        "transfers_evicted": transfers_evicted,
+        "freed_pages": free_pages,
+    }
+
+
+def _janitor_loop():
+    while True:
+        time.sleep(JANITOR_INTERVAL_SECONDS)
+        try:
+            run_janitor()
+        except Exception as e:
+            logger.error(f"Cache janitor pass failed: {e}")
+
+
+def start_janitor():
+    """Start the background janitor thread once per process."""
+    global _janitor_thread
+    with _janitor_lock:
+        if _janitor_thread is not None and _janitor_thread.is_alive():
+            return
+        _janitor_thread = threading.Thread(target=_janitor_loop, name="db-cache-janitor", daemon=True)
+        _janitor_thread.start()
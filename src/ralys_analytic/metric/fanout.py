@@ -0,0 +1,184 @@
+"""
+fanout.py - Bounded concurrent fan-out for per-token fetch loops.
+
+    results = fan_out(fetch_one, TOKEN_CONTRACTS.items(), provider="moralis")
+
+fan_out() runs fn over the items on a thread pool and returns the results in
+input order, so aggregate functions keep their return shapes. Concurrency is
+bounded twice:
+
+- per call, by MAX_WORKERS threads
+- per provider, across all concurrent callers in the process, by a
+  semaphore sized from PROVIDER_CONCURRENCY - two dashboard sessions fanning
+  out to Etherscan at once still hold at most PROVIDER_CONCURRENCY["etherscan"]
+  requests in flight. Fan-outs without a provider share MAX_WORKERS slots.
+
+Each provider has one long-lived pool with a thread per slot, shared by
+every fan-out to it, so worker threads - and the SQLite connection each
+keeps (db_cache._get_connection) - are reused across calls instead of being
+opened for every fan-out.
+
+The calling thread takes a provider slot before submitting each item, and
+the slot is released when the item finishes, so no worker ever waits for a
+slot. A task that fans out again to the provider it already holds a slot for
+borrows whatever slots are free at that moment (without waiting) and runs
+the remaining items inline on its own thread, so nesting cannot deadlock
+and still uses idle capacity.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional, Dict, Any, Callable, Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+MAX_WORKERS = 16
+
+# Simultaneous in-flight requests per provider, sized to each API's
+# documented (free-tier) limits
+PROVIDER_CONCURRENCY: Dict[str, int] = {
+    "moralis": 4,
+    "etherscan": 3,  # 5 calls/s free tier; paginated scans hold a slot for several calls
+    "kraken": 4,
+    "binance": 8,
+    "coinmarketcap": 2,
+    "coingecko": 1,  # 10-50 calls/min free tier
+    "defillama": 4,
+}
+DEFAULT_CONCURRENCY = 4
+
+# Keyed by provider, None for fan-outs without one
+_semaphores: Dict[Optional[str], threading.BoundedSemaphore] = {}
+_executors: Dict[Optional[str], ThreadPoolExecutor] = {}
+_slots_lock = threading.Lock()
+_held = threading.local()
+
+
+def set_concurrency(provider: str, limit: int):
+    """Change a provider's concurrency limit (takes effect for new fan-outs)."""
+    with _slots_lock:
+        PROVIDER_CONCURRENCY[provider] = limit
+        _semaphores.pop(provider, None)
+        # Not shut down: a fan-out may still be submitting to it. Its threads
+        # exit once it is dropped and its items have finished.
+        _executors.pop(provider, None)
+
+
+def _slots(provider: Optional[str]) -> Tuple[threading.BoundedSemaphore, ThreadPoolExecutor]:
+    """The provider's slot semaphore and its pool, one thread per slot."""
+    with _slots_lock:
+        if provider not in _semaphores:
+            limit = _limit(provider)
+            _semaphores[provider] = threading.BoundedSemaphore(limit)
+            _executors[provider] = ThreadPoolExecutor(
+                max_workers=limit, thread_name_prefix=f"fanout-{provider or 'any'}"
+            )
+        return _semaphores[provider], _executors[provider]
+
+
+def _held_providers() -> set:
+    held = getattr(_held, "providers", None)
+    if held is None:
+        held = _held.providers = set()
+    return held
+
+
+def _limit(provider: Optional[str]) -> int:
+    if provider is None:
+        return MAX_WORKERS
+    return PROVIDER_CONCURRENCY.get(provider, DEFAULT_CONCURRENCY)
+
+
+def _run_limited(provider: Optional[str], fn: Callable[[T], R], item: T) -> R:
+    held = _held_providers()
+    if provider is None or provider in held:
+        return fn(item)
+    with _slots(provider)[0]:
+        held.add(provider)
+        try:
+            return fn(item)
+        finally:
+            held.discard(provider)
+
+
+def _run_with_slot(provider: Optional[str], semaphore: threading.BoundedSemaphore, fn: Callable[[T], R], item: T) -> R:
+    """Run one item on a worker, under the provider slot its submitter took."""
+    held = _held_providers()
+    held.add(provider)
+    try:
+        return fn(item)
+    finally:
+        held.discard(provider)
+        semaphore.release()
+
+
+def fan_out(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    provider: Optional[str] = None,
+    max_workers: Optional[int] = None,
+) -> List[R]:
+    """
+    Apply fn to every item concurrently.
+
+    Args:
+        fn: Called once per item; should handle its own errors like the
+            sequential loops did (an exception is re-raised here)
+        items: Inputs, e.g. TOKEN_CONTRACTS.items()
+        provider: Key into PROVIDER_CONCURRENCY; None shares the MAX_WORKERS slots
+        max_workers: In-flight cap for this call (MAX_WORKERS by default)
+
+    Returns:
+        fn(item) for each item, in input order
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = min(len(items), max_workers or MAX_WORKERS, _limit(provider))
+    if workers <= 1:
+        return [_run_limited(provider, fn, item) for item in items]
+
+    # Every submitted item holds a slot and the pool has a thread per slot,
+    # so submitted items never queue behind each other
+    semaphore, executor = _slots(provider)
+    nested = provider in _held_providers()
+    # This call's own cap; a nested call's thread already holds one slot and runs items too
+    in_flight = threading.BoundedSemaphore(workers - 1 if nested else workers)
+    results: List[Any] = [None] * len(items)
+    futures = []
+    try:
+        for i, item in enumerate(items):
+            if nested:
+                if not in_flight.acquire(blocking=False):
+                    results[i] = fn(item)
+                    continue
+                if not semaphore.acquire(blocking=False):
+                    # No free slot: this thread's own slot runs the item
+                    in_flight.release()
+                    results[i] = fn(item)
+                    continue
+            else:
+                in_flight.acquire()
+                semaphore.acquire()
+            future = executor.submit(_run_with_slot, provider, semaphore, fn, item)
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append((i, future))
+    finally:
+        # Like leaving a per-call pool: nothing of this call is still running on return
+        wait([future for _, future in futures])
+    for i, future in futures:
+        results[i] = future.result()
+    return results
+
+
+def fan_out_dict(
+    fn: Callable[[Any, Any], R],
+    mapping: Dict[Any, Any],
+    provider: Optional[str] = None,
+    max_workers: Optional[int] = None,
+) -> Dict[Any, R]:
+    """fan_out() over mapping.items(); returns {key: fn(key, value)} in the mapping's order."""
+    keys = list(mapping.keys())
+    results = fan_out(lambda kv: fn(*kv), mapping.items(), provider, max_workers)
+    return dict(zip(keys, results))
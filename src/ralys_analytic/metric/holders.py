@@ -1,7 +1,10 @@
 import os
-import requests
+import asyncio
 import streamlit as st
 from dotenv import load_dotenv
+from . import async_fetch
+from . import http_client
+from .fanout import fan_out_dict
 
 load_dotenv()
 
@@ -61,7 +64,7 @@ def get_token_holders_data(contract_address: str, chain: str = "eth"):
     url = f"{MORALIS_API_URL}/erc20/{contract_address}/holders?chain={chain}"
 
     try:
-        response = requests.request("GET", url, headers=get_moralis_headers(), timeout=15)
+        response = http_client.request("GET", url, headers=get_moralis_headers(), timeout=15, provider="moralis")
         data = response.json()
 
         if response.status_code == 200:
@@ -72,106 +75,99 @@ def get_token_holders_data(contract_address: str, chain: str = "eth"):
         return {"error": str(e)}
 
 
+def _format_holder_data(contract_address: str, data: dict):
+    """Shape a raw Moralis holders response (or {"error": ...}) for the dashboard."""
+    if "error" in data:
+        return {
+            "contract_address": contract_address,
+            "holder_count": None,
+            "holder_change": None,
+            "holder_supply": None,
+            "holder_distribution": None,
+            "holders_by_acquisition": None,
+            "error": data.get("error"),
+        }
+    return {
+        "contract_address": contract_address,
+        "holder_count": data.get("totalHolders"),
+        "holder_change": data.get("holderChange", {}),
+        "holder_supply": data.get("holderSupply", {}),
+        "holder_distribution": data.get("holderDistribution", {}),
+        "holders_by_acquisition": data.get("holdersByAcquisition", {}),
+    }
+
+
 def get_all_token_holders_data():
     """
     Get holder data for all configured tokens using Moralis API.
+    Tokens are fetched concurrently, within the Moralis concurrency limit.
 
     Returns:
         Dictionary mapping token name to holder data
     """
-    results = {}
-
-    for token_name, token_info in TOKEN_CONTRACTS.items():
+    def fetch_one(token_name, token_info):
         contract_address = token_info["address"]
         chain = token_info.get("chain", "eth")
         try:
             # Get all holder data from single endpoint
             data = get_token_holders_data(contract_address, chain)
-
-            if "error" in data:
-                results[token_name] = {
-                    "contract_address": contract_address,
-                    "holder_count": None,
-                    "holder_change": None,
-                    "holder_supply": None,
-                    "holder_distribution": None,
-                    "holders_by_acquisition": None,
-                    "error": data.get("error"),
-                }
-            else:
-                results[token_name] = {
-                    "contract_address": contract_address,
-                    "holder_count": data.get("totalHolders"),
-                    "holder_change": data.get("holderChange", {}),
-                    "holder_supply": data.get("holderSupply", {}),
-                    "holder_distribution": data.get("holderDistribution", {}),
-                    "holders_by_acquisition": data.get("holdersByAcquisition", {}),
-                }
-
         except Exception as e:
-            results[token_name] = {
-                "contract_address": contract_address,
-                "holder_count": None,
-                "holder_change": None,
-                "holder_supply": None,
-                "holder_distribution": None,
-                "holders_by_acquisition": None,
-                "error": str(e),
-            }
+            data = {"error": str(e)}
+        return _format_holder_data(contract_address, data)
 
-    return results
+    return fan_out_dict(fetch_one, TOKEN_CONTRACTS, provider="moralis")
 
 
 def get_all_token_holders_data_cached():
     """
     Cache-aware version of get_all_token_holders_data().
-    Returns data from PostgreSQL cache if < 6 hours old,
-    otherwise fetches from Moralis and updates cache.
+    Resolves every token in one bulk cache lookup; only tokens without a
+    fresh (< 6 hours old) row are fetched from Moralis, and all fresh
+    results are stored in a single transaction.
     """
     from . import db_cache
 
-    results = {}
-    for token_name, token_info in TOKEN_CONTRACTS.items():
+    raw_by_token = db_cache.get_or_fetch_many(
+        data_type="holders",
+        tokens=TOKEN_CONTRACTS,
+        fetch_fn=get_token_holders_data,
+        provider="moralis",
+    )
+
+    return {
+        token_name: _format_holder_data(TOKEN_CONTRACTS[token_name]["address"], raw)
+        for token_name, raw in raw_by_token.items()
+    }
+
+
+# Async variants: same arguments and results as the functions above
+
+async def get_token_holders_data_async(contract_address: str, chain: str = "eth"):
+    url = f"{MORALIS_API_URL}/erc20/{contract_address}/holders?chain={chain}"
+
+    try:
+        response = await async_fetch.get_json(url, provider="moralis", headers=get_moralis_headers(), timeout=15)
+        data = response.data
+
+        if response.status == 200:
+            return data
+        else:
+            return {"error": data.get("message", "Unknown error")}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def get_all_token_holders_data_cached_async():
+    from . import db_cache
+
+    async def fetch_one(token_name, token_info):
         contract_address = token_info["address"]
         chain = token_info.get("chain", "eth")
-
-        try:
-            raw = db_cache.get_or_fetch(
-                data_type="holders",
-                token_name=token_name,
-                contract_address=contract_address,
-                chain=chain,
-                fetch_fn=lambda ca=contract_address, ch=chain: get_token_holders_data(ca, ch),
-            )
-
-            if "error" in raw:
-                results[token_name] = {
-                    "contract_address": contract_address,
-                    "holder_count": None,
-                    "holder_change": None,
-                    "holder_supply": None,
-                    "holder_distribution": None,
-                    "holders_by_acquisition": None,
-                    "error": raw.get("error"),
-                }
-            else:
-                results[token_name] = {
-                    "contract_address": contract_address,
-                    "holder_count": raw.get("totalHolders"),
-                    "holder_change": raw.get("holderChange", {}),
-                    "holder_supply": raw.get("holderSupply", {}),
-                    "holder_distribution": raw.get("holderDistribution", {}),
-                    "holders_by_acquisition": raw.get("holdersByAcquisition", {}),
-                }
-        except Exception as e:
-            results[token_name] = {
-                "contract_address": contract_address,
-                "holder_count": None,
-                "holder_change": None,
-                "holder_supply": None,
-                "holder_distribution": None,
-                "holders_by_acquisition": None,
-                "error": str(e),
-            }
-
-    return results
+        raw = await db_cache.get_or_fetch_async(
+            "holders", token_name, contract_address, chain,
+            lambda: get_token_holders_data_async(contract_address, chain),
+        )
+        return _format_holder_data(contract_address, raw)
+
+    results = await asyncio.gather(*(fetch_one(name, info) for name, info in TOKEN_CONTRACTS.items()))
+    return dict(zip(TOKEN_CONTRACTS, results))
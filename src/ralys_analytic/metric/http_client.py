@@ -0,0 +1,180 @@
+"""
+http_client.py - Shared pooled HTTP layer for the metric modules.
+
+Every provider call goes through request() / get() instead of the bare
+requests functions, which open a new TCP + TLS connection per call:
+
+- one requests.Session per host, shared by all threads, with a keep-alive
+  connection pool (POOL_MAXSIZE connections per host)
+- gzip/deflate negotiated on every request
+- DEFAULT_TIMEOUT (connect, read) when the caller gives none
+- per-request timing: every request is recorded in telemetry
+  (http_requests_total / http_request_seconds by host and status) and
+  passed to hooks registered with add_request_hook()
+- per-provider rate limits: requests made with provider= wait for a token
+  from that provider's bucket (see rate_limit.py)
+- retries and circuit breakers: transient failures of idempotent requests
+  are retried with backoff, and a failing provider's requests fail fast
+  (see resilience.py)
+- record/replay: HTTP_CASSETTE_MODE=record|replay saves responses to, or
+  serves them from, a local cassette store (see cassette.py)
+"""
+
+import time
+import logging
+import threading
+from typing import Optional, Dict, Any, Callable, List, NamedTuple
+from urllib.parse import urlsplit
+
+import requests
+
+from . import cassette
+from . import rate_limit
+from . import resilience
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 30)
+POOL_MAXSIZE = 16
+
+# Failures worth retrying; other request errors (bad URL, TLS, ...) are raised at once
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+DEFAULT_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "ralys-analytic/1.0",
+}
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+class RequestTiming(NamedTuple):
+    method: str
+    host: str
+    path: str
+    status: Optional[int]  # None when the request raised
+    elapsed: float
+    response_bytes: int
+
+
+RequestHook = Callable[[RequestTiming], None]
+_hooks: List[RequestHook] = []
+
+
+def add_request_hook(hook: RequestHook):
+    """Call hook(RequestTiming) after every request, including failed ones."""
+    _hooks.append(hook)
+
+
+def remove_request_hook(hook: RequestHook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    # Retries are handled by resilience.call(); the adapter pools connections
+    # and records/replays cassettes
+    adapter = cassette.CassetteAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session(host: str) -> requests.Session:
+    """The pooled session for a host ("api.kraken.com")."""
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _new_session()
+    return session
+
+
+def close_sessions():
+    """Close every pooled connection (new sessions are created on demand)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def record_request(timing: RequestTiming):
+    """Count, time and hand a finished request to the hooks (async_fetch records through here too)."""
+    status = str(timing.status) if timing.status is not None else "error"
+    telemetry.inc("http_requests_total", host=timing.host, status=status)
+    telemetry.observe("http_request_seconds", timing.elapsed, host=timing.host)
+    if timing.response_bytes:
+        telemetry.inc("http_response_bytes_total", timing.response_bytes, host=timing.host)
+    for hook in list(_hooks):
+        try:
+            hook(timing)
+        except Exception as e:
+            logger.warning(f"HTTP request hook failed: {e}")
+
+
+def _send(method: str, url: str, timeout: Any, provider: Optional[str], cost: float, **kwargs) -> requests.Response:
+    parts = urlsplit(url)
+    host = parts.netloc
+    api_key = rate_limit.api_key_from(kwargs.get("params"), kwargs.get("headers"))
+    if not cassette.replaying():
+        rate_limit.acquire(provider, api_key, cost)
+    start = time.perf_counter()
+    response = None
+    try:
+        response = get_session(host).request(
+            method, url, timeout=timeout if timeout is not None else DEFAULT_TIMEOUT, **kwargs
+        )
+        rate_limit.observe(provider, api_key, response.status_code, response.headers)
+        return response
+    finally:
+        record_request(RequestTiming(
+            method=method,
+            host=host,
+            path=parts.path,
+            status=response.status_code if response is not None else None,
+            elapsed=time.perf_counter() - start,
+            response_bytes=len(response.content) if response is not None else 0,
+        ))
+
+
+def request(
+    method: str, url: str, timeout: Any = None, provider: Optional[str] = None, cost: float = 1, **kwargs
+) -> requests.Response:
+    """
+    Send a request through the host's pooled session.
+
+    Args:
+        method: HTTP method
+        url: Absolute URL
+        timeout: Seconds or (connect, read); DEFAULT_TIMEOUT if None
+        provider: Rate-limit the request against this provider's bucket
+            (keyed by the API key found in params/headers) and send it
+            through the provider's circuit breaker
+        cost: Tokens the request takes from the provider's bucket, e.g. the
+            endpoint's request weight for weight-based limits like Binance's
+        **kwargs: Passed to requests (params, headers, json, ...)
+
+    Returns:
+        requests.Response (the last attempt's if every retry failed); network
+        errors raise requests exceptions as before, and resilience.CircuitOpenError
+        is raised without sending while the provider's circuit is open
+    """
+    return resilience.call(
+        lambda: _send(method, url, timeout, provider, cost, **kwargs),
+        provider,
+        method,
+        TRANSIENT_ERRORS,
+        lambda response: response.status_code,
+    )
+
+
+def get(url: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+    """GET through the pooled session; same arguments as requests.get()."""
+    return request("GET", url, params=params, **kwargs)
@@ -1,7 +1,12 @@
-import requests
+import asyncio
 import pandas as pd
 from datetime import datetime
 
+from . import async_fetch
+from . import http_client
+from .fanout import fan_out_dict
+from .provider_cache import cached
+
 BASE_URL = "https://api.kraken.com/0/public"
 TIMEOUT = 15
 
@@ -32,219 +37,226 @@ def _get_pair_key(result):
     return keys[0] if keys else None
 
 
+# Response parsers, shared by the sync fetchers and their *_async variants
+
+def _parse_ticker(data):
+    if data.get("error"):
+        return {"error": ", ".join(data["error"])}
+
+    result = data["result"]
+    pair_key = list(result.keys())[0]
+    t = result[pair_key]
+
+    last_price = float(t["c"][0])
+    open_price = float(t["o"])
+    price_change_pct = ((last_price - open_price) / open_price * 100) if open_price else 0
+
+    return {
+        "last_price": last_price,
+        "open_price": open_price,
+        "price_change_pct": round(price_change_pct, 2),
+        "high": float(t["h"][1]),       # 24h high
+        "low": float(t["l"][1]),        # 24h low
+        "volume": float(t["v"][1]),     # 24h volume
+        "vwap": float(t["p"][1]),       # 24h VWAP
+        "trade_count": int(t["t"][1]),  # 24h trades
+        "ask": float(t["a"][0]),
+        "bid": float(t["b"][0]),
+        "spread": round(float(t["a"][0]) - float(t["b"][0]), 8),
+    }
+
+
+def _parse_ohlc(data, limit):
+    if data.get("error"):
+        return {"error": ", ".join(data["error"])}
+
+    result = data["result"]
+    pair_key = _get_pair_key(result)
+    if not pair_key:
+        return {"error": "No data in response"}
+    raw = result[pair_key]
+
+    rows = []
+    for candle in raw:
+        rows.append({
+            "timestamp": datetime.utcfromtimestamp(candle[0]),
+            "open": float(candle[1]),
+            "high": float(candle[2]),
+            "low": float(candle[3]),
+            "close": float(candle[4]),
+            "vwap": float(candle[5]),
+            "volume": float(candle[6]),
+            "trades": int(candle[7]),
+        })
+
+    df = pd.DataFrame(rows)
+    if len(df) > limit:
+        df = df.tail(limit).reset_index(drop=True)
+    return df
+
+
+def _parse_order_book(data):
+    if data.get("error"):
+        return {"error": ", ".join(data["error"])}
+
+    result = data["result"]
+    pair_key = list(result.keys())[0]
+    book = result[pair_key]
+
+    asks = [{"price": float(a[0]), "volume": float(a[1]), "side": "Ask"} for a in book["asks"]]
+    bids = [{"price": float(b[0]), "volume": float(b[1]), "side": "Bid"} for b in book["bids"]]
+
+    total_ask_vol = sum(a["volume"] for a in asks)
+    total_bid_vol = sum(b["volume"] for b in bids)
+    total = total_ask_vol + total_bid_vol
+
+    bid_pct = (total_bid_vol / total * 100) if total else 50
+    ask_pct = (total_ask_vol / total * 100) if total else 50
+
+    if total_bid_vol > 0:
+        bid_ask_ratio = total_bid_vol / total_ask_vol if total_ask_vol else float("inf")
+    else:
+        bid_ask_ratio = 0
+
+    return {
+        "asks": asks,
+        "bids": bids,
+        "total_ask_volume": total_ask_vol,
+        "total_bid_volume": total_bid_vol,
+        "bid_pct": round(bid_pct, 1),
+        "ask_pct": round(ask_pct, 1),
+        "bid_ask_ratio": round(bid_ask_ratio, 4),
+    }
+
+
+def _parse_trades(data):
+    if data.get("error"):
+        return {"error": ", ".join(data["error"])}
+
+    result = data["result"]
+    pair_key = _get_pair_key(result)
+    if not pair_key:
+        return {"error": "No data in response"}
+    raw = result[pair_key]
+
+    rows = []
+    for trade in raw:
+        rows.append({
+            "price": float(trade[0]),
+            "volume": float(trade[1]),
+            "timestamp": datetime.utcfromtimestamp(trade[2]),
+            "side": "buy" if trade[3] == "b" else "sell",
+            "type": "limit" if trade[4] == "l" else "market",
+        })
+
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return {"error": "No trade data available"}
+
+    buy_vol = df.loc[df["side"] == "buy", "volume"].sum()
+    sell_vol = df.loc[df["side"] == "sell", "volume"].sum()
+    total_vol = buy_vol + sell_vol
+    buy_count = (df["side"] == "buy").sum()
+    sell_count = (df["side"] == "sell").sum()
+
+    buy_sell_ratio = (buy_vol / sell_vol) if sell_vol > 0 else float("inf")
+
+    return {
+        "df": df,
+        "buy_volume": buy_vol,
+        "sell_volume": sell_vol,
+        "total_volume": total_vol,
+        "buy_count": int(buy_count),
+        "sell_count": int(sell_count),
+        "buy_sell_ratio": round(buy_sell_ratio, 4),
+        "buy_pct": round(buy_vol / total_vol * 100, 1) if total_vol else 50,
+    }
+
+
+def _parse_spread(data):
+    if data.get("error"):
+        return {"error": ", ".join(data["error"])}
+
+    result = data["result"]
+    pair_key = _get_pair_key(result)
+    if not pair_key:
+        return {"error": "No data in response"}
+    raw = result[pair_key]
+
+    rows = []
+    for entry in raw:
+        bid = float(entry[1])
+        ask = float(entry[2])
+        mid = (bid + ask) / 2
+        spread_bps = ((ask - bid) / mid * 10000) if mid else 0
+        rows.append({
+            "timestamp": datetime.utcfromtimestamp(entry[0]),
+            "bid": bid,
+            "ask": ask,
+            "spread": round(ask - bid, 8),
+            "spread_bps": round(spread_bps, 2),
+        })
+
+    df = pd.DataFrame(rows)
+    return {
+        "df": df,
+        "avg_spread_bps": round(df["spread_bps"].mean(), 2) if not df.empty else 0,
+        "current_spread_bps": df["spread_bps"].iloc[-1] if not df.empty else 0,
+    }
+
+
+@cached("kraken.ticker", soft_seconds=60, hard_seconds=15 * 60)
 def get_ticker(pair="RLSUSD"):
     """Get 24hr ticker statistics for a pair from Kraken."""
     try:
-        resp = requests.get(
-            f"{BASE_URL}/Ticker",
-            params={"pair": pair},
-            timeout=TIMEOUT,
-        )
-        data = resp.json()
-        if data.get("error"):
-            return {"error": ", ".join(data["error"])}
-
-        result = data["result"]
-        pair_key = list(result.keys())[0]
-        t = result[pair_key]
-
-        last_price = float(t["c"][0])
-        open_price = float(t["o"])
-        price_change_pct = ((last_price - open_price) / open_price * 100) if open_price else 0
-
-        return {
-            "last_price": last_price,
-            "open_price": open_price,
-            "price_change_pct": round(price_change_pct, 2),
-            "high": float(t["h"][1]),       # 24h high
-            "low": float(t["l"][1]),        # 24h low
-            "volume": float(t["v"][1]),     # 24h volume
-            "vwap": float(t["p"][1]),       # 24h VWAP
-            "trade_count": int(t["t"][1]),  # 24h trades
-            "ask": float(t["a"][0]),
-            "bid": float(t["b"][0]),
-            "spread": round(float(t["a"][0]) - float(t["b"][0]), 8),
-        }
+        resp = http_client.get(f"{BASE_URL}/Ticker", params={"pair": pair}, timeout=TIMEOUT, provider="kraken")
+        return _parse_ticker(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("kraken.ohlc", soft_seconds=5 * 60, hard_seconds=60 * 60)
 def get_ohlc(pair="RLSUSD", interval="1d", limit=60):
     """Get OHLC candlestick data for a pair from Kraken."""
     try:
         kraken_interval = INTERVAL_MAP.get(interval, 1440)
-        resp = requests.get(
+        resp = http_client.get(
             f"{BASE_URL}/OHLC",
             params={"pair": pair, "interval": kraken_interval},
             timeout=TIMEOUT,
+            provider="kraken",
         )
-        data = resp.json()
-        if data.get("error"):
-            return {"error": ", ".join(data["error"])}
-
-        result = data["result"]
-        pair_key = _get_pair_key(result)
-        if not pair_key:
-            return {"error": "No data in response"}
-        raw = result[pair_key]
-
-        rows = []
-        for candle in raw:
-            rows.append({
-                "timestamp": datetime.utcfromtimestamp(candle[0]),
-                "open": float(candle[1]),
-                "high": float(candle[2]),
-                "low": float(candle[3]),
-                "close": float(candle[4]),
-                "vwap": float(candle[5]),
-                "volume": float(candle[6]),
-                "trades": int(candle[7]),
-            })
-
-        df = pd.DataFrame(rows)
-        if len(df) > limit:
-            df = df.tail(limit).reset_index(drop=True)
-        return df
+        return _parse_ohlc(resp.json(), limit)
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("kraken.order_book", soft_seconds=30, hard_seconds=5 * 60)
 def get_order_book(pair="RLSUSD", count=20):
     """Get order book depth for a pair from Kraken."""
     try:
-        resp = requests.get(
-            f"{BASE_URL}/Depth",
-            params={"pair": pair, "count": count},
-            timeout=TIMEOUT,
-        )
-        data = resp.json()
-        if data.get("error"):
-            return {"error": ", ".join(data["error"])}
-
-        result = data["result"]
-        pair_key = list(result.keys())[0]
-        book = result[pair_key]
-
-        asks = [{"price": float(a[0]), "volume": float(a[1]), "side": "Ask"} for a in book["asks"]]
-        bids = [{"price": float(b[0]), "volume": float(b[1]), "side": "Bid"} for b in book["bids"]]
-
-        total_ask_vol = sum(a["volume"] for a in asks)
-        total_bid_vol = sum(b["volume"] for b in bids)
-        total = total_ask_vol + total_bid_vol
-
-        bid_pct = (total_bid_vol / total * 100) if total else 50
-        ask_pct = (total_ask_vol / total * 100) if total else 50
-
-        if total_bid_vol > 0:
-            bid_ask_ratio = total_bid_vol / total_ask_vol if total_ask_vol else float("inf")
-        else:
-            bid_ask_ratio = 0
-
-        return {
-            "asks": asks,
-            "bids": bids,
-            "total_ask_volume": total_ask_vol,
-            "total_bid_volume": total_bid_vol,
-            "bid_pct": round(bid_pct, 1),
-            "ask_pct": round(ask_pct, 1),
-            "bid_ask_ratio": round(bid_ask_ratio, 4),
-        }
+        resp = http_client.get(f"{BASE_URL}/Depth", params={"pair": pair, "count": count}, timeout=TIMEOUT, provider="kraken")
+        return _parse_order_book(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("kraken.trades", soft_seconds=60, hard_seconds=10 * 60)
 def get_recent_trades(pair="RLSUSD"):
     """Get recent trades for a pair from Kraken and compute buy/sell breakdown."""
     try:
-        resp = requests.get(
-            f"{BASE_URL}/Trades",
-            params={"pair": pair},
-            timeout=TIMEOUT,
-        )
-        data = resp.json()
-        if data.get("error"):
-            return {"error": ", ".join(data["error"])}
-
-        result = data["result"]
-        pair_key = _get_pair_key(result)
-        if not pair_key:
-            return {"error": "No data in response"}
-        raw = result[pair_key]
-
-        rows = []
-        for trade in raw:
-            rows.append({
-                "price": float(trade[0]),
-                "volume": float(trade[1]),
-                "timestamp": datetime.utcfromtimestamp(trade[2]),
-                "side": "buy" if trade[3] == "b" else "sell",
-                "type": "limit" if trade[4] == "l" else "market",
-            })
-
-        df = pd.DataFrame(rows)
-        if df.empty:
-            return {"error": "No trade data available"}
-
-        buy_vol = df.loc[df["side"] == "buy", "volume"].sum()
-        sell_vol = df.loc[df["side"] == "sell", "volume"].sum()
-        total_vol = buy_vol + sell_vol
-        buy_count = (df["side"] == "buy").sum()
-        sell_count = (df["side"] == "sell").sum()
-
-        buy_sell_ratio = (buy_vol / sell_vol) if sell_vol > 0 else float("inf")
-
-        return {
-            "df": df,
-            "buy_volume": buy_vol,
-            "sell_volume": sell_vol,
-            "total_volume": total_vol,
-            "buy_count": int(buy_count),
-            "sell_count": int(sell_count),
-            "buy_sell_ratio": round(buy_sell_ratio, 4),
-            "buy_pct": round(buy_vol / total_vol * 100, 1) if total_vol else 50,
-        }
+        resp = http_client.get(f"{BASE_URL}/Trades", params={"pair": pair}, timeout=TIMEOUT, provider="kraken")
+        return _parse_trades(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
 
+@cached("kraken.spread", soft_seconds=60, hard_seconds=10 * 60)
 def get_spread_history(pair="RLSUSD"):
     """Get recent spread history for a pair from Kraken."""
     try:
-        resp = requests.get(
-            f"{BASE_URL}/Spread",
-            params={"pair": pair},
-            timeout=TIMEOUT,
-        )
-        data = resp.json()
-        if data.get("error"):
-            return {"error": ", ".join(data["error"])}
-
-        result = data["result"]
-        pair_key = _get_pair_key(result)
-        if not pair_key:
-            return {"error": "No data in response"}
-        raw = result[pair_key]
-
-        rows = []
-        for entry in raw:
-            bid = float(entry[1])
-            ask = float(entry[2])
-            mid = (bid + ask) / 2
-            spread_bps = ((ask - bid) / mid * 10000) if mid else 0
-            rows.append({
-                "timestamp": datetime.utcfromtimestamp(entry[0]),
-                "bid": bid,
-                "ask": ask,
-                "spread": round(ask - bid, 8),
-                "spread_bps": round(spread_bps, 2),
-            })
-
-        df = pd.DataFrame(rows)
-        return {
-            "df": df,
-            "avg_spread_bps": round(df["spread_bps"].mean(), 2) if not df.empty else 0,
-            "current_spread_bps": df["spread_bps"].iloc[-1] if not df.empty else 0,
-        }
+        resp = http_client.get(f"{BASE_URL}/Spread", params={"pair": pair}, timeout=TIMEOUT, provider="kraken")
+        return _parse_spread(resp.json())
     except Exception as e:
         return {"error": str(e)}
 
@@ -259,41 +271,129 @@ def get_all_market_data(pair="RLSUSD"):
     }
 
 
+def _with_names(tickers):
+    return {
+        name: {**ticker, "pair": KRAKEN_PAIRS[name], "name": name}
+        for name, ticker in tickers.items()
+        if isinstance(ticker, dict) and "error" not in ticker
+    }
+
+
 def get_all_tickers():
     """
     Fetch ticker data for all tracked tokens.
     Returns dict of {token_name: ticker_data} for tokens that are available.
     Tokens that return errors are skipped.
     """
-    results = {}
-    for name, pair in KRAKEN_PAIRS.items():
-        ticker = get_ticker(pair)
-        if isinstance(ticker, dict) and "error" not in ticker:
-            ticker["pair"] = pair
-            ticker["name"] = name
-            results[name] = ticker
-    return results
+    return _with_names(fan_out_dict(lambda name, pair: get_ticker(pair), KRAKEN_PAIRS, provider="kraken"))
+
+
+def _peer_entry(pair, ticker, book, trades):
+    if isinstance(ticker, dict) and "error" in ticker:
+        return None
+    return {
+        "pair": pair,
+        "ticker": ticker,
+        "order_book": book if isinstance(book, dict) and "error" not in book else None,
+        "trades": trades if isinstance(trades, dict) and "error" not in trades else None,
+    }
 
 
 def get_peer_comparison():
     """
     Fetch comparison data (ticker + order book) for all tracked tokens.
     Returns dict of {token_name: {ticker, order_book}} for available tokens.
+    Tokens are fetched concurrently, within the Kraken concurrency limit.
     """
-    results = {}
-    for name, pair in KRAKEN_PAIRS.items():
+    def fetch_one(name, pair):
         ticker = get_ticker(pair)
         if isinstance(ticker, dict) and "error" in ticker:
-            continue
-        book = get_order_book(pair, count=15)
-        trades = get_recent_trades(pair)
-        results[name] = {
-            "pair": pair,
-            "ticker": ticker,
-            "order_book": book if isinstance(book, dict) and "error" not in book else None,
-            "trades": trades if isinstance(trades, dict) and "error" not in trades else None,
-        }
-    return results
+            return None
+        return _peer_entry(pair, ticker, get_order_book(pair, count=15), get_recent_trades(pair))
+
+    comparison = fan_out_dict(fetch_one, KRAKEN_PAIRS, provider="kraken")
+    return {name: data for name, data in comparison.items() if data is not None}
+
+
+# Async variants: same arguments, cache rows and results as the functions above
+
+@cached("kraken.ticker")
+async def get_ticker_async(pair="RLSUSD"):
+    try:
+        resp = await async_fetch.get_json(f"{BASE_URL}/Ticker", params={"pair": pair}, provider="kraken", timeout=TIMEOUT)
+        return _parse_ticker(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("kraken.ohlc")
+async def get_ohlc_async(pair="RLSUSD", interval="1d", limit=60):
+    try:
+        kraken_interval = INTERVAL_MAP.get(interval, 1440)
+        resp = await async_fetch.get_json(
+            f"{BASE_URL}/OHLC",
+            params={"pair": pair, "interval": kraken_interval},
+            provider="kraken",
+            timeout=TIMEOUT,
+        )
+        return _parse_ohlc(resp.data, limit)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("kraken.order_book")
+async def get_order_book_async(pair="RLSUSD", count=20):
+    try:
+        resp = await async_fetch.get_json(
+            f"{BASE_URL}/Depth", params={"pair": pair, "count": count}, provider="kraken", timeout=TIMEOUT
+        )
+        return _parse_order_book(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("kraken.trades")
+async def get_recent_trades_async(pair="RLSUSD"):
+    try:
+        resp = await async_fetch.get_json(f"{BASE_URL}/Trades", params={"pair": pair}, provider="kraken", timeout=TIMEOUT)
+        return _parse_trades(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@cached("kraken.spread")
+async def get_spread_history_async(pair="RLSUSD"):
+    try:
+        resp = await async_fetch.get_json(f"{BASE_URL}/Spread", params={"pair": pair}, provider="kraken", timeout=TIMEOUT)
+        return _parse_spread(resp.data)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def get_all_market_data_async(pair="RLSUSD"):
+    ticker, order_book, trades, spread = await asyncio.gather(
+        get_ticker_async(pair),
+        get_order_book_async(pair, count=25),
+        get_recent_trades_async(pair),
+        get_spread_history_async(pair),
+    )
+    return {"ticker": ticker, "order_book": order_book, "trades": trades, "spread": spread}
+
+
+async def get_all_tickers_async():
+    tickers = await asyncio.gather(*(get_ticker_async(pair) for pair in KRAKEN_PAIRS.values()))
+    return _with_names(dict(zip(KRAKEN_PAIRS, tickers)))
+
+
+async def get_peer_comparison_async():
+    async def fetch_one(pair):
+        ticker, book, trades = await asyncio.gather(
+            get_ticker_async(pair), get_order_book_async(pair, count=15), get_recent_trades_async(pair)
+        )
+        return _peer_entry(pair, ticker, book, trades)
+
+    comparison = await asyncio.gather(*(fetch_one(pair) for pair in KRAKEN_PAIRS.values()))
+    return {name: data for name, data in zip(KRAKEN_PAIRS, comparison) if data is not None}
 
 
 def compute_market_signal(data):
@@ -1,8 +1,11 @@
 import os
-import requests
 import streamlit as st
 from dotenv import load_dotenv
 
+from . import async_fetch
+from . import http_client
+from .provider_cache import cached, raise_error, return_none
+
 load_dotenv()
 
 
@@ -26,33 +29,34 @@ COINGECKO_TO_CMC_SYMBOL = {
 }
 
 
-def getCoinMarketCapPrice(symbol: str):
-    """
-    Get token price and price changes from CoinMarketCap API.
+CMC_QUOTES_URL = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
 
-    Args:
-        symbol: CoinMarketCap token symbol (e.g., "BTC", "ETH")
+_EMPTY_QUOTE = {"price": None, "market_cap": None, "percent_change_24h": None, "percent_change_7d": None, "percent_change_30d": None}
 
-    Returns:
-        Dictionary with current price and percent changes (24h, 7d, 30d)
-    """
-    api_key = get_secret("COINMARKET_API_KEY")
-    url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
 
-    headers = {
+def _cmc_headers():
+    return {
         "Accepts": "application/json",
-        "X-CMC_PRO_API_KEY": api_key,
+        "X-CMC_PRO_API_KEY": get_secret("COINMARKET_API_KEY"),
     }
 
-    params = {
-        "symbol": symbol,
-        "convert": "USD",
-    }
 
-    response = requests.get(url, headers=headers, params=params)
-    data = response.json()
+def _cmc_symbols(coingecko_ids: list[str]):
+    """Map CoinGecko IDs to CoinMarketCap symbols; returns (symbols, {cg_id: symbol})."""
+    symbols = []
+    id_to_symbol = {}
+    for cg_id in coingecko_ids:
+        symbol = COINGECKO_TO_CMC_SYMBOL.get(cg_id)
+        if symbol:
+            symbols.append(symbol)
+            id_to_symbol[cg_id] = symbol
+    return symbols, id_to_symbol
+
 
-    if response.status_code == 200 and "data" in data and symbol in data["data"]:
+# Response parsers, shared by the sync fetchers and their *_async variants
+
+def _parse_price(status_code, data, symbol):
+    if status_code == 200 and "data" in data and symbol in data["data"]:
         token_data = data["data"][symbol]
         quote = token_data["quote"]["USD"]
         return {
@@ -66,46 +70,8 @@ def getCoinMarketCapPrice(symbol: str):
         raise Exception(f"Error fetching price for {symbol}: {error_msg}")
 
 
-def getCoinMarketCapPricesBatch(coingecko_ids: list[str]):
-    """
-    Get prices and price changes for multiple tokens in a single API call.
-    Uses CoinMarketCap API with symbol mapping from CoinGecko IDs.
-
-    Args:
-        coingecko_ids: List of CoinGecko token IDs (for compatibility)
-
-    Returns:
-        Dictionary mapping CoinGecko token ID to price data
-    """
-    api_key = get_secret("COINMARKET_API_KEY")
-    url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
-
-    headers = {
-        "Accepts": "application/json",
-        "X-CMC_PRO_API_KEY": api_key,
-    }
-
-    # Map CoinGecko IDs to CoinMarketCap symbols
-    symbols = []
-    id_to_symbol = {}
-    for cg_id in coingecko_ids:
-        symbol = COINGECKO_TO_CMC_SYMBOL.get(cg_id)
-        if symbol:
-            symbols.append(symbol)
-            id_to_symbol[cg_id] = symbol
-
-    if not symbols:
-        return {cg_id: {"price": None, "market_cap": None, "percent_change_24h": None, "percent_change_7d": None, "percent_change_30d": None} for cg_id in coingecko_ids}
-
-    params = {
-        "symbol": ",".join(symbols),
-        "convert": "USD",
-    }
-
-    response = requests.get(url, headers=headers, params=params)
-    data = response.json()
-
-    if response.status_code != 200:
+def _parse_prices_batch(status_code, data, coingecko_ids, id_to_symbol):
+    if status_code != 200:
         error_msg = data.get("status", {}).get("error_message", "Unknown error")
         raise Exception(f"Error fetching prices from CoinMarketCap: {error_msg}")
 
@@ -126,17 +92,73 @@ def getCoinMarketCapPricesBatch(coingecko_ids: list[str]):
                 "percent_change_30d": quote.get("percent_change_30d"),
             }
         else:
-            results[cg_id] = {
-                "price": None,
-                "market_cap": None,
-                "percent_change_24h": None,
-                "percent_change_7d": None,
-                "percent_change_30d": None,
-            }
+            results[cg_id] = dict(_EMPTY_QUOTE)
 
     return results
 
 
+def _parse_rayls_price(status_code, data):
+    if status_code == 200 and "data" in data:
+        rls_data = data["data"]["RLS"]
+        quote = rls_data["quote"]["USD"]
+        return {
+            "symbol": "RLS",
+            "price_usd": quote["price"],
+            "market_cap": quote.get("market_cap"),
+            "volume_24h": quote.get("volume_24h"),
+            "percent_change_24h": quote.get("percent_change_24h"),
+            "percent_change_7d": quote.get("percent_change_7d"),
+            "percent_change_30d": quote.get("percent_change_30d"),
+        }
+    else:
+        raise Exception(f"Error fetching RLS price: {data.get('status', {}).get('error_message', 'Unknown error')}")
+
+
+@cached("cmc.price", soft_seconds=5 * 60, hard_seconds=60 * 60, on_error=raise_error)
+def getCoinMarketCapPrice(symbol: str):
+    """
+    Get token price and price changes from CoinMarketCap API.
+
+    Args:
+        symbol: CoinMarketCap token symbol (e.g., "BTC", "ETH")
+
+    Returns:
+        Dictionary with current price and percent changes (24h, 7d, 30d)
+    """
+    params = {
+        "symbol": symbol,
+        "convert": "USD",
+    }
+
+    response = http_client.get(CMC_QUOTES_URL, headers=_cmc_headers(), params=params, provider="coinmarketcap")
+    return _parse_price(response.status_code, response.json(), symbol)
+
+
+@cached("cmc.prices_batch", soft_seconds=5 * 60, hard_seconds=60 * 60, on_error=raise_error)
+def getCoinMarketCapPricesBatch(coingecko_ids: list[str]):
+    """
+    Get prices and price changes for multiple tokens in a single API call.
+    Uses CoinMarketCap API with symbol mapping from CoinGecko IDs.
+
+    Args:
+        coingecko_ids: List of CoinGecko token IDs (for compatibility)
+
+    Returns:
+        Dictionary mapping CoinGecko token ID to price data
+    """
+    symbols, id_to_symbol = _cmc_symbols(coingecko_ids)
+    if not symbols:
+        return {cg_id: dict(_EMPTY_QUOTE) for cg_id in coingecko_ids}
+
+    params = {
+        "symbol": ",".join(symbols),
+        "convert": "USD",
+    }
+
+    response = http_client.get(CMC_QUOTES_URL, headers=_cmc_headers(), params=params, provider="coinmarketcap")
+    return _parse_prices_batch(response.status_code, response.json(), coingecko_ids, id_to_symbol)
+
+
 # Keep old function names as aliases for backwards compatibility
 def getCoingeckoPrice(coingecko_id: str):
     """Alias for getCoinMarketCapPrice (uses symbol mapping)."""
@@ -151,44 +173,54 @@ def getCoingeckoPricesBatch(coingecko_ids: list[str]):
     return getCoinMarketCapPricesBatch(coingecko_ids)
 
 
+@cached("cmc.rayls_price", soft_seconds=5 * 60, hard_seconds=60 * 60, on_error=raise_error)
 def getRaylsPrice():
     """
     Get the latest Rayls (RLS) token price in USD from CoinMarketCap API.
     Includes price changes for 24h, 7d, and 30d.
     """
-    api_key = get_secret("COINMARKET_API_KEY")
-
-    url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
-
-    headers = {
-        "Accepts": "application/json",
-        "X-CMC_PRO_API_KEY": api_key,
-    }
-
     parameters = {
         "symbol": "RLS",
         "convert": "USD"
     }
 
-    response = requests.get(url, headers=headers, params=parameters)
-    data = response.json()
+    response = http_client.get(CMC_QUOTES_URL, headers=_cmc_headers(), params=parameters, provider="coinmarketcap")
+    return _parse_rayls_price(response.status_code, response.json())
 
-    if response.status_code == 200 and "data" in data:
-        rls_data = data["data"]["RLS"]
-        quote = rls_data["quote"]["USD"]
-        return {
-            "symbol": "RLS",
-            "price_usd": quote["price"],
-            "market_cap": quote.get("market_cap"),
-            "volume_24h": quote.get("volume_24h"),
-            "percent_change_24h": quote.get("percent_change_24h"),
-            "percent_change_7d": quote.get("percent_change_7d"),
-            "percent_change_30d": quote.get("percent_change_30d"),
-        }
-    else:
-        raise Exception(f"Error fetching RLS price: {data.get('status', {}).get('error_message', 'Unknown error')}")
 
+# Async variants: same arguments, cache rows and results as the functions above
 
+@cached("cmc.price", on_error=raise_error)
+async def getCoinMarketCapPriceAsync(symbol: str):
+    resp = await async_fetch.get_json(
+        CMC_QUOTES_URL, params={"symbol": symbol, "convert": "USD"}, provider="coinmarketcap", headers=_cmc_headers()
+    )
+    return _parse_price(resp.status, resp.data, symbol)
+
+
+@cached("cmc.prices_batch", on_error=raise_error)
+async def getCoinMarketCapPricesBatchAsync(coingecko_ids: list[str]):
+    symbols, id_to_symbol = _cmc_symbols(coingecko_ids)
+    if not symbols:
+        return {cg_id: dict(_EMPTY_QUOTE) for cg_id in coingecko_ids}
+    resp = await async_fetch.get_json(
+        CMC_QUOTES_URL,
+        params={"symbol": ",".join(symbols), "convert": "USD"},
+        provider="coinmarketcap",
+        headers=_cmc_headers(),
+    )
+    return _parse_prices_batch(resp.status, resp.data, coingecko_ids, id_to_symbol)
+
+
+@cached("cmc.rayls_price", on_error=raise_error)
+async def getRaylsPriceAsync():
+    resp = await async_fetch.get_json(
+        CMC_QUOTES_URL, params={"symbol": "RLS", "convert": "USD"}, provider="coinmarketcap", headers=_cmc_headers()
+    )
+    return _parse_rayls_price(resp.status, resp.data)
+
+
+@cached("coingecko.history", soft_seconds=60 * 60, hard_seconds=24 * 3600, on_error=return_none)
 def getHistoricalPrices(coingecko_id: str, days: int = 30):
     """
     Get historical price data from CoinGecko (free tier supports historical data).
@@ -210,7 +242,7 @@ def getHistoricalPrices(coingecko_id: str, days: int = 30):
         params["interval"] = "daily"
 
     try:
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params, provider="coingecko")
         data = response.json()
 
         if response.status_code != 200:
@@ -233,8 +265,6 @@ def getHistoricalPricesBatch(token_configs: list, days: int = 30):
     Returns:
         Dictionary mapping token name to price series
     """
-    import time
-
     results = {}
 
     for config in token_configs:
@@ -242,11 +272,10 @@ def getHistoricalPricesBatch(token_configs: list, days: int = 30):
         name = config.get("name")
 
         try:
+            # CoinGecko's 30 calls/min is enforced by the coingecko rate limit bucket
             prices = getHistoricalPrices(coingecko_id, days)
             if prices and len(prices) > 0:
                 results[name] = prices
-            # Add delay to avoid CoinGecko rate limiting (10-50 calls/min for free tier)
-            time.sleep(1.5)
         except Exception:
             continue
 
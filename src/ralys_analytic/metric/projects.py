@@ -0,0 +1,15 @@
+# Projects compared on the dashboard:
+# (name, display_name, token_supply, circulating_token, coingecko_id, type, revenue_override)
+PROJECT_METADATA = [
+    ("zksync_era", "zkSync Era", 21_000_000_000, 8_620_000_000,"zksync", "protocol", None),
+    ("plume_mainnet", "Plume Mainnet", 10_000_000_000, 4_800_000_000,"plume", "protocol", None),
+    ("avalanche", "Avalanche", 715_740_000, 431_720_000,"avalanche-2", "protocol", None),
+    ("ondo_finance", "Ondo Finance", 10_000_000_000,4_860_000_000, "ondo-finance", "protocol", None),
+    ("ondo_yield_assets", "Ondo Yield Assets", 1_250_000_000, 628_940_000,"ondo-us-dollar-yield", "protocol", None),
+    ("polygon", "Polygon", 10_000_000_000, 1_910_000_000, "polygon-ecosystem-token", "chain", None),
+    ("chainlink", "Chainlink", 1_000_000_000, 626_000_000, "chainlink", "protocol", None),
+    ("rayls", "Rayls (RLS)", 10_000_000_000, 1_500_000_000,"rls", "protocol", 2_000_000),
+]
+
+# CoinGecko ids priced in one CoinMarketCap batch (Rayls is fetched separately)
+BATCH_PRICE_IDS = [item[4] for item in PROJECT_METADATA if item[4] != "rls"]
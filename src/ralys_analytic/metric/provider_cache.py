@@ -0,0 +1,240 @@
+"""
+provider_cache.py - Put any metric fetcher behind the shared db_cache.
+
+    @cached("kraken.ticker", soft_seconds=60, hard_seconds=15 * 60)
+    def get_ticker(pair="RLSUSD"):
+        ...
+
+Each decorated function gets its own data_type and TTL policy (overridable
+from cache_config.json like any other data_type). The call arguments, bound
+against the signature with defaults applied, form the row key, so a cold
+restart serves the last stored result instead of calling the provider, and
+every process sharing cache.db shares one copy. Stale-while-revalidate,
+single-flight and the error cool-down all come from db_cache.get_or_fetch().
+
+Results are stored as JSON. DataFrames, datetimes and numpy scalars are
+tagged on the way in and rebuilt on the way out, so callers get the same
+types as from an uncached call - and a new object on every call, which they
+may mutate freely.
+
+A fetcher fails by returning None or {"error": ...}, or by raising. Failures
+are never stored as results; on_error decides what the caller sees when the
+provider is cooling down and there is no last good result.
+
+Coroutine fetchers can be decorated too. An async variant given the same
+data_type and the same parameters as its synchronous twin shares its rows:
+
+    @cached("kraken.ticker")
+    async def get_ticker_async(pair="RLSUSD"):
+        ...
+"""
+
+import io
+import json
+import inspect
+import logging
+import functools
+from datetime import datetime
+from typing import Optional, Dict, Any, Callable, Iterable
+
+import numpy as np
+import pandas as pd
+
+from . import db_cache
+
+logger = logging.getLogger(__name__)
+
+# Registry of every cached fetcher, by data_type
+CACHED_FETCHERS: Dict[str, Callable] = {}
+# Async variants, which share their data_type with a CACHED_FETCHERS entry
+CACHED_ASYNC_FETCHERS: Dict[str, Callable] = {}
+
+_TAG = "__type__"
+
+_tables_ready = False
+
+
+def error_dict(error: str) -> Dict[str, str]:
+    """Default on_error: the {"error": str} convention used across metric modules."""
+    return {"error": error}
+
+
+def return_none(error: str) -> None:  # noqa: ARG001
+    """on_error for fetchers that signal failure with None."""
+    return None
+
+
+def raise_error(error: str):
+    """on_error for fetchers that signal failure by raising."""
+    raise Exception(error)
+
+
+def _tag(value: Any) -> Any:
+    if isinstance(value, pd.DataFrame):
+        return {_TAG: "dataframe", "data": value.to_json(orient="table", date_format="iso", date_unit="us")}
+    if isinstance(value, datetime):
+        return {_TAG: "datetime", "value": value.isoformat()}
+    if isinstance(value, dict):
+        return {str(k): _tag(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_tag(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _untag(value: Any) -> Any:
+    if isinstance(value, dict):
+        kind = value.get(_TAG)
+        if kind == "dataframe":
+            return pd.read_json(io.StringIO(value["data"]), orient="table")
+        if kind == "datetime":
+            return datetime.fromisoformat(value["value"])
+        return {k: _untag(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_untag(v) for v in value]
+    return value
+
+
+def _ensure_tables():
+    """Scripts like main.py never call db_cache.initialize_tables(); do it on first use."""
+    global _tables_ready
+    if not _tables_ready:
+        try:
+            db_cache.initialize_tables()
+        except Exception:
+            pass  # logged by initialize_tables; get_or_fetch falls back to the provider
+        _tables_ready = True
+
+
+def _make_key(signature: inspect.Signature, ignore: Iterable[str], args, kwargs) -> str:
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+    return json.dumps(arguments, sort_keys=True, separators=(",", ":"))
+
+
+def cached(
+    data_type: str,
+    soft_seconds: Optional[float] = None,
+    hard_seconds: Optional[float] = None,
+    ignore: Iterable[str] = (),
+    on_error: Callable[[str], Any] = error_dict,
+):
+    """
+    Decorator: serve a fetcher through the persistent db_cache.
+
+    Args:
+        data_type: Cache data type, one per fetcher (e.g. "kraken.ticker")
+        soft_seconds: TTL before a result is refreshed in the background
+        hard_seconds: TTL after which callers block on a fresh fetch
+        ignore: Argument names left out of the key (e.g. an API client object)
+        on_error: Maps the error message to the return value when the provider
+            is cooling down and no earlier result exists
+
+    The wrapper keeps the original function as .uncached and exposes
+    .cache_key(), .cache_status() and .refresh() (fetch and store now), all
+    taking the fetcher's own arguments. Coroutine functions get a coroutine
+    wrapper with .uncached, .cache_key() and .cache_status().
+    """
+    if soft_seconds is not None:
+        db_cache.register_ttl_policy(data_type, soft_seconds, hard_seconds or soft_seconds)
+    ignore = frozenset(ignore)
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            return _cached_async(fn, data_type, ignore, on_error)
+        signature = inspect.signature(fn)
+
+        def cache_key(*args, **kwargs) -> str:
+            return _make_key(signature, ignore, args, kwargs)
+
+        def fetch(args, kwargs) -> Dict[str, Any]:
+            result = fn(*args, **kwargs)
+            if result is None:
+                return {"error": "Empty response"}
+            if isinstance(result, dict) and "error" in result:
+                return {"error": str(result["error"])}
+            return {"value": _tag(result)}
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                key = cache_key(*args, **kwargs)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Uncacheable call to {data_type}, calling provider directly: {e}")
+                return fn(*args, **kwargs)
+
+            _ensure_tables()
+            payload = db_cache.get_or_fetch(
+                data_type=data_type,
+                token_name=key,
+                contract_address="",
+                chain="",
+                fetch_fn=lambda: fetch(args, kwargs),
+            )
+            if "value" in payload:
+                return _untag(payload["value"])
+            return on_error(payload.get("error", "Unknown error"))
+
+        def cache_status(*args, **kwargs) -> Dict[str, Any]:
+            return db_cache.get_cache_status(data_type, cache_key(*args, **kwargs))
+
+        def refresh(*args, **kwargs) -> bool:
+            _ensure_tables()
+            return db_cache.refresh(data_type, cache_key(*args, **kwargs), "", "", lambda: fetch(args, kwargs))
+
+        wrapper.data_type = data_type
+        wrapper.uncached = fn
+        wrapper.cache_key = cache_key
+        wrapper.cache_status = cache_status
+        wrapper.refresh = refresh
+        CACHED_FETCHERS[data_type] = wrapper
+        return wrapper
+
+    return decorator
+
+
+def _cached_async(fn, data_type: str, ignore: frozenset, on_error: Callable[[str], Any]):
+    signature = inspect.signature(fn)
+
+    def cache_key(*args, **kwargs) -> str:
+        return _make_key(signature, ignore, args, kwargs)
+
+    async def fetch(args, kwargs) -> Dict[str, Any]:
+        result = await fn(*args, **kwargs)
+        if result is None:
+            return {"error": "Empty response"}
+        if isinstance(result, dict) and "error" in result:
+            return {"error": str(result["error"])}
+        return {"value": _tag(result)}
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        try:
+            key = cache_key(*args, **kwargs)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Uncacheable call to {data_type}, calling provider directly: {e}")
+            return await fn(*args, **kwargs)
+
+        _ensure_tables()
+        payload = await db_cache.get_or_fetch_async(
+            data_type=data_type,
+            token_name=key,
+            contract_address="",
+            chain="",
+            fetch_fn=lambda: fetch(args, kwargs),
+        )
+        if "value" in payload:
+            return _untag(payload["value"])
+        return on_error(payload.get("error", "Unknown error"))
+
+    def cache_status(*args, **kwargs) -> Dict[str, Any]:
+        return db_cache.get_cache_status(data_type, cache_key(*args, **kwargs))
+
+    wrapper.data_type = data_type
+    wrapper.uncached = fn
+    wrapper.cache_key = cache_key
+    wrapper.cache_status = cache_status
+    CACHED_ASYNC_FETCHERS[data_type] = wrapper
+    return wrapper
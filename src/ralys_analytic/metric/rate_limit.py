@@ -0,0 +1,201 @@
+"""
+rate_limit.py - Token-bucket rate limits per provider and API key.
+
+http_client and async_fetch take a token before every request made with a
+provider= argument and wait only when the bucket is empty:
+
+    wait = rate_limit.reserve("etherscan", api_key)   # 0.0 while under quota
+    time.sleep(wait)
+
+Each (provider, API key) pair has its own bucket, refilled at the provider's
+sustained rate up to its burst size (RATE_LIMITS). Requests made without an
+API key share the provider's anonymous bucket.
+
+Responses feed back into the bucket through observe():
+
+- 429 / 418 with Retry-After: the bucket is emptied and blocked until then
+- Binance X-MBX-USED-WEIGHT-1M: the bucket is capped at the weight left in
+  the current minute, so other processes' usage of the same IP counts too
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict, Any, Mapping, NamedTuple, Tuple
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit(NamedTuple):
+    per_second: float  # sustained rate
+    burst: float  # bucket capacity
+
+
+# Published free-tier limits, rounded down
+RATE_LIMITS: Dict[str, RateLimit] = {
+    "etherscan": RateLimit(5, 5),  # 5 calls/s
+    "coingecko": RateLimit(30 / 60, 10),  # 30 calls/min (demo key)
+    "coinmarketcap": RateLimit(30 / 60, 10),  # 30 calls/min (basic plan)
+    "moralis": RateLimit(25, 25),
+    "kraken": RateLimit(3, 20),  # public endpoints, per IP
+    "binance": RateLimit(2400 / 60, 2400),  # request weight per minute, per IP
+}
+
+# Binance reports the request weight used in the current minute on every response
+BINANCE_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+BINANCE_WEIGHT_LIMIT = 2400
+
+# Where providers take their API key, for picking the bucket
+API_KEY_FIELDS = ("apikey", "X-API-Key", "X-CMC_PRO_API_KEY", "x-cg-demo-api-key", "x-cg-pro-api-key")
+
+# Longest Retry-After honoured, so a bogus header can't stall a page load
+MAX_RETRY_AFTER_SECONDS = 120
+
+
+class TokenBucket:
+    """Thread-safe token bucket; reserve() books a token now and returns the wait until it is valid."""
+
+    def __init__(self, per_second: float, burst: float):
+        self.per_second = per_second
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.per_second)
+        self._updated = now
+
+    def reserve(self, cost: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Tokens may go negative: later callers queue behind earlier reservations
+            self._tokens -= cost
+            wait = -self._tokens / self.per_second if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def cap(self, remaining: float):
+        """Lower the tokens to a provider-reported remaining quota."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, remaining)
+
+    def block(self, seconds: float):
+        """Empty the bucket and refuse tokens for the next `seconds`."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0)
+            self._blocked_until = max(self._blocked_until, now + seconds)
+
+
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def set_rate_limit(provider: str, per_second: float, burst: float):
+    """Change a provider's limit (existing buckets are replaced)."""
+    with _buckets_lock:
+        RATE_LIMITS[provider] = RateLimit(per_second, burst)
+        for key in [key for key in _buckets if key[0] == provider]:
+            del _buckets[key]
+
+
+def _key_id(api_key: Optional[str]) -> str:
+    # Buckets are labelled by a digest so keys never show up in logs or metrics
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(str(api_key).encode()).hexdigest()[:12]
+
+
+def api_key_from(params: Optional[Mapping[str, Any]], headers: Optional[Mapping[str, Any]]) -> Optional[str]:
+    """The API key a request carries, if any (see API_KEY_FIELDS)."""
+    for source in (headers, params):
+        if not source:
+            continue
+        for field in API_KEY_FIELDS:
+            value = source.get(field)
+            if value:
+                return str(value)
+    return None
+
+
+def _bucket(provider: str, api_key: Optional[str]) -> Optional[TokenBucket]:
+    limit = RATE_LIMITS.get(provider)
+    if limit is None:
+        return None
+    key = (provider, _key_id(api_key))
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(key)
+            if bucket is None:
+                bucket = _buckets[key] = TokenBucket(limit.per_second, limit.burst)
+    return bucket
+
+
+def reserve(provider: Optional[str], api_key: Optional[str] = None, cost: float = 1) -> float:
+    """
+    Take `cost` tokens from the provider's bucket for this API key.
+
+    Returns:
+        Seconds the caller must wait before sending (0.0 while under quota);
+        providers without a configured limit never wait
+    """
+    if not provider:
+        return 0.0
+    bucket = _bucket(provider, api_key)
+    if bucket is None:
+        return 0.0
+    wait = bucket.reserve(cost)
+    if wait > 0:
+        telemetry.inc("rate_limit_waits_total", provider=provider)
+        telemetry.observe("rate_limit_wait_seconds", wait, provider=provider)
+    return wait
+
+
+def acquire(provider: Optional[str], api_key: Optional[str] = None, cost: float = 1):
+    """reserve() and sleep for as long as it says."""
+    wait = reserve(provider, api_key, cost)
+    if wait > 0:
+        time.sleep(wait)
+
+
+def _header(headers: Mapping[str, Any], name: str) -> Optional[str]:
+    # requests' headers are case-insensitive; plain dicts (async_fetch) are not
+    value = headers.get(name)
+    if value is None:
+        lower = name.lower()
+        value = next((v for k, v in headers.items() if k.lower() == lower), None)
+    return value
+
+
+def observe(provider: Optional[str], api_key: Optional[str], status: Optional[int], headers: Optional[Mapping[str, Any]]):
+    """Adjust the bucket from a response's status and rate-limit headers."""
+    if not provider or headers is None:
+        return
+    bucket = _bucket(provider, api_key)
+    if bucket is None:
+        return
+
+    if status in (418, 429):
+        retry_after = _header(headers, "Retry-After")
+        try:
+            seconds = min(float(retry_after), MAX_RETRY_AFTER_SECONDS) if retry_after else 1 / bucket.per_second
+        except ValueError:
+            seconds = 1 / bucket.per_second
+        telemetry.inc("rate_limit_rejections_total", provider=provider)
+        logger.warning(f"{provider} rate limit hit (HTTP {status}), pausing requests for {seconds:.1f}s")
+        bucket.block(seconds)
+
+    used_weight = _header(headers, BINANCE_WEIGHT_HEADER)
+    if used_weight is not None:
+        try:
+            bucket.cap(BINANCE_WEIGHT_LIMIT - float(used_weight))
+        except ValueError:
+            pass
@@ -0,0 +1,260 @@
+"""
+resilience.py - Retries and circuit breakers for provider requests.
+
+http_client.request() and async_fetch.request_json() send every request
+through here:
+
+- idempotent requests (GET/HEAD) that fail with a connection error, a timeout
+  or a RETRYABLE_STATUS response are retried up to MAX_ATTEMPTS times with
+  jittered exponential backoff, unless the failed attempts already took
+  MAX_RETRY_SECONDS (a 30 s read timeout is not retried)
+- each provider has a circuit breaker: after FAILURE_THRESHOLD consecutive
+  failed attempts it opens, and requests fail immediately with
+  CircuitOpenError for OPEN_SECONDS instead of waiting on timeouts. Then one
+  trial request is let through (half-open); its outcome closes the circuit
+  or opens it again.
+
+Metrics: http_retries_total, circuit_breaker_trips_total and
+circuit_breaker_rejections_total by provider, and the circuit_breaker_open
+gauge (1 while a provider's circuit is open or half-open).
+"""
+
+import time
+import logging
+import threading
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple, Type
+
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    RetryCallState,
+    retry_if_exception_type,
+    retry_if_result,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_random_exponential,
+)
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRYABLE_STATUS = {500, 502, 503, 504}
+
+MAX_ATTEMPTS = 3
+MAX_RETRY_SECONDS = 10
+# Full jitter: the n-th retry waits uniform(0, min(BACKOFF_SECONDS * 2**n, MAX_BACKOFF_SECONDS))
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 4
+
+FAILURE_THRESHOLD = 5
+OPEN_SECONDS = 30
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the provider's circuit is open."""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} is failing, requests paused for {retry_in:.0f}s (circuit open)")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one provider (thread-safe)."""
+
+    def __init__(self, provider: str, failure_threshold: int = FAILURE_THRESHOLD, open_seconds: float = OPEN_SECONDS):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            retry_in = self._opened_at + self.open_seconds - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        telemetry.inc("circuit_breaker_rejections_total", provider=self.provider)
+        raise CircuitOpenError(self.provider, max(retry_in, 0))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.provider} circuit closed")
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                tripped = True
+            else:
+                tripped = False
+        if tripped:
+            telemetry.inc("circuit_breaker_trips_total", provider=self.provider)
+            logger.warning(
+                f"{self.provider} circuit opened after {self.failures} consecutive failures, "
+                f"failing fast for {self.open_seconds:.0f}s"
+            )
+
+    def release(self):
+        """End an attempt that says nothing about the provider's health (e.g. a bad URL)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+telemetry.register_gauge(
+    "circuit_breaker_open",
+    lambda: {(("provider", name),): float(breaker.state != CLOSED) for name, breaker in list(_breakers.items())},
+)
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """The provider's circuit breaker, created closed on first use."""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(provider)
+            if breaker is None:
+                breaker = _breakers[provider] = CircuitBreaker(provider)
+    return breaker
+
+
+def reset_breakers():
+    """Close every circuit (e.g. after fixing an API key)."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def _log_retry(provider: Optional[str], status_of: Callable[[Any], Optional[int]]):
+    def before_sleep(state: RetryCallState):
+        if state.outcome.failed:
+            reason = type(state.outcome.exception()).__name__
+        else:
+            reason = f"HTTP {status_of(state.outcome.result())}"
+        telemetry.inc("http_retries_total", provider=provider or "none")
+        logger.warning(
+            f"{provider or 'HTTP'} request failed ({reason}), "
+            f"retry {state.attempt_number}/{MAX_ATTEMPTS - 1} in {state.next_action.sleep:.2f}s"
+        )
+    return before_sleep
+
+
+def _retry_policy(
+    provider: Optional[str], transient: Tuple[Type[BaseException], ...], status_of: Callable[[Any], Optional[int]]
+) -> Dict[str, Any]:
+    return dict(
+        stop=stop_after_attempt(MAX_ATTEMPTS) | stop_after_delay(MAX_RETRY_SECONDS),
+        wait=wait_random_exponential(multiplier=BACKOFF_SECONDS, max=MAX_BACKOFF_SECONDS),
+        retry=retry_if_exception_type(transient) | retry_if_result(lambda r: status_of(r) in RETRYABLE_STATUS),
+        before_sleep=_log_retry(provider, status_of),
+        # Out of attempts: return the last response, or re-raise the last error
+        retry_error_callback=lambda state: state.outcome.result(),
+    )
+
+
+def _record(breaker: Optional[CircuitBreaker], status: Optional[int]):
+    if breaker is None:
+        return
+    if status in RETRYABLE_STATUS:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def call(
+    send: Callable[[], Any],
+    provider: Optional[str],
+    method: str,
+    transient: Tuple[Type[BaseException], ...],
+    status_of: Callable[[Any], Optional[int]],
+) -> Any:
+    """
+    Run send() behind the provider's circuit breaker, retrying transient failures.
+
+    Args:
+        send: Sends the request once and returns the response
+        provider: Circuit breaker to use; None retries without a breaker
+        method: HTTP method; only IDEMPOTENT_METHODS are retried
+        transient: Exception types worth retrying (connection errors, timeouts)
+        status_of: Reads the HTTP status from send()'s response
+
+    Returns:
+        The first non-retryable response, or the last one once attempts run
+        out; raises the last error, or CircuitOpenError without sending
+    """
+    breaker = get_breaker(provider) if provider else None
+
+    def attempt():
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            response = send()
+        except transient:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+        _record(breaker, status_of(response))
+        return response
+
+    if method.upper() not in IDEMPOTENT_METHODS:
+        return attempt()
+    return Retrying(**_retry_policy(provider, transient, status_of))(attempt)
+
+
+async def call_async(
+    send: Callable[[], Awaitable[Any]],
+    provider: Optional[str],
+    method: str,
+    transient: Tuple[Type[BaseException], ...],
+    status_of: Callable[[Any], Optional[int]],
+) -> Any:
+    """call() for a coroutine function; backoff sleeps don't block the event loop."""
+    breaker = get_breaker(provider) if provider else None
+
+    async def attempt():
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            response = await send()
+        except transient:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+        _record(breaker, status_of(response))
+        return response
+
+    if method.upper() not in IDEMPOTENT_METHODS:
+        return await attempt()
+    return await AsyncRetrying(**_retry_policy(provider, transient, status_of))(attempt)
@@ -1,11 +1,15 @@
 from datetime import datetime
 
+from .provider_cache import cached, raise_error
 
+
+@cached("defillama.revenue_chain", soft_seconds=6 * 3600, hard_seconds=48 * 3600, ignore=("client",), on_error=raise_error)
 def getRevenueByChain(client, chain):
     chain_string = chain.lower().replace(" ", "_")
     result = client.fees.getOverviewByChain(chain_string)
     return result['totalDataChart']
 
+@cached("defillama.revenue_protocol", soft_seconds=6 * 3600, hard_seconds=48 * 3600, ignore=("client",), on_error=raise_error)
 def getRevenueByProtocol(client,protocol):
     protocol_string = protocol.lower().replace(" ", "_")
     result = client.fees.getSummary(protocol_string)
@@ -0,0 +1,156 @@
+"""
+sketches.py - Mergeable fixed-size sketches for long transfer windows.
+
+Two summaries whose memory does not grow with the number of transfers, for
+statistics that are otherwise exact sets and value lists:
+
+    addresses = HyperLogLog()
+    addresses.add_hashes(hash64(["0xabc...", "0xdef..."]))
+    addresses.count()              # distinct addresses, about 0.8% off
+
+    values = KLLSketch()
+    values.add(np.array([1.5, 20.0, 300.0]))
+    values.quantile(0.95)          # rank within about 1.7% of 0.95 * n
+
+Both merge: merging the sketches of two days gives the sketch of the two
+days together (with the same error bounds), so per-day sketches can be
+built once and rolled up into any longer window.
+
+HyperLogLog (Flajolet et al., 2007) keeps 2**precision one-byte registers,
+each the longest run of leading zero bits seen among the hashes routed to
+it. The count has a relative standard error of 1.04 / sqrt(2**precision):
+0.81% at the default precision 14 (16 KiB), so within 2.4% in 99.7% of
+cases. Small counts use linear counting over the empty registers and are
+close to exact. Merging takes the register-wise maximum, which is exactly
+the sketch of the union; counts never double up across merged days.
+
+KLLSketch (Karnin, Lang and Liberty, 2016) keeps a stack of compactors.
+Level h holds items that each stand for 2**h inputs; when a level fills it
+is sorted and every other item (from a random offset) moves up a level. It
+keeps O(k) items whatever the input size. With the default k = 200 the
+rank of the returned value is within about 1.65% of q * n with 99%
+confidence (the bound Apache DataSketches publishes for the same k); the
+error scales as 1 / k. The returned value is always one of the inputs,
+not an interpolation between two of them.
+"""
+
+import hashlib
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+HLL_PRECISION = 14
+KLL_K = 200
+
+# Hash bits after the register index that HyperLogLog ranks; 50 bits convert
+# to float64 exactly, so np.frexp gives the exact position of the top bit
+_RANK_BITS = 50
+
+
+def hash64(keys: Iterable[str]) -> np.ndarray:
+    """Stable 64-bit hashes (BLAKE2b) of strings, the same in every process and day."""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") for key in keys),
+        dtype=np.uint64,
+    )
+
+
+class HyperLogLog:
+    """Approximate distinct count of 64-bit hashes; relative standard error 1.04 / sqrt(2**precision)."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        if not 4 <= precision <= 64 - _RANK_BITS:
+            raise ValueError(f"precision must be between 4 and {64 - _RANK_BITS}, got {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add uint64 hashes (see hash64); adding a hash twice changes nothing."""
+        if not len(hashes):
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        rest = (hashes >> np.uint64(64 - self.precision - _RANK_BITS)) & np.uint64((1 << _RANK_BITS) - 1)
+        # Leading zeros of the rank bits, plus one (an all-zero run ranks _RANK_BITS + 1)
+        _, exponent = np.frexp(rest.astype(np.float64))
+        rank = (_RANK_BITS + 1 - exponent).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold other into this sketch (the sketch of the union of both inputs)."""
+        if other.precision != self.precision:
+            raise ValueError(f"cannot merge precision {other.precision} into {self.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small range: linear counting over the empty registers
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class KLLSketch:
+    """Approximate quantiles of a stream of floats in O(k) memory; rank error about 1.65% at k = 200."""
+
+    def __init__(self, k: int = KLL_K, seed: Optional[int] = 0):
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        # Lower levels shrink geometrically (by 2/3) below the top one
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - level))))
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Fold other into this sketch (a sketch of both inputs together)."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                items = np.sort(items)
+                # An odd item out stays; the rest halve, each survivor now weighing twice as much
+                keep, items = items[:len(items) % 2], items[len(items) % 2:]
+                promoted = items[int(self._rng.integers(2))::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The value at rank q * n (0 <= q <= 1), or None if nothing was added."""
+        if not self.n:
+            return None
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(level_items), 1 << level, dtype=np.int64) for level, level_items in enumerate(self.levels)
+        ])
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        index = int(np.searchsorted(cumulative, q * cumulative[-1], side="left"))
+        return float(items[order[min(index, len(order) - 1)]])
+
+    def __len__(self):
+        """Items retained (not the number added, which is n)."""
+        return sum(len(items) for items in self.levels)
@@ -0,0 +1,271 @@
+"""
+snapshots.py - Append-only history of cached API responses.
+
+db_cache.update_cache() overwrites the api_cache row on every refresh. Each
+write is also appended here, inside the same transaction, so earlier holder
+counts and analytics figures stay queryable without paying for historical
+endpoints:
+
+- api_snapshots: one row per fetch with the encoded payload (same codec as
+  api_cache), so new metrics can be back-filled from old fetches later.
+- snapshot_metrics: the key numeric fields of each fetch, one row per
+  (token, metric, fetch time), clustered on that key for range queries.
+
+Numeric fields are pulled out by per-data_type extractors; see
+register_extractor(). Only data types with an extractor are snapshotted, so
+high-churn provider caches (order books, tickers) don't grow the history.
+
+History is not evicted with api_cache; the db_cache janitor calls prune()
+with separate retention windows for the bulky payloads and the small
+metric rows.
+"""
+
+import sqlite3
+import logging
+from typing import Optional, Dict, Any, Callable, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS api_snapshots (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    data_type     TEXT NOT NULL,
+    token_name    TEXT NOT NULL,
+    fetched_at    REAL NOT NULL,
+    response_data BLOB NOT NULL,
+    codec         TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_snapshots_lookup
+    ON api_snapshots (data_type, token_name, fetched_at);
+
+CREATE INDEX IF NOT EXISTS idx_snapshots_fetched_at
+    ON api_snapshots (fetched_at);
+
+CREATE TABLE IF NOT EXISTS snapshot_metrics (
+    data_type  TEXT NOT NULL,
+    token_name TEXT NOT NULL,
+    metric     TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    value      REAL NOT NULL,
+    PRIMARY KEY (data_type, token_name, metric, fetched_at)
+) WITHOUT ROWID;
+"""
+
+_INSERT_SNAPSHOT_SQL = """
+INSERT INTO api_snapshots (data_type, token_name, fetched_at, response_data, codec)
+VALUES (?, ?, ?, ?, ?);
+"""
+
+_INSERT_METRIC_SQL = """
+INSERT OR REPLACE INTO snapshot_metrics (data_type, token_name, metric, fetched_at, value)
+VALUES (?, ?, ?, ?, ?);
+"""
+
+_MAX_IN_PARAMS = 500
+
+Extractor = Callable[[Dict[str, Any]], Dict[str, float]]
+_extractors: Dict[str, Extractor] = {}
+
+
+def register_extractor(data_type: str, extractor: Extractor):
+    """
+    Register the function that pulls numeric metrics out of a data_type's payload.
+
+    Args:
+        data_type: Cache data type (e.g. "holders")
+        extractor: Called with the raw API payload, returns {metric_name: value}
+    """
+    _extractors[data_type] = extractor
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _flatten(prefix: str, values: Any, field: Optional[str] = None) -> Dict[str, float]:
+    """{"24h": 1.5} -> {"prefix.24h": 1.5}; with field, reads values[key][field]."""
+    metrics = {}
+    if not isinstance(values, dict):
+        return metrics
+    for key, value in values.items():
+        if field is not None:
+            value = value.get(field) if isinstance(value, dict) else None
+        number = _to_float(value)
+        if number is not None:
+            metrics[f"{prefix}.{key}"] = number
+    return metrics
+
+
+def _extract_holders(data: Dict[str, Any]) -> Dict[str, float]:
+    metrics = {}
+    total = _to_float(data.get("totalHolders"))
+    if total is not None:
+        metrics["total_holders"] = total
+    metrics.update(_flatten("holder_change", data.get("holderChange"), "change"))
+    metrics.update(_flatten("supply_pct", data.get("holderSupply"), "supplyPercent"))
+    metrics.update(_flatten("distribution", data.get("holderDistribution")))
+    metrics.update(_flatten("acquisition", data.get("holdersByAcquisition")))
+    return metrics
+
+
+_ANALYTICS_WINDOWED_FIELDS = {
+    "totalBuyVolume": "buy_volume",
+    "totalSellVolume": "sell_volume",
+    "totalBuyers": "buyers",
+    "totalSellers": "sellers",
+    "totalBuys": "buys",
+    "totalSells": "sells",
+    "uniqueWallets": "unique_wallets",
+    "pricePercentChange": "price_change_pct",
+}
+
+_ANALYTICS_SCALAR_FIELDS = {
+    "usdPrice": "usd_price",
+    "totalLiquidityUsd": "liquidity_usd",
+    "totalFullyDilutedValuation": "fdv",
+}
+
+
+def _extract_analytics(data: Dict[str, Any]) -> Dict[str, float]:
+    metrics = {}
+    for field, name in _ANALYTICS_WINDOWED_FIELDS.items():
+        metrics.update(_flatten(name, data.get(field)))
+    for field, name in _ANALYTICS_SCALAR_FIELDS.items():
+        number = _to_float(data.get(field))
+        if number is not None:
+            metrics[name] = number
+    return metrics
+
+
+register_extractor("holders", _extract_holders)
+register_extractor("analytics", _extract_analytics)
+
+
+def extract_metrics(data_type: str, data: Dict[str, Any]) -> Dict[str, float]:
+    """Numeric metrics for a payload, or {} when the data_type has no extractor."""
+    extractor = _extractors.get(data_type)
+    if extractor is None:
+        return {}
+    try:
+        return extractor(data)
+    except Exception as e:
+        logger.warning(f"Metric extraction failed for {data_type}: {e}")
+        return {}
+
+
+def create_tables(conn: sqlite3.Connection):
+    conn.executescript(_CREATE_SQL)
+
+
+def append(
+    conn: sqlite3.Connection,
+    data_type: str,
+    entries: Iterable[Tuple[str, float, bytes, str, Dict[str, Any]]],
+):
+    """
+    Append one snapshot per entry. Runs inside the caller's transaction; a
+    no-op for data types without an extractor.
+
+    Args:
+        conn: Open connection, normally inside db_cache's upsert transaction
+        data_type: Cache data type (e.g. "holders")
+        entries: (token_name, fetched_at epoch seconds, encoded payload, codec, raw data) tuples
+    """
+    if data_type not in _extractors:
+        return
+    snapshot_rows = []
+    metric_rows = []
+    for token_name, fetched_at, payload, codec, data in entries:
+        snapshot_rows.append((data_type, token_name, fetched_at, payload, codec))
+        for metric, value in extract_metrics(data_type, data).items():
+            metric_rows.append((data_type, token_name, metric, fetched_at, value))
+    conn.executemany(_INSERT_SNAPSHOT_SQL, snapshot_rows)
+    conn.executemany(_INSERT_METRIC_SQL, metric_rows)
+
+
+def prune(
+    conn: sqlite3.Connection,
+    snapshots_before: Optional[float],
+    metrics_before: Optional[float],
+) -> Tuple[int, int]:
+    """
+    Delete history older than the given cutoffs.
+
+    Args:
+        conn: Open connection
+        snapshots_before: Drop api_snapshots rows fetched before this epoch time (None keeps all)
+        metrics_before: Drop snapshot_metrics rows fetched before this epoch time (None keeps all)
+
+    Returns:
+        (snapshot rows deleted, metric rows deleted)
+    """
+    snapshots_deleted = metrics_deleted = 0
+    with conn:
+        if snapshots_before is not None:
+            snapshots_deleted = conn.execute(
+                "DELETE FROM api_snapshots WHERE fetched_at < ?;", (snapshots_before,)
+            ).rowcount
+        if metrics_before is not None:
+            metrics_deleted = conn.execute(
+                "DELETE FROM snapshot_metrics WHERE fetched_at < ?;", (metrics_before,)
+            ).rowcount
+    return snapshots_deleted, metrics_deleted
+
+
+def query_metrics(
+    conn: sqlite3.Connection,
+    data_type: str,
+    token_name: str,
+    metrics: Optional[List[str]] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+) -> List[Tuple[str, float, float]]:
+    """
+    Range query over snapshot_metrics.
+
+    Args:
+        conn: Open connection
+        data_type: Cache data type (e.g. "holders")
+        token_name: Token key (e.g. "Rayls (RLS)")
+        metrics: Metric names to return (all metrics if None)
+        since: Inclusive lower bound, epoch seconds
+        until: Inclusive upper bound, epoch seconds
+
+    Returns:
+        (metric, fetched_at, value) tuples ordered by metric then time
+    """
+    since = float("-inf") if since is None else since
+    until = float("inf") if until is None else until
+    if metrics is None:
+        return conn.execute(
+            "SELECT metric, fetched_at, value FROM snapshot_metrics "
+            "WHERE data_type = ? AND token_name = ? AND fetched_at BETWEEN ? AND ? "
+            "ORDER BY metric, fetched_at;",
+            (data_type, token_name, since, until),
+        ).fetchall()
+
+    rows = []
+    for start in range(0, len(metrics), _MAX_IN_PARAMS):
+        chunk = metrics[start:start + _MAX_IN_PARAMS]
+        placeholders = ", ".join("?" * len(chunk))
+        rows.extend(conn.execute(
+            "SELECT metric, fetched_at, value FROM snapshot_metrics "
+            f"WHERE data_type = ? AND token_name = ? AND metric IN ({placeholders}) "
+            "AND fetched_at BETWEEN ? AND ? "
+            "ORDER BY metric, fetched_at;",
+            (data_type, token_name, *chunk, since, until),
+        ).fetchall())
+    return rows
+
+
+def list_metrics(conn: sqlite3.Connection, data_type: str, token_name: str) -> List[str]:
+    """Names of the metrics recorded for a token."""
+    rows = conn.execute(
+        "SELECT DISTINCT metric FROM snapshot_metrics WHERE data_type = ? AND token_name = ? ORDER BY metric;",
+        (data_type, token_name),
+    ).fetchall()
+    return [row[0] for row in rows]
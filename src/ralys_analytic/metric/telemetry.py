@@ -0,0 +1,257 @@
+"""
+telemetry.py - In-process counters and latency histograms.
+
+db_cache records every lookup (by tier), write, upstream fetch and janitor
+pass here. Metrics are keyed by name plus a small set of labels
+(data_type, tier, outcome, ...):
+
+    telemetry.inc("cache_lookups_total", data_type="holders", tier="l1")
+    with telemetry.timer("upstream_fetch_seconds", data_type="holders"):
+        ...
+
+snapshot() returns everything as a dict (with p50/p95/p99 estimates for
+histograms); render_prometheus() / write_prometheus() produce the Prometheus
+text exposition format, so a node_exporter textfile collector can pick the
+file up. start_exporter() rewrites the file periodically in the background.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "ralys_"
+
+# Upper bounds in seconds: sub-millisecond L1 hits up to slow paginated API calls
+LATENCY_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+EXPORT_INTERVAL_SECONDS = 30
+_PROM_PATH = os.getenv(
+    "TELEMETRY_PROM_FILE",
+    os.path.join(os.path.dirname(__file__), "..", "..", "..", "cache_metrics.prom"),
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[Labels, float]] = {}
+_histograms: Dict[str, Dict[Labels, "_Histogram"]] = {}
+_gauges: Dict[str, Callable[[], Dict[Labels, float]]] = {}
+
+_exporter_thread: Optional[threading.Thread] = None
+_exporter_lock = threading.Lock()
+
+
+class _Histogram:
+    __slots__ = ("bucket_counts", "count", "total")
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.bucket_counts[i] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (Prometheus-style estimate)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.bucket_counts):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Add value to a counter."""
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels):
+    """Record one latency observation."""
+    key = _labels(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = _Histogram()
+        histogram.observe(seconds)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Observe the wall time of the with-block, including when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def register_gauge(name: str, collect: Callable[[], Dict[Labels, float]]):
+    """
+    Register a gauge computed on demand.
+
+    Args:
+        name: Metric name
+        collect: Returns {labels: value}; use labels=() for an unlabelled gauge
+    """
+    _gauges[name] = collect
+
+
+def counter_values(name: str) -> List[Tuple[Dict[str, str], float]]:
+    """Current (labels, value) pairs of one counter."""
+    with _lock:
+        return [(dict(labels), value) for labels, value in _counters.get(name, {}).items()]
+
+
+def _collect_gauges() -> Dict[str, Dict[Labels, float]]:
+    values = {}
+    for name, collect in list(_gauges.items()):
+        try:
+            values[name] = collect()
+        except Exception as e:
+            logger.warning(f"Gauge {name} failed: {e}")
+    return values
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    All metrics as plain data.
+
+    Returns:
+        {"counters": {name: [{"labels", "value"}]},
+         "histograms": {name: [{"labels", "count", "sum", "p50", "p95", "p99", "buckets"}]},
+         "gauges": {name: [{"labels", "value"}]}}
+        Histogram "buckets" maps each upper bound to its cumulative count.
+    """
+    with _lock:
+        counters = {
+            name: [{"labels": dict(labels), "value": value} for labels, value in series.items()]
+            for name, series in _counters.items()
+        }
+        histograms = {}
+        for name, series in _histograms.items():
+            histograms[name] = []
+            for labels, h in series.items():
+                cumulative, running = {}, 0
+                for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), h.bucket_counts):
+                    running += n
+                    cumulative[bound] = running
+                histograms[name].append({
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum": h.total,
+                    "p50": h.quantile(0.50),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                    "buckets": cumulative,
+                })
+    gauges = {
+        name: [{"labels": dict(labels), "value": value} for labels, value in series.items()]
+        for name, series in _collect_gauges().items()
+    }
+    return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for k, v in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus() -> str:
+    """Render snapshot() in the Prometheus text exposition format."""
+    snap = snapshot()
+    lines = []
+    for name, series in sorted(snap["counters"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for s in series:
+            lines.append(f"{PREFIX}{name}{_format_labels(s['labels'])} {_format_value(s['value'])}")
+    for name, series in sorted(snap["gauges"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} gauge")
+        for s in series:
+            lines.append(f"{PREFIX}{name}{_format_labels(s['labels'])} {_format_value(s['value'])}")
+    for name, series in sorted(snap["histograms"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for s in series:
+            for bound, count in s["buckets"].items():
+                le = ("le", _format_value(bound))
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(s['labels'], le)} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(s['labels'])} {_format_value(s['sum'])}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(s['labels'])} {s['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: Optional[str] = None) -> str:
+    """Atomically write render_prometheus() to path (TELEMETRY_PROM_FILE by default)."""
+    path = path or _PROM_PATH
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+def _exporter_loop(path: Optional[str], interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            write_prometheus(path)
+        except Exception as e:
+            logger.error(f"Prometheus export failed: {e}")
+
+
+def start_exporter(path: Optional[str] = None, interval: float = EXPORT_INTERVAL_SECONDS):
+    """Start the background thread that rewrites the Prometheus file, once per process."""
+    global _exporter_thread
+    with _exporter_lock:
+        if _exporter_thread is not None and _exporter_thread.is_alive():
+            return
+        _exporter_thread = threading.Thread(
+            target=_exporter_loop, args=(path, interval), name="telemetry-exporter", daemon=True
+        )
+        _exporter_thread.start()
+
+
+def reset():
+    """Drop all recorded counters and histograms (gauges stay registered)."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,192 @@
+"""
+transfer_columns.py - Columnar token transfers for the Etherscan analyses.
+
+A window of transfers is parsed once into NumPy arrays instead of being
+re-read from tokentx dicts by every analysis:
+
+    columns = from_tokentx(page["result"])     # or from_rows(transfer_store rows)
+    recent = columns.since(end_timestamp - 7 * 86400)
+    days, day_index = recent.days()
+    volume_per_day = np.bincount(day_index, weights=recent.value, minlength=len(days))
+
+A window too large to hold at once is parsed chunk by chunk with
+iter_columns(), whose chunks share one AddressTable so that an address has
+the same code in all of them. Consumers that only look at one chunk's
+addresses at a time can pass shared=False, and then nothing is kept across
+chunks.
+
+Addresses are lowercased once per distinct address and stored as int32 codes
+into `addresses`, so per-address group-bys are np.bincount calls. Values are
+float64 whole-token amounts equal to int(value) / 10**decimals, as the row
+loops computed them. Rows keep the input order (newest first for
+transfer_store reads), and np.bincount sums in row order, so totals match
+what a Python loop over the same rows adds up.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_DAY = 86400
+
+
+class TransferColumns(NamedTuple):
+    hash: np.ndarray  # object
+    block: np.ndarray  # int64
+    timestamp: np.ndarray  # int64
+    from_code: np.ndarray  # int32 index into addresses
+    to_code: np.ndarray  # int32 index into addresses
+    value: np.ndarray  # float64, whole tokens
+    addresses: np.ndarray  # object, lowercase; shared by every slice of a window
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def take(self, index) -> "TransferColumns":
+        """Rows selected by a slice, boolean mask or index array (addresses are shared)."""
+        return TransferColumns(
+            self.hash[index], self.block[index], self.timestamp[index],
+            self.from_code[index], self.to_code[index], self.value[index], self.addresses,
+        )
+
+    def since(self, start_timestamp: int) -> "TransferColumns":
+        """Rows at or after start_timestamp; rows must be newest first."""
+        # timestamp is descending, so -timestamp is ascending
+        return self.take(slice(0, int(np.searchsorted(-self.timestamp, -start_timestamp, side="right"))))
+
+    @property
+    def day(self) -> np.ndarray:
+        """UTC day number (days since the epoch) of every row."""
+        return self.timestamp // SECONDS_PER_DAY
+
+    def days(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(distinct day numbers ascending, per-row index into them)."""
+        return np.unique(self.day, return_inverse=True)
+
+
+def day_label(day: int) -> str:
+    return datetime.utcfromtimestamp(int(day) * SECONDS_PER_DAY).strftime("%Y-%m-%d")
+
+
+def minute_label(timestamp: int) -> str:
+    return datetime.utcfromtimestamp(int(timestamp)).strftime("%Y-%m-%d %H:%M")
+
+
+def _empty() -> TransferColumns:
+    return TransferColumns(
+        np.empty(0, dtype=object), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+        np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64),
+        np.empty(0, dtype=object),
+    )
+
+
+class AddressTable:
+    """Lowercase address <-> code, kept across the chunks of one stream."""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._addresses = np.empty(1024, dtype=object)
+
+    def __len__(self):
+        return len(self._codes)
+
+    @property
+    def addresses(self) -> np.ndarray:
+        """Every address so far, by code (a view; later chunks only append)."""
+        return self._addresses[:len(self._codes)]
+
+    def encode(self, uniques: Sequence[str]) -> np.ndarray:
+        """Codes for distinct raw addresses, adding the new ones."""
+        codes = np.empty(len(uniques), dtype=np.int32)
+        for i, address in enumerate(uniques):
+            address = address.lower()
+            code = self._codes.get(address)
+            if code is None:
+                code = self._codes[address] = len(self._codes)
+                if code == len(self._addresses):
+                    # Grow into a new buffer; views handed out earlier keep the old one
+                    self._addresses = np.concatenate([self._addresses, np.empty(code, dtype=object)])
+                self._addresses[code] = address
+            codes[i] = code
+        return codes
+
+
+def _address_codes(from_addresses: Sequence[str], to_addresses: Sequence[str], table: Optional[AddressTable] = None):
+    """Lowercase-insensitive codes for both address columns, lowering each distinct address once."""
+    n = len(from_addresses)
+    codes, uniques = pd.factorize(np.array(list(from_addresses) + list(to_addresses), dtype=object))
+    if table is not None:
+        codes = table.encode(uniques)[codes]
+        return codes[:n], codes[n:], table.addresses
+    lower_codes, addresses = pd.factorize(np.array([address.lower() for address in uniques], dtype=object))
+    codes = lower_codes[codes].astype(np.int32)
+    return codes[:n], codes[n:], np.asarray(addresses, dtype=object)
+
+
+def _build(hashes, blocks, timestamps, from_addresses, to_addresses, values, decimals, table=None) -> TransferColumns:
+    if not len(timestamps):
+        return _empty()
+    from_code, to_code, addresses = _address_codes(from_addresses, to_addresses, table)
+    np.asarray(decimals, dtype=object).astype(np.int64)  # validate
+    # Raw amounts exceed int64. Parsing "<raw>e-<decimals>" rounds once, so
+    # values equal int(value) / 10 ** decimals (float(raw) / 10.0 ** decimals
+    # rounds twice and turns a 100000-token transfer into 99999.99999999999)
+    value = np.asarray([f"{raw}e-{d}" for raw, d in zip(values, decimals)], dtype=object).astype(np.float64)
+    return TransferColumns(
+        np.asarray(hashes, dtype=object),
+        np.asarray(blocks, dtype=object).astype(np.int64),
+        np.asarray(timestamps, dtype=object).astype(np.int64),
+        from_code,
+        to_code,
+        value,
+        addresses,
+    )
+
+
+def _valid(tx) -> bool:
+    try:
+        int(tx.get("value", 0)), int(tx.get("timeStamp", 0)), int(tx.get("blockNumber", 0)), int(tx.get("tokenDecimal", 18))
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+def from_tokentx(transfers: Sequence[dict]) -> TransferColumns:
+    """Columns from tokentx result dicts (strings as the API returns them); malformed rows are skipped."""
+    try:
+        return _build(
+            [tx.get("hash", "") for tx in transfers],
+            [tx.get("blockNumber", 0) for tx in transfers],
+            [tx.get("timeStamp", 0) for tx in transfers],
+            [tx.get("from", "") for tx in transfers],
+            [tx.get("to", "") for tx in transfers],
+            [tx.get("value", 0) for tx in transfers],
+            [tx.get("tokenDecimal", 18) for tx in transfers],
+        )
+    except (ValueError, TypeError):
+        # Only pay for per-row validation when a page actually has a bad row
+        return from_tokentx([tx for tx in transfers if _valid(tx)])
+
+
+def from_rows(rows: Sequence[tuple], table: Optional[AddressTable] = None) -> TransferColumns:
+    """Columns from (hash, block, timestamp, from, to, value, decimals) tuples, as transfer_store reads them."""
+    if not rows:
+        return _empty()
+    return _build(*zip(*rows), table=table)
+
+
+def iter_columns(row_chunks: Iterable[Sequence[tuple]], shared: bool = True) -> Iterator[TransferColumns]:
+    """
+    from_rows() over each chunk of transfer_store.iter_transfer_rows().
+
+    With shared=True an address has the same code in every chunk, and each
+    chunk's `addresses` holds every address so far; with shared=False codes
+    and `addresses` are per chunk.
+    """
+    table = AddressTable() if shared else None
+    for rows in row_chunks:
+        if rows:
+            yield from_rows(rows, table)
+
@@ -0,0 +1,571 @@
+"""
+transfer_store.py - Local store of ERC-20 transfers, synced incrementally.
+
+etherscan.py used to page through tokentx from the newest transfer on every
+call. Transfers are now kept in cache.db, per (chain, contract):
+
+- token_transfers: one row per transfer, keyed by (tx hash, log index)
+- transfer_sync_state: the highest block ingested (last_block), the oldest
+  one kept, covered_from - the timestamp from which the stored history is
+  complete - and retain_seconds, the longest window asked for the token
+
+A sync is planned by TransferSync and driven by the caller, which sends the
+requests it asks for, each batch concurrently (etherscan.py does so from both
+its sync and async fetchers):
+
+    sync = TransferSync(contract_address, chain, since_timestamp)
+    while requests := sync.next_requests():
+        for request, page in zip(requests, fetch_concurrently(requests)):
+            sync.add_page(page, request)
+    sync.commit()
+
+Each page is written as soon as add_page() receives it, so a sync holds one
+page in memory however long the window is; commit() records the new sync
+state. Reads are chunked too: once the sync is done, iter_transfer_rows()
+yields a window in chunks of CHUNK_ROWS.
+
+A token seen for the first time is backfilled newest-first down to the
+requested window. The window start is resolved to a block first
+(set_start_block(), with Etherscan's getblocknobytime lookup memoised in
+block_timestamps), so the backfill asks for exactly startblock..endblock
+instead of paging back from the newest transfer until one falls outside the
+window. After that, a sync only asks for startblock > last_block
+(minus REORG_MARGIN_BLOCKS, which are fetched again and replace what was
+stored, so transfers dropped by a reorg disappear). Pages are walked with a
+block cursor rather than page numbers, which Etherscan caps at 10,000 rows.
+On commit, rows older than the token's retention are pruned: its longest
+requested window, and at least db_cache.TRANSFER_RETENTION_DAYS
+(transfer_retention_days in cache_config.json). A 90-day or full-history
+window therefore stays stored instead of being pruned and backfilled again
+on every sync. The store as a whole is capped separately from api_cache: the
+db_cache janitor calls evict() to drop the least recently synced tokens
+once token_transfers holds more than db_cache.TRANSFER_MAX_ROWS rows.
+
+Long backfills (30 or 90 days of a liquid token) are sharded. When the first
+backfill page comes back full, the rest of the window is requested in
+batches of SHARDS_PER_BATCH block ranges at once, each sized to hold
+SHARD_FILL of a page at the transfer density the previous batch measured, so
+bursts and quiet stretches both settle on shards that fit one response. A
+shard that still fills a page has the blocks past its last one queued again.
+Rows are keyed by (hash, log index), so blocks fetched twice are stored once.
+
+Only one sync per token runs at a time: the caller holds the db_cache lease
+named by sync_lease() around it, across threads and processes sharing
+cache.db, so two workers never backfill the same token or overwrite each
+other's sync state.
+"""
+
+import logging
+from typing import Optional, Dict, Any, Iterable, Iterator, List, NamedTuple, Tuple
+
+from . import cassette
+from . import db_cache
+
+logger = logging.getLogger(__name__)
+
+# tokentx rows per request (Etherscan's maximum)
+PAGE_SIZE = 10000
+# Rows per chunk when a window is read back
+CHUNK_ROWS = 10000
+LATEST_BLOCK = 99999999
+
+# Recent blocks fetched again on every sync, in case they were reorganised
+REORG_MARGIN_BLOCKS = {
+    "eth": 12,
+    "optimism": 64,
+    "arbitrum": 64,
+    "bsc": 64,
+    "avalanche": 64,
+    "polygon": 256,
+}
+DEFAULT_REORG_MARGIN = 64
+
+# Backfill shards are sized to fill this share of a page at the density seen
+# so far, so that most of them come back complete in one response
+SHARD_FILL = 0.8
+SHARDS_PER_BATCH = 6
+
+# Window starts are rounded down to the hour before the block lookup, so
+# windows computed a few seconds apart share one memoised block
+BLOCK_LOOKUP_SECONDS = 3600
+
+# db_cache lease namespace that serialises the syncs of each token
+SYNC_LEASE = "transfer_sync"
+
+FORWARD = "forward"
+BACKFILL = "backfill"
+DONE = "done"
+
+_CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS token_transfers (
+    chain            TEXT NOT NULL,
+    contract_address TEXT NOT NULL,  -- lowercase
+    tx_hash          TEXT NOT NULL,
+    log_key          TEXT NOT NULL,  -- logIndex, or from:to:value when the API omits it
+    block_number     INTEGER NOT NULL,
+    time_stamp       INTEGER NOT NULL,
+    from_address     TEXT NOT NULL,
+    to_address       TEXT NOT NULL,
+    value            TEXT NOT NULL,  -- raw integer amount, can exceed 64 bits
+    token_decimal    INTEGER NOT NULL,
+    PRIMARY KEY (chain, contract_address, tx_hash, log_key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_transfers_time
+    ON token_transfers (chain, contract_address, time_stamp);
+
+CREATE INDEX IF NOT EXISTS idx_transfers_block
+    ON token_transfers (chain, contract_address, block_number);
+
+CREATE TABLE IF NOT EXISTS transfer_sync_state (
+    chain            TEXT NOT NULL,
+    contract_address TEXT NOT NULL,
+    last_block       INTEGER NOT NULL,
+    oldest_block     INTEGER NOT NULL,
+    covered_from     INTEGER NOT NULL,  -- stored transfers are complete from this timestamp on
+    synced_at        REAL NOT NULL,
+    retain_seconds   INTEGER NOT NULL DEFAULT 0,  -- longest window (seconds back from a sync) asked for
+    PRIMARY KEY (chain, contract_address)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS block_timestamps (
+    chain            TEXT NOT NULL,
+    time_stamp       INTEGER NOT NULL,
+    block_number     INTEGER NOT NULL,  -- first block at or after time_stamp
+    PRIMARY KEY (chain, time_stamp)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_TRANSFER_SQL = """
+INSERT OR REPLACE INTO token_transfers
+    (chain, contract_address, tx_hash, log_key, block_number, time_stamp,
+     from_address, to_address, value, token_decimal)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+_UPSERT_STATE_SQL = """
+INSERT OR REPLACE INTO transfer_sync_state
+    (chain, contract_address, last_block, oldest_block, covered_from, synced_at, retain_seconds)
+VALUES (?, ?, ?, ?, ?, ?, ?);
+"""
+
+_SELECT_RANGE_SQL = """
+SELECT tx_hash, log_key, block_number, time_stamp, from_address, to_address, value, token_decimal
+FROM token_transfers
+WHERE chain = ? AND contract_address = ? AND time_stamp BETWEEN ? AND ?
+ORDER BY time_stamp DESC, block_number DESC;
+"""
+
+
+class SyncState(NamedTuple):
+    last_block: int
+    oldest_block: int
+    covered_from: int
+    synced_at: float
+    retain_seconds: int
+
+
+def create_tables(conn):
+    """Create the transfer tables (called from db_cache.initialize_tables)."""
+    conn.executescript(_CREATE_SQL)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(transfer_sync_state);")}
+    if "retain_seconds" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE transfer_sync_state ADD COLUMN retain_seconds INTEGER NOT NULL DEFAULT 0;")
+        logger.info("Added retain_seconds column to transfer_sync_state")
+
+
+def _key(contract_address: str, chain: str) -> Tuple[str, str]:
+    return chain, contract_address.lower()
+
+
+def sync_lease(contract_address: str, chain: str) -> Tuple[str, str]:
+    """The (data_type, token_name) db_cache lease to hold while syncing a token."""
+    return SYNC_LEASE, ":".join(_key(contract_address, chain))
+
+
+def reorg_margin(chain: str) -> int:
+    return REORG_MARGIN_BLOCKS.get(chain, DEFAULT_REORG_MARGIN)
+
+
+def get_sync_state(contract_address: str, chain: str) -> Optional[SyncState]:
+    row = db_cache._get_connection().execute(
+        "SELECT last_block, oldest_block, covered_from, synced_at, retain_seconds FROM transfer_sync_state "
+        "WHERE chain = ? AND contract_address = ?;",
+        _key(contract_address, chain),
+    ).fetchone()
+    return SyncState(*row) if row else None
+
+
+def block_lookup_timestamp(timestamp: int) -> int:
+    """The timestamp a window starting at `timestamp` is resolved to a block with (hour floor)."""
+    return timestamp - timestamp % BLOCK_LOOKUP_SECONDS
+
+
+def get_block_at(chain: str, timestamp: int) -> Optional[int]:
+    """The memoised first block at or after timestamp, or None if it was never looked up."""
+    row = db_cache._get_connection().execute(
+        "SELECT block_number FROM block_timestamps WHERE chain = ? AND time_stamp = ?;", (chain, timestamp)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def set_block_at(chain: str, timestamp: int, block_number: int):
+    """Memoise a timestamp -> block lookup (past blocks don't change, so entries never expire)."""
+    conn = db_cache._get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO block_timestamps (chain, time_stamp, block_number) VALUES (?, ?, ?);",
+            (chain, timestamp, block_number),
+        )
+
+
+def _row(tx: Dict[str, Any]) -> Optional[Tuple]:
+    """A tokentx result as (tx_hash, log_key, block, timestamp, from, to, value, decimals)."""
+    try:
+        from_address = tx.get("from", "").lower()
+        to_address = tx.get("to", "").lower()
+        value = str(int(tx.get("value", 0)))
+        log_key = tx.get("logIndex")
+        if log_key in (None, ""):
+            log_key = f"{from_address}:{to_address}:{value}"
+        return (
+            tx["hash"],
+            str(log_key),
+            int(tx["blockNumber"]),
+            int(tx.get("timeStamp", 0)),
+            from_address,
+            to_address,
+            value,
+            int(tx.get("tokenDecimal", 18)),
+        )
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+class TransferSync:
+    """
+    Plans the tokentx requests that bring one token's stored transfers up to date.
+
+    Args:
+        contract_address: Token contract address
+        chain: Chain identifier (eth, polygon, ...)
+        since_timestamp: Oldest transfer the caller needs; history older than
+            what is stored is backfilled down to it
+        max_pages: Request budget for this sync; anything left over is
+            fetched by the next one
+    """
+
+    def __init__(self, contract_address: str, chain: str, since_timestamp: int, max_pages: int = 5):
+        self.chain, self.contract_address = _key(contract_address, chain)
+        self.since_timestamp = since_timestamp
+        self.max_pages = max_pages
+        self.pages = 0
+        self.row_count = 0
+        self.state = get_sync_state(contract_address, chain)
+
+        self.forward_from: Optional[int] = None
+        self.last_block = self.state.last_block if self.state else None
+        self.oldest_block = self.state.oldest_block if self.state else None
+        self.covered_from = self.state.covered_from if self.state else None
+        self._backfill_end = LATEST_BLOCK
+        # Lowest block the backfill asks for, and the timestamp it is complete from
+        self.start_block = 0
+        self._start_timestamp = 0
+        # Sharded backfill: block ranges not requested yet (newest first),
+        # requested and fetched ones, and the density measured by the last batch
+        self._unsharded: Optional[List[Tuple[int, int]]] = None
+        self._in_flight: set = set()
+        self._fetched: List[Tuple[int, int]] = []
+        self._density = 0.0
+        self._batch = [0, 0]  # rows, blocks
+
+        if self.state is None:
+            self.phase = BACKFILL
+        else:
+            self.forward_from = max(self.state.last_block - reorg_margin(chain) + 1, 0)
+            self._cursor = self.forward_from
+            self.phase = FORWARD
+            self._backfill_end = self.state.oldest_block
+
+    def needs_backfill(self) -> bool:
+        """Whether this sync will fetch history older than what is stored."""
+        return self.covered_from is None or self.since_timestamp < self.covered_from
+
+    @property
+    def lookup_timestamp(self) -> int:
+        """The timestamp to resolve for set_start_block()."""
+        return block_lookup_timestamp(self.since_timestamp)
+
+    def set_start_block(self, block_number: int):
+        """
+        Bound the backfill below by the first block at or after lookup_timestamp.
+
+        Without it the backfill pages back from the newest transfer until a
+        page reaches past since_timestamp, downloading rows outside the window.
+        """
+        self.start_block = block_number
+        self._start_timestamp = self.lookup_timestamp
+
+    def next_requests(self) -> List[Dict[str, Any]]:
+        """
+        tokentx parameters (startblock, endblock, sort) for the next pages.
+
+        The requests of one batch are independent and can be sent
+        concurrently; each response goes back through add_page() before the
+        next call. An empty list means the sync is done (or out of budget).
+        """
+        budget = self.max_pages - self.pages
+        if self.phase == DONE or budget <= 0:
+            return []
+        if self.phase == FORWARD:
+            return [{"startblock": self._cursor, "endblock": LATEST_BLOCK, "sort": "asc"}]
+        if self._unsharded is not None:
+            return self._next_shards(budget)
+        return [{"startblock": self.start_block, "endblock": self._backfill_end, "sort": "desc"}]
+
+    def _next_shards(self, budget: int) -> List[Dict[str, Any]]:
+        rows, blocks = self._batch
+        if blocks:
+            self._density = rows / blocks
+            self._batch = [0, 0]
+        size = max(int(PAGE_SIZE * SHARD_FILL / max(self._density, 1e-9)), 1)
+        shards = []
+        while self._unsharded and len(shards) < min(SHARDS_PER_BATCH, budget):
+            start, end = self._unsharded.pop(0)
+            if end - start + 1 > size:
+                self._unsharded.insert(0, (start, end - size))
+                start = end - size + 1
+            shards.append((start, end))
+        self._in_flight.update(shards)
+        # Newest first within a shard too, so that what a budget cut leaves
+        # unfetched is always below what was fetched
+        return [{"startblock": start, "endblock": end, "sort": "desc"} for start, end in shards]
+
+    def add_page(self, transfers: List[Dict[str, Any]], request: Dict[str, Any]):
+        """Record the transfers returned for one of the requests from next_requests()."""
+        self.pages += 1
+        rows = [row for row in (_row(tx) for tx in transfers) if row is not None]
+        full = len(transfers) >= PAGE_SIZE
+        blocks = [row[2] for row in rows]
+        self._write(rows, request, full and bool(blocks))
+
+        if self.phase == FORWARD:
+            if blocks:
+                self.last_block = max(self.last_block, max(blocks))
+            if full and blocks:
+                # The last block may continue on the next page; start there again
+                self._cursor = max(blocks) if max(blocks) > self._cursor else self._cursor + 1
+            else:
+                self.phase = BACKFILL if self.needs_backfill() else DONE
+            return
+
+        if blocks:
+            if self.last_block is None:
+                self.last_block = max(blocks)
+            self.oldest_block = min(blocks) if self.oldest_block is None else min(self.oldest_block, min(blocks))
+        if self._unsharded is not None:
+            self._add_shard(request["startblock"], request["endblock"], full, blocks)
+            return
+        oldest_seen = min((row[3] for row in rows), default=None)
+        if not full:
+            # Reached start_block (the token's first transfer when it is 0)
+            self._covered(self._start_timestamp)
+        elif oldest_seen is not None and oldest_seen < self.since_timestamp:
+            self._covered(self.since_timestamp)
+        else:
+            lowest = min(blocks) if blocks else self._backfill_end
+            self._backfill_end = lowest if lowest < self._backfill_end else self._backfill_end - 1
+            if self._backfill_end < self.start_block:
+                self._covered(self._start_timestamp)
+            elif self.start_block and blocks:
+                # Bounded window: shard the rest instead of paging down through it.
+                # The page covers the blocks above its lowest, which may continue
+                self._unsharded = [(self.start_block, self._backfill_end)]
+                self._fetched.append((self._backfill_end + 1, request["endblock"]))
+                self._batch = [len(blocks), max(blocks) - self._backfill_end + 1]
+            elif oldest_seen is not None:
+                # Complete above the page's oldest block, which may continue on the next page
+                partial_from = oldest_seen + 1
+                self.covered_from = partial_from if self.covered_from is None else min(self.covered_from, partial_from)
+
+    def _write(self, rows: List[Tuple], request: Dict[str, Any], full: bool):
+        """Store one page's rows as soon as it arrives, so a sync holds one page at a time."""
+        key = (self.chain, self.contract_address)
+        conn = db_cache._get_connection()
+        with conn:
+            if self.phase == FORWARD:
+                # The re-fetched blocks replace what was stored for them (a reorg may
+                # have dropped transfers). A full page covers the blocks below its last
+                # one, which the next page starts from again.
+                through = max(row[2] for row in rows) - 1 if full else LATEST_BLOCK
+                conn.execute(
+                    "DELETE FROM token_transfers WHERE chain = ? AND contract_address = ? "
+                    "AND block_number BETWEEN ? AND ?;",
+                    (*key, request["startblock"], through),
+                )
+            conn.executemany(_UPSERT_TRANSFER_SQL, [(*key, *row) for row in rows])
+        self.row_count += len(rows)
+
+    def _add_shard(self, start: int, end: int, full: bool, blocks: List[int]):
+        self._in_flight.discard((start, end))
+        if not full or not blocks:
+            fetched_from = start
+        else:
+            lowest = min(blocks)
+            if lowest < end:
+                # The lowest block may continue past the page; fetch it again with the rest
+                fetched_from, rest = lowest + 1, lowest
+            else:
+                # One block filled the page; a block range can't reach its other transfers
+                fetched_from, rest = lowest, lowest - 1
+            if rest >= start:
+                self._unsharded.append((start, rest))
+                self._unsharded.sort(reverse=True)
+        self._fetched.append((fetched_from, end))
+        self._batch[0] += len(blocks)
+        self._batch[1] += end - fetched_from + 1
+        if not self._unsharded and not self._in_flight:
+            self._covered(self._start_timestamp)
+
+    def _settle_shards(self):
+        """
+        Coverage of a sharded backfill that ran out of budget.
+
+        Only the blocks fetched contiguously down from the top count: the
+        state moves to the lowest of them, so the next sync backfills from
+        there and fills any gap left below.
+        """
+        low = None
+        for start, end in sorted(self._fetched, reverse=True):
+            if low is not None and end < low - 1:
+                break
+            low = start if low is None else min(low, start)
+        self.oldest_block = low
+        (oldest,) = db_cache._get_connection().execute(
+            "SELECT MIN(time_stamp) FROM token_transfers WHERE chain = ? AND contract_address = ? AND block_number >= ?;",
+            (self.chain, self.contract_address, low),
+        ).fetchone()
+        if oldest is not None:
+            self.covered_from = oldest + 1 if self.covered_from is None else min(self.covered_from, oldest + 1)
+
+    def _covered(self, timestamp: int):
+        self.covered_from = timestamp if self.covered_from is None else min(self.covered_from, timestamp)
+        self.phase = DONE
+
+    def commit(self):
+        """Record the new sync state (the pages are already stored) and prune."""
+        if self.pages == 0:
+            return
+        # The window was built from the same clock (the recording's when replaying a cassette)
+        now = cassette.now()
+        if self.last_block is None:
+            # First sync of a token that has no transfers yet
+            self.last_block = self.oldest_block = 0
+        if self.oldest_block is None:
+            self.oldest_block = self.last_block
+        if self._unsharded is not None and self.phase != DONE:
+            self._settle_shards()
+        if self.covered_from is None:
+            self.covered_from = int(now)
+        retain_seconds = max(int(now) - self.since_timestamp, self.state.retain_seconds if self.state else 0)
+        cutoff = int(now) - max(retain_seconds, int(db_cache.TRANSFER_RETENTION_DAYS * 86400))
+
+        conn = db_cache._get_connection()
+        key = (self.chain, self.contract_address)
+        with conn:
+            pruned = conn.execute(
+                "DELETE FROM token_transfers WHERE chain = ? AND contract_address = ? AND time_stamp < ?;",
+                (*key, cutoff),
+            ).rowcount
+            covered_from = self.covered_from
+            if pruned:
+                covered_from = max(covered_from, cutoff)
+            conn.execute(
+                _UPSERT_STATE_SQL,
+                (*key, self.last_block, self.oldest_block, covered_from, now, retain_seconds),
+            )
+        logger.info(
+            f"Transfer store synced {self.chain}/{self.contract_address}: {self.row_count} rows in "
+            f"{self.pages} pages, last block {self.last_block}"
+        )
+
+
+def evict(conn, max_rows: int) -> int:
+    """
+    Forget whole tokens, least recently synced first, until token_transfers
+    holds at most max_rows rows.
+
+    The most recently synced token is always kept, and tokens being synced
+    (their sync lease is held) are skipped. An evicted token is backfilled
+    again the next time it is asked for.
+
+    Returns:
+        Rows deleted
+    """
+    (total,) = conn.execute("SELECT COUNT(*) FROM token_transfers;").fetchone()
+    if total <= max_rows:
+        return 0
+    tokens = conn.execute(
+        "SELECT chain, contract_address FROM transfer_sync_state ORDER BY synced_at ASC;"
+    ).fetchall()
+    deleted = 0
+    for chain, contract_address in tokens[:-1]:
+        if total - deleted <= max_rows:
+            break
+        lease = sync_lease(contract_address, chain)
+        if not db_cache.acquire_lease(*lease, timeout=0):
+            continue
+        try:
+            with conn:
+                deleted += conn.execute(
+                    "DELETE FROM token_transfers WHERE chain = ? AND contract_address = ?;", (chain, contract_address)
+                ).rowcount
+                conn.execute(
+                    "DELETE FROM transfer_sync_state WHERE chain = ? AND contract_address = ?;", (chain, contract_address)
+                )
+        finally:
+            db_cache.release_lease(*lease)
+        logger.info(f"Transfer store evicted {chain}/{contract_address} to stay under {max_rows} rows")
+    if total - deleted > max_rows:
+        logger.warning(f"Transfer store still holds {total - deleted} rows (cap {max_rows}) after eviction")
+    return deleted
+
+
+def iter_transfer_rows(
+    contract_address: str, chain: str, start_timestamp: int, end_timestamp: int, chunk_rows: Optional[int] = None
+) -> Iterator[List[Tuple]]:
+    """
+    Stored transfers in [start_timestamp, end_timestamp] as chunks of plain
+    tuples, newest first. Analyses read them through etherscan.TransferWindow.
+
+    Yields:
+        Lists of up to chunk_rows (CHUNK_ROWS) (hash, block_number,
+        time_stamp, from, to, value, token_decimal) tuples, the input of
+        transfer_columns.iter_columns()
+    """
+    cursor = db_cache._get_connection().execute(
+        _SELECT_RANGE_SQL, (*_key(contract_address, chain), start_timestamp, end_timestamp)
+    )
+    try:
+        while rows := cursor.fetchmany(chunk_rows or CHUNK_ROWS):
+            yield [
+                (tx_hash, block, ts, from_address, to_address, value, decimals)
+                for tx_hash, _, block, ts, from_address, to_address, value, decimals in rows
+            ]
+    finally:
+        cursor.close()
+
+
+def reset(contract_addresses: Optional[Iterable[Tuple[str, str]]] = None):
+    """Forget stored transfers (for the given (contract_address, chain) pairs, or all), forcing a fresh backfill."""
+    conn = db_cache._get_connection()
+    with conn:
+        if contract_addresses is None:
+            conn.execute("DELETE FROM token_transfers;")
+            conn.execute("DELETE FROM transfer_sync_state;")
+            return
+        for contract_address, chain in contract_addresses:
+            key = _key(contract_address, chain)
+            conn.execute("DELETE FROM token_transfers WHERE chain = ? AND contract_address = ?;", key)
+            conn.execute("DELETE FROM transfer_sync_state WHERE chain = ? AND contract_address = ?;", key)
@@ -0,0 +1,240 @@
+"""
+warm_cache.py - Fill db_cache ahead of dashboard visitors.
+
+Run from src/ralys_analytic, next to dashboard.py, so both share cache.db:
+
+    python warm_cache.py                 # one concurrent pass over every job
+    python warm_cache.py --daemon        # keep refreshing shortly before TTLs expire
+    python warm_cache.py --only kraken   # data types starting with "kraken"
+    python warm_cache.py --list          # show the jobs and exit
+
+A job is one cache row the dashboard reads: Moralis holders/analytics per
+token, CoinMarketCap prices, DefiLlama revenue, the Kraken peer comparison and
+detail views, and the Etherscan whale tracker scan. Each job fetches and
+stores its row through db_cache.refresh(), so concurrent dashboard processes
+see the result immediately and keys cooling down after errors are skipped.
+
+In daemon mode every row is refreshed at REFRESH_AT of its data type's soft
+TTL, minus up to JITTER of the TTL so rows written together drift apart
+instead of hitting the same provider in one burst.
+"""
+
+import time
+import heapq
+import functools
+import random
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from defillama_sdk import DefiLlama
+
+from metric import db_cache
+from metric import holders
+from metric import analytics
+from metric import price
+from metric import revenue
+from metric import etherscan
+from metric import kraken_market
+from metric import projects
+from metric.holders import TOKEN_CONTRACTS
+
+logger = logging.getLogger("warm_cache")
+
+DEFAULT_WORKERS = 8
+
+# Refresh when 90% of the soft TTL has passed, minus up to 5% of it as jitter
+REFRESH_AT = 0.9
+JITTER = 0.05
+MIN_DELAY_SECONDS = 5
+# Retry delay after a failed refresh when the key has no error cool-down
+RETRY_SECONDS = 60
+
+# Kraken candle views offered by the Market Analytics tab (interval -> limit)
+KRAKEN_CANDLE_LIMITS = {"1d": 60, "4h": 120, "1h": 168}
+
+WHALE_MIN_TOKENS = 100000
+WHALE_LIMIT = 50
+WHALE_DAYS = 7
+
+
+class WarmJob(NamedTuple):
+    data_type: str
+    key: str
+    refresh: Callable[[], bool]
+
+
+def _moralis_job(data_type: str, token_name: str, fetch_fn: Callable[[str, str], dict]) -> WarmJob:
+    token_info = TOKEN_CONTRACTS[token_name]
+    contract_address = token_info["address"]
+    chain = token_info.get("chain", "eth")
+    return WarmJob(
+        data_type,
+        token_name,
+        lambda: db_cache.refresh(data_type, token_name, contract_address, chain, lambda: fetch_fn(contract_address, chain)),
+    )
+
+
+def _fetcher_job(fetcher, *args, **kwargs) -> WarmJob:
+    """Job for a @cached provider fetcher, called with the dashboard's arguments."""
+    return WarmJob(fetcher.data_type, fetcher.cache_key(*args, **kwargs), lambda: fetcher.refresh(*args, **kwargs))
+
+
+def build_jobs() -> List[WarmJob]:
+    """Every cache row the dashboard reads on a cold load."""
+    jobs = []
+
+    for token_name in TOKEN_CONTRACTS:
+        jobs.append(_moralis_job("holders", token_name, holders.get_token_holders_data))
+        jobs.append(_moralis_job("analytics", token_name, analytics.get_token_analytics))
+
+    # Project Comparison (load_data)
+    client = DefiLlama()
+    jobs.append(_fetcher_job(price.getCoinMarketCapPricesBatch, projects.BATCH_PRICE_IDS))
+    jobs.append(_fetcher_job(price.getRaylsPrice))
+    for _, display_name, _, _, _, item_type, revenue_override in projects.PROJECT_METADATA:
+        if revenue_override is not None:
+            continue
+        if item_type == "protocol":
+            jobs.append(_fetcher_job(revenue.getRevenueByProtocol, client, display_name))
+        else:
+            jobs.append(_fetcher_job(revenue.getRevenueByChain, client, display_name))
+
+    # Market Analytics: peer comparison, detail view and candles
+    for pair in kraken_market.KRAKEN_PAIRS.values():
+        jobs.append(_fetcher_job(kraken_market.get_ticker, pair))
+        jobs.append(_fetcher_job(kraken_market.get_order_book, pair, count=15))
+        jobs.append(_fetcher_job(kraken_market.get_order_book, pair, count=25))
+        jobs.append(_fetcher_job(kraken_market.get_recent_trades, pair))
+        jobs.append(_fetcher_job(kraken_market.get_spread_history, pair))
+        for interval, limit in KRAKEN_CANDLE_LIMITS.items():
+            jobs.append(_fetcher_job(kraken_market.get_ohlc, pair=pair, interval=interval, limit=limit))
+
+    # Whale Tracker
+    rayls = TOKEN_CONTRACTS["Rayls (RLS)"]
+    jobs.append(_fetcher_job(
+        etherscan.get_whale_tracker_data, rayls["address"], rayls["chain"],
+        min_tokens=WHALE_MIN_TOKENS, limit=WHALE_LIMIT, days=WHALE_DAYS,
+    ))
+
+    return jobs
+
+
+def _run(job: WarmJob) -> bool:
+    try:
+        return job.refresh()
+    except Exception as e:
+        logger.warning(f"Warm-up failed for {job.data_type}/{job.key}: {e}")
+        return False
+
+
+def warm_once(jobs: List[WarmJob], workers: int = DEFAULT_WORKERS) -> int:
+    """
+    Refresh every job concurrently.
+
+    Returns:
+        Number of rows fetched and stored
+    """
+    start = time.perf_counter()
+    stored = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warm") as executor:
+        futures = {executor.submit(_run, job): job for job in jobs}
+        for future in as_completed(futures):
+            stored += bool(future.result())
+    logger.info(f"Warmed {stored}/{len(jobs)} cache rows in {time.perf_counter() - start:.1f}s")
+    return stored
+
+
+def _next_due(job: WarmJob, now: float) -> float:
+    """When the job's row should next be refreshed (epoch seconds)."""
+    status = db_cache.get_cache_status(job.data_type, job.key)
+    if status["retry_at"]:
+        return max(status["retry_at"], now + MIN_DELAY_SECONDS)
+    if not status["fetched_at"]:
+        return now + RETRY_SECONDS
+    soft_seconds = db_cache.get_ttl_policy(job.data_type).soft_seconds
+    fetched_at = datetime.fromisoformat(status["fetched_at"]).timestamp()
+    due = fetched_at + soft_seconds * REFRESH_AT - random.uniform(0, soft_seconds * JITTER)
+    return max(due, now + MIN_DELAY_SECONDS)
+
+
+def _schedule(job: WarmJob, now: float) -> float:
+    """_next_due(), or the default TTL's refresh point if it fails, so a job is never dropped."""
+    try:
+        return _next_due(job, now)
+    except Exception as e:
+        logger.error(f"Could not schedule {job.data_type}/{job.key}, using the default interval: {e}")
+        return now + db_cache.DEFAULT_TTL_POLICY.soft_seconds * REFRESH_AT
+
+
+def run_daemon(jobs: List[WarmJob], workers: int = DEFAULT_WORKERS, stop: Optional[threading.Event] = None):
+    """Warm everything once, then refresh each row shortly before its soft TTL expires."""
+    stop = stop or threading.Event()
+    warm_once(jobs, workers)
+
+    now = time.time()
+    schedule = [(_schedule(job, now), i) for i, job in enumerate(jobs)]
+    heapq.heapify(schedule)
+    schedule_lock = threading.Lock()
+    wake = threading.Event()
+
+    def _reschedule(i, _future):
+        # Runs as a done-callback, where an exception would be swallowed and the job lost
+        due = _schedule(jobs[i], time.time())
+        with schedule_lock:
+            heapq.heappush(schedule, (due, i))
+        wake.set()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warm") as executor:
+        while not stop.is_set():
+            wake.clear()
+            now = time.time()
+            with schedule_lock:
+                due = []
+                while schedule and schedule[0][0] <= now:
+                    due.append(heapq.heappop(schedule)[1])
+                delay = schedule[0][0] - now if schedule else 60
+            for i in due:
+                # A slow job only holds its own worker; it is rescheduled when it finishes
+                executor.submit(_run, jobs[i]).add_done_callback(functools.partial(_reschedule, i))
+            if due:
+                logger.info(f"Refreshing {len(due)} cache rows")
+            wake.wait(min(max(delay, 0), 60))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--daemon", action="store_true", help="keep refreshing rows before their TTL expires")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent fetches")
+    parser.add_argument("--only", help="comma-separated data type prefixes, e.g. holders,kraken")
+    parser.add_argument("--list", action="store_true", help="list the jobs and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    db_cache.initialize_tables()
+    jobs = build_jobs()
+    if args.only:
+        prefixes = tuple(p.strip() for p in args.only.split(",") if p.strip())
+        jobs = [job for job in jobs if job.data_type.startswith(prefixes)]
+
+    if args.list:
+        for job in jobs:
+            print(f"{job.data_type:<32} {job.key}")
+        return
+
+    if args.daemon:
+        db_cache.start_janitor()
+        try:
+            run_daemon(jobs, args.workers)
+        except KeyboardInterrupt:
+            logger.info("Stopping")
+    else:
+        warm_once(jobs, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import bisect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+# The app imports its modules relative to src/ralys_analytic (see dashboard.py)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ralys_analytic"))
+
+from metric import db_cache, etherscan, rate_limit, transfer_store  # noqa: E402
+
+
+@pytest.fixture
+def cache_db(tmp_path, monkeypatch):
+    """db_cache pointed at an empty cache.db in tmp_path, with no in-process state left over."""
+    monkeypatch.setattr(db_cache, "_DB_PATH", str(tmp_path / "cache.db"))
+    db_cache.clear_l1()
+    db_cache._inflight.clear()
+    db_cache._accessed.clear()
+    db_cache._refreshing.clear()
+    db_cache.initialize_tables()
+    yield db_cache
+    db_cache.close_connection()
+    db_cache.clear_l1()
+
+
+@pytest.fixture(scope="session")
+def transfer_rows():
+    """20,000 transfer_store rows over 30 days, newest first: a few hundred addresses (some mixed-case, some exchanges)."""
+    rnd = random.Random(0)
+    addresses = [f"0x{rnd.getrandbits(160):040x}" for _ in range(400)]
+    addresses += [address.upper().replace("0X", "0x") for address in addresses[:20]]
+    addresses += list(etherscan._EXCHANGE_LOOKUP) * 5
+    end, n = 1_760_000_000, 20_000
+    return [
+        (
+            f"0x{rnd.getrandbits(256):064x}", 21_000_000 - i // 4, end - i * 30 * 86400 // n,
+            rnd.choice(addresses), rnd.choice(addresses),
+            # Mostly small amounts, some round whale-sized ones
+            str(rnd.choice((rnd.getrandbits(70), 10**18 * rnd.randint(1, 2_000_000)))), 18,
+        )
+        for i in range(n)
+    ]
+
+
+CONTRACT = "0xabc0000000000000000000000000000000000abc"
+BLOCK_SECONDS = 12
+FIRST_BLOCK = 20_000_000
+SPAN_BLOCKS = 40 * 86400 // BLOCK_SECONDS  # 40 days of blocks
+
+
+class FakeEtherscan:
+    """tokentx and getblocknobytime over an in-memory chain whose head block is 'now'."""
+
+    def __init__(self, transfers_per_day=200, seed=1):
+        self.now = int(time.time())
+        self.head = FIRST_BLOCK + SPAN_BLOCKS
+        self.rng = random.Random(seed)
+        self.addresses = [f"0x{i:040x}" for i in range(40)]
+        self.transfers = [
+            self._transfer(block)
+            for block in sorted(self.rng.choices(range(FIRST_BLOCK, self.head), k=transfers_per_day * 40))
+        ]
+        self.requests = []
+        self.delay = 0.0
+
+    def timestamp(self, block):
+        return self.now - (self.head - block) * BLOCK_SECONDS
+
+    def _transfer(self, block):
+        return {
+            "blockNumber": str(block),
+            "timeStamp": str(self.timestamp(block)),
+            "hash": f"0x{self.rng.getrandbits(128):032x}",
+            "logIndex": str(self.rng.randint(0, 300)),
+            "from": self.rng.choice(self.addresses),
+            "to": self.rng.choice(self.addresses),
+            "value": str(self.rng.randint(1, 10**6) * 10**18),
+            "tokenDecimal": "18",
+        }
+
+    def add(self, block):
+        self.transfers.append(self._transfer(block))
+        self.transfers.sort(key=lambda tx: int(tx["blockNumber"]))
+
+    def in_window(self, start_timestamp):
+        """(hash, log index) of every transfer at or after start_timestamp."""
+        return {(tx["hash"], tx["logIndex"]) for tx in self.transfers if int(tx["timeStamp"]) >= start_timestamp}
+
+    def tokentx_requests(self):
+        return [r for r in self.requests if r["action"] == "tokentx"]
+
+    def respond(self, query):
+        self.requests.append(query)
+        time.sleep(self.delay)
+        if query["module"] == "block":
+            target = int(query["timestamp"])
+            block = self.head - (self.now - target) // BLOCK_SECONDS
+            while self.timestamp(block) < target:
+                block += 1
+            return {"status": "1", "message": "OK", "result": str(block)}
+        blocks = [int(tx["blockNumber"]) for tx in self.transfers]
+        start, end = int(query["startblock"]), int(query["endblock"])
+        rows = self.transfers[bisect.bisect_left(blocks, start):bisect.bisect_right(blocks, end)]
+        rows = (rows[::-1] if query["sort"] == "desc" else rows)[:int(query["offset"])]
+        return {"status": "1", "message": "OK", "result": rows}
+
+
+@pytest.fixture
+def fake_etherscan(cache_db, monkeypatch):
+    fake = FakeEtherscan()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            query = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+            body = json.dumps(fake.respond(query)).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(etherscan, "ETHERSCAN_API_URL", f"http://127.0.0.1:{server.server_address[1]}/api")
+    monkeypatch.setenv("ETHERSCAN_API_KEY", "test-key")
+    monkeypatch.delitem(rate_limit.RATE_LIMITS, "etherscan")
+    monkeypatch.setattr(transfer_store, "PAGE_SIZE", 500)
+    yield fake
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from conftest import CONTRACT
+from metric import cassette, db_cache, etherscan
+
+
+@pytest.fixture
+def cassette_dir(tmp_path):
+    yield str(tmp_path / "cassettes")
+    cassette.configure(mode=cassette.OFF)
+
+
+def _whale_tracker():
+    window = etherscan.TransferWindow.load(CONTRACT, "eth", etherscan.WHALE_TRANSFER_DAYS, max_pages=50)
+    return etherscan._whale_tracker(window, 100000, 50, 7)
+
+
+def _fresh_cache(tmp_path, monkeypatch, name):
+    monkeypatch.setattr(db_cache, "_DB_PATH", str(tmp_path / name))
+    db_cache.clear_l1()
+    db_cache.initialize_tables()
+
+
+def test_whale_tracker_replays_hours_after_it_was_recorded(fake_etherscan, cassette_dir, tmp_path, monkeypatch):
+    cassette.configure(mode=cassette.RECORD, directory=cassette_dir)
+    recorded = _whale_tracker()
+    assert "error" not in recorded and recorded["whale_transfers"]
+    sent = len(fake_etherscan.requests)
+
+    # Replay on a fresh cache, as bench_replay.py does, once the window's hour has long passed
+    _fresh_cache(tmp_path, monkeypatch, "replay.db")
+    cassette.configure(mode=cassette.REPLAY, directory=cassette_dir)
+    real_time = time.time
+    monkeypatch.setattr(time, "time", lambda: real_time() + 5 * 3600)
+
+    assert _whale_tracker() == recorded
+    assert len(fake_etherscan.requests) == sent
+
+
+def test_replay_clock_is_the_recording_start(cassette_dir, monkeypatch):
+    cassette.configure(mode=cassette.RECORD, directory=cassette_dir)
+    recorded_at = cassette.now()
+    assert recorded_at == pytest.approx(time.time(), abs=5)
+
+    real_time = time.time
+    monkeypatch.setattr(time, "time", lambda: real_time() + 86400)
+    # Frozen for the whole recording session, and replayed as is
+    assert cassette.now() == recorded_at
+    cassette.configure(mode=cassette.REPLAY, directory=cassette_dir)
+    assert cassette.now() == recorded_at
+
+    cassette.configure(mode=cassette.OFF)
+    assert cassette.now() == pytest.approx(real_time() + 86400, abs=5)
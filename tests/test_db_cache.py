@@ -0,0 +1,349 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from metric import async_fetch
+from metric import db_cache
+from metric import snapshots
+
+
+def _auto_vacuum(conn):
+    return conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+
+
+@pytest.fixture
+def old_db(tmp_path, monkeypatch):
+    """A cache.db created before auto_vacuum was set, opened through db_cache."""
+    path = str(tmp_path / "old.db")
+    old = sqlite3.connect(path)
+    old.execute("CREATE TABLE legacy (a);")
+    old.commit()
+    old.close()
+    monkeypatch.setattr(db_cache, "_DB_PATH", path)
+    db_cache.initialize_tables()
+    yield path
+    db_cache.close_connection()
+
+
+def test_new_database_uses_incremental_vacuum(cache_db):
+    assert _auto_vacuum(cache_db._get_connection()) == 2
+
+
+def test_old_database_is_switched_by_the_janitor_not_initialize_tables(old_db):
+    conn = db_cache._get_connection()
+    assert _auto_vacuum(conn) == 0
+
+    db_cache.run_janitor()
+    assert _auto_vacuum(conn) == 2
+    assert conn.execute("SELECT COUNT(*) FROM cache_leases;").fetchone()[0] == 0
+
+
+def test_auto_vacuum_switch_is_skipped_while_the_database_is_busy(old_db):
+    conn = db_cache._get_connection()
+    conn.execute("PRAGMA busy_timeout=0;")
+    writer = sqlite3.connect(old_db)
+    writer.execute("BEGIN IMMEDIATE;")
+    writer.execute("INSERT INTO legacy VALUES (1);")
+
+    db_cache._enable_incremental_vacuum(conn)  # must not raise
+    assert _auto_vacuum(conn) == 0
+
+    writer.rollback()
+    writer.close()
+    db_cache._enable_incremental_vacuum(conn)
+    assert _auto_vacuum(conn) == 2
+
+
+def test_auto_vacuum_switch_waits_for_another_process_lease(old_db):
+    conn = db_cache._get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO cache_leases VALUES ('janitor', 'auto_vacuum', 'other-process', 9e99);"
+        )
+    db_cache._enable_incremental_vacuum(conn)
+    assert _auto_vacuum(conn) == 0
+
+
+def _random_payload(size):
+    # Incompressible, so each row's stored size is close to `size`
+    return {"blob": os.urandom(size // 2).hex()}
+
+
+def _store_rows(cache_db, count, size):
+    for i in range(count):
+        assert cache_db.update_cache("holders", f"token-{i}", "0x0", "eth", _random_payload(size))
+        with cache_db._get_connection() as conn:
+            conn.execute(
+                "UPDATE api_cache SET last_accessed_at = ? WHERE token_name = ?;", (1000.0 + i, f"token-{i}")
+            )
+
+
+def test_eviction_removes_least_recently_read_rows_first(cache_db, monkeypatch):
+    _store_rows(cache_db, 10, 4000)
+    conn = cache_db._get_connection()
+    monkeypatch.setattr(cache_db, "MAX_DB_BYTES", cache_db._used_bytes(conn) * 6 // 10)
+
+    result = cache_db.run_janitor()
+
+    left = [row[0] for row in conn.execute("SELECT token_name FROM api_cache ORDER BY last_accessed_at;")]
+    assert result["evicted"] == 10 - len(left)
+    assert left == [f"token-{i}" for i in range(10 - len(left), 10)]
+    assert cache_db._used_bytes(conn) <= cache_db.MAX_DB_BYTES
+
+
+def test_eviction_ignores_history_and_keeps_api_cache_rows(cache_db, monkeypatch):
+    _store_rows(cache_db, 5, 4000)
+    conn = cache_db._get_connection()
+    # Far more history than the cap; none of it is evictable
+    with conn:
+        conn.executemany(
+            "INSERT INTO api_snapshots (data_type, token_name, fetched_at, response_data, codec) "
+            "VALUES ('holders', 'token-0', ?, ?, 'json');",
+            [(time.time(), os.urandom(20000)) for _ in range(100)],
+        )
+    monkeypatch.setattr(cache_db, "MAX_DB_BYTES", cache_db._used_bytes(conn) + 1)
+
+    result = cache_db.run_janitor()
+
+    assert result["evicted"] == 0
+    assert conn.execute("SELECT COUNT(*) FROM api_cache;").fetchone()[0] == 5
+
+
+def test_janitor_prunes_history_past_its_retention(cache_db, monkeypatch):
+    monkeypatch.setattr(cache_db, "SNAPSHOT_RETENTION_DAYS", 30)
+    monkeypatch.setattr(cache_db, "METRIC_RETENTION_DAYS", 365)
+    conn = cache_db._get_connection()
+    now = time.time()
+    ages = [400, 100, 1]  # days
+    with conn:
+        snapshots.append(conn, "holders", [
+            ("Rayls (RLS)", now - age * 86400, b"{}", "json", {"totalHolders": age}) for age in ages
+        ])
+
+    result = cache_db.run_janitor()
+
+    snapshot_ages = [round((now - row[0]) / 86400) for row in conn.execute("SELECT fetched_at FROM api_snapshots;")]
+    metric_values = [row[2] for row in snapshots.query_metrics(conn, "holders", "Rayls (RLS)", ["total_holders"])]
+    assert snapshot_ages == [1]
+    assert metric_values == [100, 1]
+    assert result["pruned"] == 2 + 1
+
+
+def test_zero_retention_keeps_history(cache_db, monkeypatch):
+    monkeypatch.setattr(cache_db, "SNAPSHOT_RETENTION_DAYS", 0)
+    monkeypatch.setattr(cache_db, "METRIC_RETENTION_DAYS", 0)
+    conn = cache_db._get_connection()
+    with conn:
+        snapshots.append(conn, "holders", [("Rayls (RLS)", 0.0, b"{}", "json", {"totalHolders": 1})])
+
+    assert cache_db.run_janitor()["pruned"] == 0
+    assert conn.execute("SELECT COUNT(*) FROM api_snapshots;").fetchone()[0] == 1
+
+
+def test_each_thread_reuses_its_own_connection(cache_db):
+    conn = cache_db._get_connection()
+    assert cache_db._get_connection() is conn
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(cache_db._get_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+    assert conn.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+
+
+def test_connection_is_reopened_when_the_database_path_changes(cache_db, tmp_path, monkeypatch):
+    conn = cache_db._get_connection()
+    monkeypatch.setattr(cache_db, "_DB_PATH", str(tmp_path / "other.db"))
+
+    reopened = cache_db._get_connection()
+
+    assert reopened is not conn
+    assert reopened.execute("PRAGMA database_list;").fetchone()[2].endswith("other.db")
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1;")
+
+
+def _age(cache_db, token_name, seconds):
+    """Backdate a stored row by `seconds` and drop it from L1."""
+    with cache_db._get_connection() as conn:
+        conn.execute("UPDATE api_cache SET fetched_at = ? WHERE token_name = ?;", (cache_db._cutoff(seconds), token_name))
+    cache_db.clear_l1()
+
+
+def _get(cache_db, fetch_fn, **kwargs):
+    return cache_db.get_or_fetch("holders", "RLS", "0x0", "eth", fetch_fn, **kwargs)
+
+
+def _wait_for_refreshes(cache_db, timeout=5):
+    deadline = time.monotonic() + timeout
+    while cache_db._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not cache_db._refreshing
+
+
+def test_fresh_row_is_served_without_fetching(cache_db):
+    cache_db.update_cache("holders", "RLS", "0x0", "eth", {"v": 1})
+    _age(cache_db, "RLS", cache_db.get_ttl_policy("holders").soft_seconds / 2)
+
+    assert _get(cache_db, lambda: pytest.fail("fetched a fresh row")) == {"v": 1}
+    assert cache_db.get_cache_status("holders", "RLS")["state"] == cache_db.CACHE_STATE_FRESH
+
+
+def test_stale_row_is_served_while_it_refreshes_in_the_background(cache_db):
+    policy = cache_db.get_ttl_policy("holders")
+    cache_db.update_cache("holders", "RLS", "0x0", "eth", {"v": 1})
+    _age(cache_db, "RLS", (policy.soft_seconds + policy.hard_seconds) / 2)
+    assert cache_db.get_cache_status("holders", "RLS")["state"] == cache_db.CACHE_STATE_STALE
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        return {"v": 2}
+
+    # Returned at once, although the fetch is still blocked
+    assert _get(cache_db, fetch, stale_while_revalidate=True) == {"v": 1}
+    assert cache_db.get_cache_status("holders", "RLS")["state"] == cache_db.CACHE_STATE_REFRESHING
+    # A second stale read does not queue a second refresh
+    assert _get(cache_db, lambda: pytest.fail("refreshed twice"), stale_while_revalidate=True) == {"v": 1}
+
+    release.set()
+    _wait_for_refreshes(cache_db)
+    assert cache_db.get_cache_status("holders", "RLS")["state"] == cache_db.CACHE_STATE_FRESH
+    assert _get(cache_db, lambda: pytest.fail("fetched a fresh row")) == {"v": 2}
+
+
+@pytest.mark.parametrize("swr, age", [(True, "hard"), (False, "soft")])
+def test_rows_past_the_read_ttl_block_on_a_fetch(cache_db, swr, age):
+    policy = cache_db.get_ttl_policy("holders")
+    cache_db.update_cache("holders", "RLS", "0x0", "eth", {"v": 1})
+    _age(cache_db, "RLS", (policy.hard_seconds if age == "hard" else policy.soft_seconds) + 60)
+    calls = []
+
+    assert _get(cache_db, lambda: calls.append(1) or {"v": 2}, stale_while_revalidate=swr) == {"v": 2}
+    assert calls == [1]
+    assert not cache_db._refreshing
+
+
+def _lease_elsewhere(cache_db, token_name):
+    with cache_db._get_connection() as conn:
+        conn.execute(
+            "INSERT INTO cache_leases VALUES ('holders', ?, 'other-process', ?);", (token_name, time.time() + 60)
+        )
+
+
+def test_concurrent_misses_share_one_fetch(cache_db):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"v": len(calls)}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_get(cache_db, fetch))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [{"v": 1}] * 8
+
+
+def test_miss_waits_for_the_process_holding_the_lease(cache_db, monkeypatch):
+    monkeypatch.setattr(cache_db, "_LEASE_POLL_SECONDS", 0.02)
+    _lease_elsewhere(cache_db, "RLS")
+    # The other process stores its result a little later
+    writer = threading.Timer(0.2, cache_db.update_cache, ("holders", "RLS", "0x0", "eth", {"v": "theirs"}))
+    writer.start()
+
+    assert _get(cache_db, lambda: pytest.fail("fetched while another process held the lease")) == {"v": "theirs"}
+    writer.join()
+
+
+def test_miss_fetches_itself_once_the_lease_wait_times_out(cache_db, monkeypatch):
+    monkeypatch.setattr(cache_db, "_LEASE_POLL_SECONDS", 0.02)
+    monkeypatch.setattr(cache_db, "LEASE_WAIT_SECONDS", 0.1)
+    _lease_elsewhere(cache_db, "RLS")
+
+    assert _get(cache_db, lambda: {"v": "ours"}) == {"v": "ours"}
+    assert cache_db.get_cached_data("holders", "RLS") == {"v": "ours"}
+
+
+def _failure(cache_db, token_name="RLS"):
+    return cache_db._get_connection().execute(
+        "SELECT failure_count, retry_after - failed_at FROM fetch_failures WHERE token_name = ?;", (token_name,)
+    ).fetchone()
+
+
+def _expire_cooldown(cache_db, token_name="RLS"):
+    with cache_db._get_connection() as conn:
+        conn.execute("UPDATE fetch_failures SET retry_after = 0 WHERE token_name = ?;", (token_name,))
+
+
+def test_failed_fetch_is_not_retried_until_its_cool_down_ends(cache_db):
+    assert _get(cache_db, lambda: {"error": "HTTP 429"}) == {"error": "HTTP 429"}
+    assert _failure(cache_db) == (1, cache_db.ERROR_COOLDOWN_BASE_SECONDS)
+
+    assert _get(cache_db, lambda: pytest.fail("retried during the cool-down")) == {"error": "HTTP 429"}
+    status = cache_db.get_cache_status("holders", "RLS")
+    assert status["state"] == cache_db.CACHE_STATE_PROVIDER_DOWN
+    assert status["error"] == "HTTP 429" and status["retry_at"] > time.time()
+
+    _expire_cooldown(cache_db)
+    assert _get(cache_db, lambda: {"v": 1}) == {"v": 1}
+    assert _failure(cache_db) is None
+
+
+def test_cool_down_doubles_per_consecutive_failure_up_to_the_cap(cache_db, monkeypatch):
+    monkeypatch.setattr(cache_db, "ERROR_COOLDOWN_BASE_SECONDS", 30)
+    monkeypatch.setattr(cache_db, "ERROR_COOLDOWN_MAX_SECONDS", 100)
+
+    def fail():
+        raise ConnectionError("down")
+
+    cool_downs = []
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            _get(cache_db, fail)
+        cool_downs.append(_failure(cache_db)[1])
+        _expire_cooldown(cache_db)
+
+    assert cool_downs == pytest.approx([30, 60, 100, 100])
+
+
+def test_failing_key_serves_its_last_good_payload(cache_db):
+    policy = cache_db.get_ttl_policy("holders")
+    cache_db.update_cache("holders", "RLS", "0x0", "eth", {"v": 1})
+    _age(cache_db, "RLS", policy.hard_seconds + 60)
+
+    assert _get(cache_db, lambda: {"error": "HTTP 500"}) == {"v": 1}
+    assert _get(cache_db, lambda: pytest.fail("retried during the cool-down")) == {"v": 1}
+
+
+def test_async_path_keeps_sqlite_off_the_event_loop(cache_db, monkeypatch):
+    connecting = set()
+    get_connection = cache_db._get_connection
+    monkeypatch.setattr(cache_db, "_get_connection", lambda: connecting.add(threading.current_thread()) or get_connection())
+    loop_threads = set()
+
+    def get(result):
+        async def fetch():
+            loop_threads.add(threading.current_thread())
+            return result
+
+        return async_fetch.run(cache_db.get_or_fetch_async("holders", "RLS", "0x0", "eth", fetch))
+
+    assert get({"v": 1}) == {"v": 1}
+    cache_db.clear_l1()
+    assert get(None) == {"v": 1}  # cached on a worker, read back from L2 on a worker
+    _age(cache_db, "RLS", cache_db.get_ttl_policy("holders").hard_seconds + 60)
+    assert get({"error": "HTTP 500"}) == {"v": 1}
+    assert get(None) == {"v": 1}  # cooling down
+
+    assert len(loop_threads) == 1 and connecting
+    assert not connecting & loop_threads
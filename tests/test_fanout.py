@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from metric import db_cache, fanout
+
+PROVIDER = "test-provider"
+
+
+class Gauge:
+    """Counts calls in flight and remembers the peak."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.peak = 0
+
+    def run(self, seconds=0.05):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(seconds)
+        with self.lock:
+            self.current -= 1
+
+
+@pytest.fixture
+def provider():
+    fanout.set_concurrency(PROVIDER, 4)
+    yield PROVIDER
+    fanout.PROVIDER_CONCURRENCY.pop(PROVIDER, None)
+    fanout._semaphores.pop(PROVIDER, None)
+    fanout._executors.pop(PROVIDER, None)
+
+
+def test_results_keep_input_order_within_the_provider_limit(provider):
+    gauge = Gauge()
+
+    def square(x):
+        gauge.run(0.01 * (5 - x % 5))
+        return x * x
+
+    assert fanout.fan_out(square, range(20), provider=provider) == [x * x for x in range(20)]
+    assert gauge.peak == 4
+
+
+def test_nested_fan_out_borrows_free_slots(provider):
+    gauge = Gauge()
+
+    # The outer call holds one slot; the inner one borrows the other three
+    fanout.fan_out(lambda _: fanout.fan_out(lambda _: gauge.run(), range(8), provider=provider), [0], provider=provider)
+
+    assert gauge.peak == 4
+
+
+def test_nested_fan_out_runs_inline_when_no_slot_is_free(provider):
+    gauge = Gauge()
+    threads = []
+    all_started = threading.Barrier(4)
+
+    def outer(_):
+        threads.append(threading.current_thread())
+        all_started.wait(timeout=5)
+        inner = fanout.fan_out(lambda x: (gauge.run(), threading.current_thread())[1], range(3), provider=provider)
+        assert set(inner) == {threading.current_thread()}
+
+    # Four outer items take all four slots, so nothing is left to borrow
+    fanout.fan_out(outer, range(4), provider=provider)
+
+    assert len(set(threads)) == 4
+    assert gauge.peak == 4
+
+
+def test_exceptions_are_re_raised_and_release_their_slots(provider):
+    def fail(x):
+        if x == 3:
+            raise ValueError("boom")
+        return x
+
+    with pytest.raises(ValueError):
+        fanout.fan_out(fail, range(8), provider=provider)
+    # Every slot came back
+    semaphore, _ = fanout._slots(provider)
+    assert all(semaphore.acquire(blocking=False) for _ in range(4))
+    for _ in range(4):
+        semaphore.release()
+
+
+def test_workers_and_their_cache_connections_are_reused_across_calls(provider, cache_db):
+    def connection(_):
+        time.sleep(0.01)
+        return threading.current_thread(), id(db_cache._get_connection())
+
+    first = set(fanout.fan_out(connection, range(8), provider=provider))
+    second = set(fanout.fan_out(connection, range(8), provider=provider))
+
+    assert len(first) == 4
+    assert second <= first
+
+
+def test_fan_outs_without_a_provider_share_one_pool():
+    first = set(fanout.fan_out(lambda _: (time.sleep(0.01), threading.current_thread())[1], range(20)))
+    second = set(fanout.fan_out(lambda _: (time.sleep(0.01), threading.current_thread())[1], range(20)))
+
+    assert len(first | second) <= fanout.MAX_WORKERS
+    assert second & first
@@ -0,0 +1,187 @@
+import pytest
+import requests
+
+from metric import binance_futures, http_client, rate_limit
+
+
+class FakeClock:
+    """Stands in for rate_limit's time module: monotonic() only moves on sleep() or advance()."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fresh buckets and limits, on a clock the test moves by hand."""
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    monkeypatch.setattr(rate_limit, "_buckets", {})
+    monkeypatch.setattr(rate_limit, "RATE_LIMITS", dict(rate_limit.RATE_LIMITS))
+    return clock
+
+
+def _waits(n, provider="test", api_key=None, cost=1):
+    return [rate_limit.reserve(provider, api_key, cost) for _ in range(n)]
+
+
+def test_burst_goes_out_at_once_then_requests_queue_at_the_sustained_rate(clock):
+    rate_limit.set_rate_limit("test", 2, 4)
+
+    assert _waits(4) == [0.0] * 4
+    # Each later reservation queues behind the previous one
+    assert _waits(3) == pytest.approx([0.5, 1.0, 1.5])
+
+
+def test_bucket_refills_at_the_sustained_rate_up_to_its_burst(clock):
+    rate_limit.set_rate_limit("test", 2, 4)
+    _waits(4)
+
+    clock.advance(1)
+    assert _waits(2) == [0.0, 0.0]
+    assert _waits(1) == pytest.approx([0.5])
+
+    clock.advance(3600)
+    assert _waits(4) == [0.0] * 4
+    assert _waits(1) == pytest.approx([0.5])
+
+
+def test_acquire_sleeps_for_the_reserved_wait(clock):
+    rate_limit.set_rate_limit("test", 4, 1)
+    start = clock.now
+    for _ in range(3):
+        rate_limit.acquire("test")
+
+    # One request every 1 / per_second once the burst is spent
+    assert clock.slept == pytest.approx([0.25, 0.25])
+    assert clock.now - start == pytest.approx(0.5)
+
+
+def test_each_api_key_has_its_own_bucket_and_unlimited_providers_never_wait(clock):
+    rate_limit.set_rate_limit("test", 1, 2)
+    _waits(2, api_key="key-a")
+
+    assert _waits(1, api_key="key-a") == pytest.approx([1.0])
+    assert _waits(2, api_key="key-b") == [0.0, 0.0]
+    assert _waits(2) == [0.0, 0.0]  # anonymous
+    assert _waits(100, provider="unlisted") == [0.0] * 100
+    assert _waits(100, provider=None) == [0.0] * 100
+
+
+@pytest.mark.parametrize("limit, weight", [(30, 1), (99, 1), (100, 2), (499, 2), (500, 5), (1000, 5), (1500, 10)])
+def test_klines_weight_grows_with_the_candles_requested(limit, weight):
+    assert binance_futures._klines_weight(limit) == weight
+
+
+class FakeSession:
+    """Answers every request with the same status and headers, and remembers the URLs."""
+
+    def __init__(self, status=200, headers=None, body=b"[]"):
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.urls = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.urls.append(url)
+        response = requests.Response()
+        response.status_code = self.status
+        response.headers.update(self.headers)
+        response._content = self.body
+        return response
+
+
+@pytest.fixture
+def binance(clock, monkeypatch):
+    """Binance requests answered by a FakeSession, against a 1 weight/s bucket of 6."""
+    session = FakeSession()
+    monkeypatch.setattr(http_client, "get_session", lambda host: session)
+    rate_limit.set_rate_limit("binance", 1, 6)
+    return session
+
+
+def test_requests_reserve_their_endpoint_weight(binance, clock):
+    binance_futures.get_klines.__wrapped__(limit=500)
+    binance_futures.get_open_interest.__wrapped__()
+
+    assert [url.rsplit("/", 1)[1] for url in binance.urls] == ["klines", "openInterest"]
+    assert clock.slept == []
+    # 5 + WEIGHTS["openInterest"] took the whole burst
+    assert _waits(1, provider="binance") == pytest.approx([1.0])
+
+
+def test_large_kline_requests_wait_for_their_weight(binance, clock):
+    binance_futures.get_klines.__wrapped__(limit=1500)
+
+    assert clock.slept == pytest.approx([4.0])
+
+
+@pytest.mark.parametrize("status", [429, 418])
+def test_retry_after_empties_and_blocks_the_bucket(clock, status):
+    rate_limit.set_rate_limit("test", 5, 5)
+    rate_limit.observe("test", None, status, {"Retry-After": "7"})
+
+    assert _waits(1) == pytest.approx([7.0])
+    clock.advance(7)
+    # Refilled while blocked, but the reservation above is still owed
+    assert _waits(4) == [0.0] * 4
+
+
+@pytest.mark.parametrize("headers, blocked", [
+    ({"retry-after": "3"}, 3.0),  # plain dicts from async_fetch are matched case-insensitively
+    ({"Retry-After": "9999"}, rate_limit.MAX_RETRY_AFTER_SECONDS),
+    ({"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}, 0.5),
+    ({}, 0.5),
+])
+def test_retry_after_is_capped_and_defaults_to_one_request_interval(clock, headers, blocked):
+    rate_limit.set_rate_limit("test", 2, 4)
+    rate_limit.observe("test", None, 429, headers)
+
+    assert _waits(1) == pytest.approx([blocked])
+
+
+def test_other_statuses_do_not_block(clock):
+    rate_limit.set_rate_limit("test", 2, 4)
+    for status in (200, 404, 500, 503):
+        rate_limit.observe("test", None, status, {"Retry-After": "30"})
+
+    assert _waits(4) == [0.0] * 4
+
+
+def test_binance_used_weight_caps_the_bucket_at_the_weight_left(clock):
+    rate_limit.set_rate_limit("binance", 40, rate_limit.BINANCE_WEIGHT_LIMIT)
+    # Another process on the same IP used most of this minute's weight
+    rate_limit.observe("binance", None, 200, {rate_limit.BINANCE_WEIGHT_HEADER: "2390"})
+
+    assert _waits(10, provider="binance") == [0.0] * 10
+    assert _waits(1, provider="binance") == pytest.approx([1 / 40])
+
+
+def test_binance_used_weight_never_raises_the_bucket(clock):
+    rate_limit.set_rate_limit("binance", 40, rate_limit.BINANCE_WEIGHT_LIMIT)
+    _waits(1, provider="binance", cost=2300)
+    rate_limit.observe("binance", None, 200, {rate_limit.BINANCE_WEIGHT_HEADER.lower(): "0"})
+
+    assert _waits(1, provider="binance", cost=100) == [0.0]
+    assert _waits(1, provider="binance") == pytest.approx([1 / 40])
+
+
+def test_used_weight_header_is_read_from_http_client_responses(binance, clock):
+    rate_limit.set_rate_limit("binance", 1, rate_limit.BINANCE_WEIGHT_LIMIT)
+    binance.headers = {rate_limit.BINANCE_WEIGHT_HEADER: str(rate_limit.BINANCE_WEIGHT_LIMIT - 3)}
+
+    binance_futures.get_open_interest.__wrapped__()
+
+    assert _waits(3, provider="binance") == [0.0] * 3
+    assert _waits(1, provider="binance") == pytest.approx([1.0])
@@ -0,0 +1,204 @@
+import asyncio
+
+import pytest
+
+from metric import resilience
+
+TRANSIENT = (ConnectionError, TimeoutError)
+
+
+class FakeClock:
+    """Stands in for resilience's time module; monotonic() only moves on advance()."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class Provider:
+    """send() that plays back scripted outcomes - an HTTP status, or an exception to raise - repeating the last."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.sent = 0
+
+    def send(self):
+        outcome = self.outcomes[min(self.sent, len(self.outcomes) - 1)]
+        self.sent += 1
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Closed breakers, no backoff sleeps, and a breaker clock the test moves by hand."""
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, "time", clock)
+    monkeypatch.setattr(resilience, "BACKOFF_SECONDS", 0)
+    resilience.reset_breakers()
+    yield clock
+    resilience.reset_breakers()
+
+
+def _call(mode, provider, method="GET", name="test"):
+    """resilience.call() or call_async() on provider.send; the response is the status itself."""
+    if mode == "call":
+        return resilience.call(provider.send, name, method, TRANSIENT, lambda status: status)
+
+    async def send():
+        return provider.send()
+
+    return asyncio.run(resilience.call_async(send, name, method, TRANSIENT, lambda status: status))
+
+
+@pytest.fixture(params=["call", "call_async"])
+def call(request, clock):
+    return lambda provider, **kwargs: _call(request.param, provider, **kwargs)
+
+
+def _trip(call):
+    for _ in range(resilience.FAILURE_THRESHOLD):
+        call(Provider(503), method="POST")
+    assert resilience.get_breaker("test").state == resilience.OPEN
+
+
+def test_transient_statuses_are_retried_until_one_succeeds(call):
+    provider = Provider(502, 503, 200)
+    assert call(provider) == 200
+    assert provider.sent == 3
+    assert resilience.get_breaker("test").failures == 0
+
+
+def test_last_response_is_returned_once_attempts_run_out(call):
+    provider = Provider(503)
+    assert call(provider) == 503
+    assert provider.sent == resilience.MAX_ATTEMPTS
+
+
+@pytest.mark.parametrize("status", [200, 400, 401, 404, 429])
+def test_non_transient_statuses_are_not_retried(call, status):
+    provider = Provider(status, 200)
+    assert call(provider) == status
+    assert provider.sent == 1
+    assert resilience.get_breaker("test").failures == 0
+
+
+def test_transient_errors_are_retried_then_re_raised(call):
+    provider = Provider(ConnectionError("reset"))
+    with pytest.raises(ConnectionError):
+        call(provider)
+    assert provider.sent == resilience.MAX_ATTEMPTS
+    assert resilience.get_breaker("test").failures == resilience.MAX_ATTEMPTS
+
+
+def test_other_errors_are_raised_at_once_and_do_not_count_against_the_provider(call):
+    provider = Provider(ValueError("bad URL"), 200)
+    with pytest.raises(ValueError):
+        call(provider)
+    assert provider.sent == 1
+    assert resilience.get_breaker("test").failures == 0
+
+
+def test_non_idempotent_requests_are_not_retried(call):
+    provider = Provider(503, 200)
+    assert call(provider, method="POST") == 503
+    assert provider.sent == 1
+
+
+def test_open_breaker_fails_fast_without_sending(call, clock):
+    _trip(call)
+    clock.advance(10)
+
+    provider = Provider(200)
+    with pytest.raises(resilience.CircuitOpenError) as raised:
+        call(provider)
+    assert provider.sent == 0
+    assert raised.value.retry_in == pytest.approx(resilience.OPEN_SECONDS - 10)
+    # Other providers are unaffected
+    assert call(provider, name="other") == 200
+
+
+def test_breaker_opens_mid_retry_and_stops_retrying(call):
+    provider = Provider(503)
+    call(provider)  # MAX_ATTEMPTS failures, still under the threshold
+    with pytest.raises(resilience.CircuitOpenError):
+        call(provider)
+    assert provider.sent == resilience.FAILURE_THRESHOLD
+
+
+def test_half_open_trial_closes_the_breaker_after_the_reset_timeout(call, clock):
+    _trip(call)
+    clock.advance(resilience.OPEN_SECONDS)
+
+    provider = Provider(200)
+    assert call(provider) == 200
+    assert provider.sent == 1
+    breaker = resilience.get_breaker("test")
+    assert breaker.state == resilience.CLOSED and breaker.failures == 0
+    assert call(provider) == 200
+
+
+def test_failed_half_open_trial_opens_the_breaker_again(call, clock):
+    _trip(call)
+    clock.advance(resilience.OPEN_SECONDS)
+
+    provider = Provider(503)
+    # The trial fails and the retry is refused by the reopened breaker
+    with pytest.raises(resilience.CircuitOpenError):
+        call(provider)
+    assert provider.sent == 1
+    assert resilience.get_breaker("test").state == resilience.OPEN
+
+    clock.advance(resilience.OPEN_SECONDS - 1)
+    with pytest.raises(resilience.CircuitOpenError):
+        call(Provider(200))
+    clock.advance(1)
+    assert call(Provider(200)) == 200
+
+
+def test_half_open_lets_one_trial_through_at_a_time(clock):
+    breaker = resilience.CircuitBreaker("test", failure_threshold=1, open_seconds=5)
+    breaker.record_failure()
+    clock.advance(5)
+
+    breaker.before_request()
+    assert breaker.state == resilience.HALF_OPEN
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_request()
+    # A trial that says nothing about the provider frees the slot for the next one
+    breaker.release()
+    breaker.before_request()
+
+
+def test_call_and_call_async_behave_the_same(clock):
+    def scenario(mode):
+        resilience.reset_breakers()
+        clock.now = 1000.0
+        outcomes = []
+        for script, method, advance in [
+            ((502, 200), "GET", 0),
+            ((404,), "GET", 0),
+            ((ConnectionError(),), "GET", 0),
+            ((ValueError(),), "GET", 0),
+            ((503,), "POST", 0),
+            ((503,), "GET", 0),
+            ((200,), "GET", 0),
+            ((200,), "GET", resilience.OPEN_SECONDS),
+        ]:
+            clock.advance(advance)
+            provider = Provider(*script)
+            try:
+                result = _call(mode, provider, method=method)
+            except Exception as e:
+                result = type(e).__name__
+            breaker = resilience.get_breaker("test")
+            outcomes.append((result, provider.sent, breaker.state, breaker.failures))
+        return outcomes
+
+    assert scenario("call") == scenario("call_async")
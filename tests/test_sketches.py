@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+from metric import etherscan, transfer_store
+from metric.sketches import HyperLogLog, KLLSketch, hash64
+from metric.transfer_columns import iter_columns
+
+# Three standard errors at the default precision 14 (sketches.py)
+HLL_BOUND = 3 * 1.04 / np.sqrt(2 ** 14)
+KLL_RANK_BOUND = 0.0165
+
+
+def _hll(keys):
+    sketch = HyperLogLog()
+    sketch.add_hashes(hash64(keys))
+    return sketch
+
+
+def _rank_error(values, value, q):
+    return abs(np.mean(values <= value) - q)
+
+
+@pytest.mark.parametrize("n", [5_000, 50_000, 200_000])
+def test_hll_count_is_within_three_standard_errors(n):
+    assert abs(_hll(f"0x{i:040x}" for i in range(n)).count() - n) / n <= HLL_BOUND
+
+
+@pytest.mark.parametrize("n", [0, 1, 10, 100])
+def test_hll_small_counts_are_close_to_exact(n):
+    assert abs(_hll(f"0x{i:040x}" for i in range(n)).count() - n) <= max(1, n * 0.01)
+
+
+def test_hll_merge_is_the_sketch_of_the_union_and_duplicates_are_idempotent():
+    a = [f"0x{i:040x}" for i in range(30_000)]
+    b = [f"0x{i:040x}" for i in range(20_000, 60_000)]
+    union = _hll(a + b)
+
+    merged = _hll(a).merge(_hll(b))
+    np.testing.assert_array_equal(merged.registers, union.registers)
+
+    merged.add_hashes(hash64(a))
+    np.testing.assert_array_equal(merged.registers, union.registers)
+    with pytest.raises(ValueError):
+        merged.merge(HyperLogLog(precision=12))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_kll_quantile_rank_error_is_bounded(seed):
+    values = np.random.default_rng(seed).lognormal(mean=3, sigma=2, size=200_000)
+    sketch = KLLSketch(seed=seed)
+    for chunk in np.array_split(values, 40):
+        sketch.add(chunk)
+
+    assert sketch.n == len(values)
+    for q in [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]:
+        estimate = sketch.quantile(q)
+        assert estimate in values
+        assert _rank_error(values, estimate, q) <= KLL_RANK_BOUND, q
+    # Memory is O(k), not O(n)
+    assert len(sketch) < 4 * sketch.k
+
+
+def test_kll_merged_parts_stay_within_the_bound():
+    values = np.random.default_rng(3).exponential(size=100_000)
+    merged = KLLSketch()
+    for part in np.array_split(values, 30):
+        sketch = KLLSketch()
+        sketch.add(part)
+        merged.merge(sketch)
+
+    assert merged.n == len(values)
+    for q in [0.05, 0.5, 0.95]:
+        assert _rank_error(values, merged.quantile(q), q) <= KLL_RANK_BOUND
+
+
+def test_kll_empty_sketch_has_no_quantile():
+    assert KLLSketch().quantile(0.5) is None
+
+
+def _activity(rows, chunk_rows, sketch, shared=True):
+    aggregator = etherscan.TransferActivity(sketch)
+    chunks = (rows[start:start + chunk_rows] for start in range(0, len(rows), chunk_rows))
+    for chunk in iter_columns(chunks, shared):
+        aggregator.add(chunk)
+    return aggregator.result()
+
+
+def test_sketch_activity_matches_exact_counts_and_bounds_unique_addresses(transfer_rows):
+    exact = _activity(transfer_rows, 3_000, sketch=False)
+    sketched = _activity(transfer_rows, 3_000, sketch=True)
+
+    for field in ["total_transfers", "total_volume", "avg_daily_transfers"]:
+        assert sketched["summary"][field] == exact["summary"][field]
+    total = exact["summary"]["total_unique_addresses"]
+    assert abs(sketched["summary"]["total_unique_addresses"] - total) / total <= HLL_BOUND
+
+    assert len(sketched["daily_stats"]) == len(exact["daily_stats"])
+    for e, s in zip(exact["daily_stats"], sketched["daily_stats"]):
+        assert {k: v for k, v in s.items() if k != "unique_addresses"} == {k: v for k, v in e.items() if k != "unique_addresses"}
+        assert abs(s["unique_addresses"] - e["unique_addresses"]) / e["unique_addresses"] <= HLL_BOUND
+
+    # The sketched cut is near the exact 95th percentile, so most large transfers agree
+    exact_large = {tx["hash"] for tx in exact["large_transfers"]}
+    assert len(exact_large & {tx["hash"] for tx in sketched["large_transfers"]}) >= 0.9 * len(exact_large)
+
+
+def test_sketch_activity_does_not_need_a_shared_address_table(transfer_rows):
+    assert _activity(transfer_rows, 3_000, sketch=True, shared=False) == _activity(transfer_rows, 3_000, sketch=True)
+
+
+def test_window_keeps_no_address_table_when_only_sketches_read_addresses(transfer_rows, monkeypatch):
+    monkeypatch.setattr(
+        transfer_store, "iter_transfer_rows",
+        lambda *args: (transfer_rows[start:start + 200] for start in range(0, len(transfer_rows), 200)),
+    )
+    window = etherscan.TransferWindow("0xabc", "eth", 0, 2_000_000_000, 30)
+    unused = []
+
+    class Recorder:
+        shared_addresses = False
+
+        def add(self, chunk):
+            used = set(chunk.addresses[chunk.from_code]) | set(chunk.addresses[chunk.to_code])
+            unused.append(len(chunk.addresses) - len(used))
+
+        def result(self):
+            return None
+
+    # Each chunk only carries its own addresses
+    window.scan([(etherscan.TransferActivity(sketch=True), None), (Recorder(), None)])
+    assert set(unused) == {0}
+
+    # Exact mode needs one code per address across chunks, so later chunks carry every address so far
+    unused.clear()
+    window.scan([(etherscan.TransferActivity(), None), (Recorder(), None)])
+    assert unused[-1] > 0
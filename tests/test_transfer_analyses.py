@@ -0,0 +1,229 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+import pytest
+
+from metric import etherscan
+from metric.transfer_columns import iter_columns
+
+CHUNK_SIZES = [20_000, 3_000, 777]
+
+
+# Reference: the dict-based analyses etherscan.py ran before TransferColumns
+
+class Transfer(NamedTuple):
+    hash: str
+    from_address: str
+    to_address: str
+    value: float
+    timestamp: int
+    date: str
+
+
+def _parse(rows):
+    return [
+        Transfer(
+            tx_hash, from_address.lower(), to_address.lower(), int(value) / (10 ** decimals),
+            ts, datetime.utcfromtimestamp(ts).strftime("%Y-%m-%d"),
+        )
+        for tx_hash, _, ts, from_address, to_address, value, decimals in rows
+    ]
+
+
+def _transfer_row(tx):
+    return {
+        "hash": tx.hash,
+        "from": tx.from_address,
+        "to": tx.to_address,
+        "value": round(tx.value, 2),
+        "timestamp": datetime.utcfromtimestamp(tx.timestamp).strftime("%Y-%m-%d %H:%M"),
+    }
+
+
+def _largest(rows, limit):
+    rows.sort(key=lambda x: x["value"], reverse=True)
+    return rows[:limit]
+
+
+def reference_activity(transfers):
+    daily_buckets = defaultdict(lambda: {"count": 0, "addresses": set(), "volume": 0.0})
+    for tx in transfers:
+        bucket = daily_buckets[tx.date]
+        bucket["count"] += 1
+        bucket["addresses"].add(tx.from_address)
+        bucket["addresses"].add(tx.to_address)
+        bucket["volume"] += tx.value
+
+    daily_stats = [
+        {
+            "date": date_str,
+            "transfer_count": bucket["count"],
+            "unique_addresses": len(bucket["addresses"]),
+            "total_volume": round(bucket["volume"], 2),
+            "avg_transfer_size": round(bucket["volume"] / bucket["count"], 2),
+        }
+        for date_str, bucket in sorted(daily_buckets.items())
+    ]
+    threshold = np.percentile([tx.value for tx in transfers], 95)
+    all_addresses = set().union(*(b["addresses"] for b in daily_buckets.values()))
+    return {
+        "daily_stats": daily_stats,
+        "large_transfers": _largest([_transfer_row(tx) for tx in transfers if tx.value >= threshold], 50),
+        "summary": {
+            "total_transfers": len(transfers),
+            "total_unique_addresses": len(all_addresses),
+            "total_volume": round(sum(b["volume"] for b in daily_buckets.values()), 2),
+            "avg_daily_transfers": round(len(transfers) / max(len(daily_buckets), 1), 1),
+        },
+    }
+
+
+def reference_whales(transfers, min_tokens, limit):
+    return _largest([_transfer_row(tx) for tx in transfers if tx.value >= min_tokens], limit)
+
+
+def reference_accumulation(transfers):
+    address_flows = defaultdict(lambda: {"total_in": 0.0, "total_out": 0.0})
+    for tx in transfers:
+        if tx.to_address:
+            address_flows[tx.to_address]["total_in"] += tx.value
+        if tx.from_address:
+            address_flows[tx.from_address]["total_out"] += tx.value
+
+    address_list = [
+        {
+            "address": addr,
+            "total_in": round(flows["total_in"], 2),
+            "total_out": round(flows["total_out"], 2),
+            "net_flow": round(flows["total_in"] - flows["total_out"], 2),
+            "total_volume": round(flows["total_in"] + flows["total_out"], 2),
+        }
+        for addr, flows in address_flows.items()
+    ]
+    address_list.sort(key=lambda x: x["total_volume"], reverse=True)
+    top_addresses = address_list[:20]
+
+    counts = {"Accumulating": 0, "Distributing": 0, "Neutral": 0}
+    for addr_data in top_addresses:
+        threshold = addr_data["total_volume"] * 0.05 if addr_data["total_volume"] > 0 else 0
+        if addr_data["net_flow"] > threshold:
+            addr_data["status"] = "Accumulating"
+        elif addr_data["net_flow"] < -threshold:
+            addr_data["status"] = "Distributing"
+        else:
+            addr_data["status"] = "Neutral"
+        counts[addr_data["status"]] += 1
+
+    return {
+        "top_addresses": top_addresses,
+        "accumulating_count": counts["Accumulating"],
+        "distributing_count": counts["Distributing"],
+        "neutral_count": counts["Neutral"],
+        "score": round((counts["Accumulating"] - counts["Distributing"]) / len(top_addresses), 2),
+    }
+
+
+def reference_exchange_flow(transfers):
+    exchange_flows = defaultdict(lambda: {"inflow": 0.0, "outflow": 0.0})
+    daily_flows = defaultdict(lambda: {"inflow": 0.0, "outflow": 0.0})
+    for tx in transfers:
+        to_exchange = etherscan._EXCHANGE_LOOKUP.get(tx.to_address)
+        if to_exchange:
+            exchange_flows[to_exchange]["inflow"] += tx.value
+            daily_flows[tx.date]["inflow"] += tx.value
+        from_exchange = etherscan._EXCHANGE_LOOKUP.get(tx.from_address)
+        if from_exchange:
+            exchange_flows[from_exchange]["outflow"] += tx.value
+            daily_flows[tx.date]["outflow"] += tx.value
+
+    def _flow(flows):
+        return {
+            "inflow": round(flows["inflow"], 2),
+            "outflow": round(flows["outflow"], 2),
+            "net_flow": round(flows["outflow"] - flows["inflow"], 2),
+        }
+
+    total_inflow = sum(f["inflow"] for f in exchange_flows.values())
+    total_outflow = sum(f["outflow"] for f in exchange_flows.values())
+    net_flow = total_outflow - total_inflow
+    return {
+        "exchange_flows": {name: _flow(flows) for name, flows in exchange_flows.items()},
+        "daily_flows": [{"date": date_str, **_flow(flows)} for date_str, flows in sorted(daily_flows.items())],
+        "total_inflow": round(total_inflow, 2),
+        "total_outflow": round(total_outflow, 2),
+        "net_flow": round(net_flow, 2),
+        "signal": "Bullish" if net_flow > 0 else "Bearish" if net_flow < 0 else "Neutral",
+    }
+
+
+def _analyse(aggregator, rows, chunk_rows):
+    chunks = (rows[start:start + chunk_rows] for start in range(0, len(rows), chunk_rows))
+    for chunk in iter_columns(chunks, aggregator.shared_addresses):
+        aggregator.add(chunk)
+    return aggregator.result()
+
+
+@pytest.mark.parametrize("chunk_rows", CHUNK_SIZES)
+def test_transfer_activity_matches_the_row_loop(transfer_rows, chunk_rows):
+    expected = reference_activity(_parse(transfer_rows))
+    assert _analyse(etherscan.TransferActivity(), transfer_rows, chunk_rows) == expected
+
+
+@pytest.mark.parametrize("chunk_rows", CHUNK_SIZES)
+@pytest.mark.parametrize("min_tokens, limit", [(100_000, 50), (1_500_000, 10), (10**9, 50)])
+def test_whale_transfers_match_the_row_loop(transfer_rows, chunk_rows, min_tokens, limit):
+    expected = reference_whales(_parse(transfer_rows), min_tokens, limit)
+    assert _analyse(etherscan.WhaleTransfers(min_tokens, limit), transfer_rows, chunk_rows) == expected
+
+
+@pytest.mark.parametrize("chunk_rows", CHUNK_SIZES)
+def test_accumulation_matches_the_row_loop(transfer_rows, chunk_rows):
+    expected = reference_accumulation(_parse(transfer_rows))
+    assert _analyse(etherscan.WhaleAccumulation(), transfer_rows, chunk_rows) == expected
+
+
+@pytest.mark.parametrize("chunk_rows", CHUNK_SIZES)
+def test_exchange_flow_matches_the_row_loop(transfer_rows, chunk_rows):
+    expected = reference_exchange_flow(_parse(transfer_rows))
+    assert _analyse(etherscan.ExchangeFlow(), transfer_rows, chunk_rows) == expected
+
+
+def test_empty_windows_match_the_row_loop():
+    assert etherscan.TransferActivity().result()["summary"]["total_transfers"] == 0
+    assert etherscan.WhaleTransfers(100_000).result() == []
+    assert etherscan.WhaleAccumulation().result() == {
+        "top_addresses": [], "accumulating_count": 0, "distributing_count": 0, "neutral_count": 0, "score": 0.0,
+    }
+    assert etherscan.ExchangeFlow().result() == {
+        "exchange_flows": {}, "daily_flows": [], "total_inflow": 0, "total_outflow": 0, "net_flow": 0, "signal": "Neutral",
+    }
+
+
+@pytest.mark.parametrize("days", [7, 30])
+def test_whale_tracker_scan_matches_the_separate_analyses(transfer_rows, monkeypatch, days):
+    reads = []
+
+    def iter_transfer_rows(*args):
+        reads.append(args)
+        return (transfer_rows[start:start + 3_000] for start in range(0, len(transfer_rows), 3_000))
+
+    monkeypatch.setattr(etherscan.transfer_store, "iter_transfer_rows", iter_transfer_rows)
+    end = transfer_rows[0][2] + 1
+    window = etherscan.TransferWindow("0xabc", "eth", end - 30 * 86400, end, 30)
+
+    result = etherscan._whale_tracker(window, 100_000, 50, days)
+
+    assert len(reads) == 1
+    recent = _parse([row for row in transfer_rows if row[2] >= end - days * 86400])
+    assert result == {
+        "whale_transfers": reference_whales(_parse(transfer_rows), 100_000, 50),
+        "whale_accumulation": reference_accumulation(recent),
+        "exchange_flow": reference_exchange_flow(recent),
+    }
+
+
+def test_whale_tracker_returns_the_sync_error():
+    window = etherscan.TransferWindow("0xabc", "eth", 0, 1, 30, error={"error": "rate limited"})
+    assert etherscan._whale_tracker(window, 100_000, 50, 7) == {"error": "rate limited"}
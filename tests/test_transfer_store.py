@@ -0,0 +1,183 @@
+import threading
+import time
+
+import pytest
+
+from conftest import CONTRACT, FIRST_BLOCK
+from metric import async_fetch, db_cache, etherscan, transfer_store
+
+def _stored(contract=CONTRACT):
+    rows = db_cache._get_connection().execute(
+        "SELECT tx_hash, log_key FROM token_transfers WHERE chain = 'eth' AND contract_address = ?;",
+        (contract.lower(),),
+    ).fetchall()
+    return set(rows)
+
+
+def _sync(days, max_pages=50):
+    start_timestamp, _ = etherscan._window(days)
+    return etherscan._sync_token_transfers(CONTRACT, "eth", start_timestamp, max_pages), start_timestamp
+
+
+def test_first_sync_backfills_the_window_then_only_new_blocks(fake_etherscan):
+    error, start_timestamp = _sync(7)
+    assert error is None
+    stored = _stored()
+    # The backfill starts at the window's block (resolved to the hour), not before
+    assert fake_etherscan.in_window(start_timestamp) <= stored
+    assert stored <= fake_etherscan.in_window(transfer_store.block_lookup_timestamp(start_timestamp))
+
+    state = transfer_store.get_sync_state(CONTRACT, "eth")
+    fake_etherscan.requests.clear()
+    for block in range(fake_etherscan.head, fake_etherscan.head + 30, 3):
+        fake_etherscan.add(block)
+
+    assert _sync(7)[0] is None
+    (request,) = fake_etherscan.requests
+    assert request["action"] == "tokentx"
+    assert int(request["startblock"]) == state.last_block - transfer_store.reorg_margin("eth") + 1
+    assert fake_etherscan.in_window(start_timestamp) <= _stored()
+
+
+def test_forward_sync_replaces_reorganised_blocks(fake_etherscan):
+    _sync(7)
+    newest = fake_etherscan.transfers.pop()
+    fake_etherscan.add(int(newest["blockNumber"]))
+
+    _sync(7)
+
+    stored = _stored()
+    assert (newest["hash"], newest["logIndex"]) not in stored
+    assert (fake_etherscan.transfers[-1]["hash"], fake_etherscan.transfers[-1]["logIndex"]) in stored
+
+
+def test_long_backfill_is_sharded(fake_etherscan):
+    error, start_timestamp = _sync(30)
+    assert error is None
+    window = fake_etherscan.in_window(start_timestamp)
+    assert len(window) > 5 * transfer_store.PAGE_SIZE
+    assert window <= _stored()
+    # More than one shard per batch, each asking for a block range
+    ranges = [(r["startblock"], r["endblock"]) for r in fake_etherscan.tokentx_requests()]
+    assert len(ranges) == len(set(ranges)) > 2
+
+
+def test_backfill_cut_by_the_page_budget_resumes_on_the_next_sync(fake_etherscan):
+    start_timestamp, _ = etherscan._window(30)
+    for _ in range(20):
+        assert etherscan._sync_token_transfers(CONTRACT, "eth", start_timestamp, max_pages=3) is None
+        if transfer_store.get_sync_state(CONTRACT, "eth").covered_from <= start_timestamp:
+            break
+    else:
+        pytest.fail("backfill never completed")
+    assert fake_etherscan.in_window(start_timestamp) <= _stored()
+
+
+def test_async_sync_stores_the_same_rows(fake_etherscan):
+    start_timestamp, _ = etherscan._window(7)
+    assert async_fetch.run(etherscan._sync_token_transfers_async(CONTRACT, "eth", start_timestamp, 50)) is None
+    assert fake_etherscan.in_window(start_timestamp) <= _stored()
+
+
+def test_concurrent_syncs_of_a_token_take_turns(fake_etherscan):
+    start_timestamp, _ = etherscan._window(30)
+    assert etherscan._sync_token_transfers("0xother", "eth", start_timestamp, 50) is None
+    single = len(fake_etherscan.tokentx_requests())
+    fake_etherscan.requests.clear()
+    fake_etherscan.delay = 0.01
+
+    errors = []
+    threads = [
+        threading.Thread(target=lambda: errors.append(
+            etherscan._sync_token_transfers(CONTRACT, "eth", start_timestamp, 50)
+        ))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == [None, None]
+    # One backfill, then a one-page forward sync - not two backfills
+    assert len(fake_etherscan.tokentx_requests()) == single + 1
+    assert fake_etherscan.in_window(start_timestamp) <= _stored()
+
+
+def test_sync_gives_up_while_another_process_holds_the_lease(fake_etherscan, monkeypatch):
+    monkeypatch.setattr(db_cache, "LEASE_WAIT_SECONDS", 0.3)
+    data_type, key = transfer_store.sync_lease(CONTRACT, "eth")
+    conn = db_cache._get_connection()
+    with conn:
+        conn.execute("INSERT INTO cache_leases VALUES (?, ?, 'other-process', ?);", (data_type, key, time.time() + 60))
+
+    error, _ = _sync(7)
+
+    assert "another sync" in error["error"]
+    assert fake_etherscan.requests == []
+    # The lease is still the other process's
+    assert conn.execute("SELECT owner FROM cache_leases WHERE token_name = ?;", (key,)).fetchone() == ("other-process",)
+
+
+def test_retention_follows_the_longest_requested_window(fake_etherscan, monkeypatch):
+    monkeypatch.setattr(db_cache, "TRANSFER_RETENTION_DAYS", 7)
+    error, start_30 = _sync(30)
+    assert error is None
+    fake_etherscan.requests.clear()
+
+    # A later, shorter window neither prunes the 30 days nor triggers a new backfill
+    assert _sync(7)[0] is None
+    assert _sync(30)[0] is None
+
+    assert len(fake_etherscan.tokentx_requests()) == 2
+    assert fake_etherscan.in_window(start_30) <= _stored()
+    assert transfer_store.get_sync_state(CONTRACT, "eth").covered_from <= start_30
+
+
+def test_rows_past_the_retention_are_pruned(fake_etherscan, monkeypatch):
+    monkeypatch.setattr(db_cache, "TRANSFER_RETENTION_DAYS", 7)
+    _sync(3)
+    conn = db_cache._get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO token_transfers VALUES ('eth', ?, '0xold', '0', ?, ?, '0x1', '0x2', '1', 18);",
+            (CONTRACT.lower(), FIRST_BLOCK, fake_etherscan.now - 20 * 86400),
+        )
+
+    _sync(3)
+
+    assert ("0xold", "0") not in _stored()
+    assert len(_stored()) > 0
+
+
+def _sync_tokens(contracts):
+    start_timestamp, _ = etherscan._window(3)
+    for contract in contracts:
+        assert etherscan._sync_token_transfers(contract, "eth", start_timestamp, 50) is None
+
+
+def test_janitor_evicts_least_recently_synced_tokens_past_the_row_cap(fake_etherscan, monkeypatch):
+    _sync_tokens(["0xa", "0xb", "0xc"])
+    per_token = len(_stored("0xa"))
+    monkeypatch.setattr(db_cache, "TRANSFER_MAX_ROWS", 2 * per_token)
+
+    result = db_cache.run_janitor()
+
+    assert result["transfers_evicted"] == per_token
+    assert _stored("0xa") == set()
+    assert transfer_store.get_sync_state("0xa", "eth") is None
+    assert len(_stored("0xb")) == len(_stored("0xc")) == per_token
+
+
+def test_transfer_eviction_skips_tokens_being_synced_and_keeps_the_newest(fake_etherscan, monkeypatch):
+    _sync_tokens(["0xa", "0xb"])
+    monkeypatch.setattr(db_cache, "TRANSFER_MAX_ROWS", 0)
+    lease = transfer_store.sync_lease("0xa", "eth")
+    assert db_cache.acquire_lease(*lease)
+    try:
+        evicted = transfer_store.evict(db_cache._get_connection(), 0)
+    finally:
+        db_cache.release_lease(*lease)
+
+    assert evicted == 0
+    assert _stored("0xa") and _stored("0xb")